@@ -0,0 +1,355 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides streaming statistics for aggregating the results of many runs without keeping the
+simulators or their trajectories. Each accumulator consumes one value at a time in constant memory and can
+be merged with another accumulator of the same kind, e.g. one filled by a different worker process:
+
+- :class:`Welford`: The running mean and variance (of scalars or arrays) by Welford's algorithm.
+- :class:`QuantileSketch`: Approximate quantiles with a bounded relative error (DDSketch).
+- :class:`Reservoir`: A uniform random sample of a fixed size for bootstrapping.
+
+:class:`RunAggregator` combines them for the summaries of runs returned by :func:`summarize`.
+"""
+import math
+import numpy as np
+from sampling_simulator.utils import utils
+from sampling_simulator.utils.exceptions import ParameterError
+
+
+def summarize(sim):
+    """
+    Return the summary of a finished :class:`.WL_Simulator` or :class:`.EnsembleEXE` run, which includes the
+    RMSE of the final weights (:code:`rmse`), the equilibration times (:code:`equil_time_all`, with one entry
+    for a :class:`.WL_Simulator` and None for replicas that have not been equilibrated), the final weights
+    (:code:`g`) and their errors with respect to :code:`f_true` (:code:`weight_error`).
+    """
+    if hasattr(sim, 'g_vec'):
+        g, equil_time_all = sim.g_vec, list(sim.equil_time_all)
+    else:
+        g, equil_time_all = sim.g, [sim.equil_time]
+    return {
+        'rmse': float(utils.calc_rmse(g, sim.f_true)),
+        'equil_time_all': [None if t is None else int(t) for t in equil_time_all],
+        'g': np.asarray(g, dtype=float).tolist(),
+        'weight_error': (np.asarray(g, dtype=float) - np.asarray(sim.f_true, dtype=float)).tolist(),
+    }
+
+
+class Welford:
+    """
+    The running mean and variance of a stream of scalars or equally shaped arrays (element-wise),
+    updated by Welford's algorithm and merged by the formula of Chan et al.
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # the sum of the squared deviations from the mean
+
+    def add(self, x):
+        """
+        Add a value.
+        """
+        x = np.asarray(x, dtype=float)
+        self.n += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.n
+        self._m2 = self._m2 + delta * (x - self.mean)
+
+    def merge(self, other):
+        """
+        Add the values of another :class:`Welford` object to this one.
+        """
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self._m2 = self._m2 + other._m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        return self
+
+    @property
+    def var(self):
+        """
+        The sample variance (with Bessel's correction), which is NaN for fewer than 2 values.
+        """
+        return self._m2 / (self.n - 1) if self.n > 1 else np.full(np.shape(self.mean), np.nan)[()]
+
+    @property
+    def std(self):
+        """
+        The sample standard deviation.
+        """
+        return np.sqrt(self.var)
+
+    @property
+    def sem(self):
+        """
+        The standard error of the mean.
+        """
+        return self.std / np.sqrt(self.n) if self.n > 0 else np.nan
+
+
+class QuantileSketch:
+    """
+    A DDSketch (Masson et al., Proc. VLDB Endow. 12, 2195 (2019)) estimating quantiles with a relative error
+    of at most :code:`alpha`. Values are counted in buckets whose boundaries grow geometrically by a factor
+    :code:`(1 + alpha) / (1 - alpha)`, so the number of buckets only grows with the logarithm of the range
+    of the magnitudes of the values. Sketches with the same :code:`alpha` are merged by adding the counts.
+
+    Parameters
+    ----------
+    alpha : float
+        The relative accuracy of the quantiles.
+    """
+    def __init__(self, alpha=0.01):
+        if not 0 < alpha < 1:
+            raise ParameterError(f"The parameter 'alpha' should be between 0 and 1, not {alpha}.")
+        self.alpha = alpha
+        self._log_gamma = math.log((1 + alpha) / (1 - alpha))
+        self._positive = {}  # bucket index -> count
+        self._negative = {}  # bucket index of the absolute value -> count
+        self._n_zero = 0
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        """
+        Add a value.
+        """
+        x = float(x)
+        self.n += 1
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        if x == 0:
+            self._n_zero += 1
+        else:
+            store = self._positive if x > 0 else self._negative
+            i = math.ceil(math.log(abs(x)) / self._log_gamma)
+            store[i] = store.get(i, 0) + 1
+
+    def merge(self, other):
+        """
+        Add the values of another :class:`QuantileSketch` object with the same :code:`alpha` to this one.
+        """
+        if other.alpha != self.alpha:
+            raise ParameterError('Only sketches with the same relative accuracy can be merged.')
+        for store, other_store in [(self._positive, other._positive), (self._negative, other._negative)]:
+            for i, count in other_store.items():
+                store[i] = store.get(i, 0) + count
+        self._n_zero += other._n_zero
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _value(self, i):
+        return 2 * math.exp(self._log_gamma * i) / (1 + math.exp(self._log_gamma))
+
+    def quantile(self, q):
+        """
+        Return the estimate of the :code:`q`-quantile (:code:`0 <= q <= 1`), or NaN if no values have been added.
+        """
+        if self.n == 0:
+            return math.nan
+        rank = q * (self.n - 1)
+        count = 0
+        for i in sorted(self._negative, reverse=True):
+            count += self._negative[i]
+            if count > rank:
+                return max(-self._value(i), self.min)
+        count += self._n_zero
+        if count > rank:
+            return 0.0
+        for i in sorted(self._positive):
+            count += self._positive[i]
+            if count > rank:
+                return min(self._value(i), self.max)
+        return self.max
+
+
+class Reservoir:
+    """
+    A uniform random sample of at most :code:`size` values of a stream (Vitter's algorithm R), which can
+    be resampled for bootstrap estimates. Merging two reservoirs draws the number of values kept from
+    each from the hypergeometric distribution, so the result is a uniform sample of the combined stream.
+
+    Parameters
+    ----------
+    size : int
+        The maximum number of values kept.
+    seed : None, int or np.random.SeedSequence
+        The seed of the random number generator.
+    """
+    def __init__(self, size=1000, seed=None):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.samples = []
+        self.n = 0  # the number of values seen
+
+    def add(self, x):
+        """
+        Add a value.
+        """
+        self.n += 1
+        if len(self.samples) < self.size:
+            self.samples.append(x)
+        else:
+            i = self.rng.integers(self.n)
+            if i < self.size:
+                self.samples[i] = x
+
+    def merge(self, other):
+        """
+        Replace the samples by a uniform sample of the values seen by this reservoir and another one.
+        """
+        k = min(self.size, len(self.samples) + len(other.samples))
+        if len(self.samples) + len(other.samples) > k:
+            n_self = self.rng.hypergeometric(self.n, other.n, k)
+            n_self = min(max(n_self, k - len(other.samples)), len(self.samples))
+            keep_self = self.rng.choice(len(self.samples), n_self, replace=False)
+            keep_other = self.rng.choice(len(other.samples), k - n_self, replace=False)
+            self.samples = [self.samples[i] for i in keep_self] + [other.samples[i] for i in keep_other]
+        else:
+            self.samples = self.samples + other.samples
+        self.n += other.n
+        return self
+
+    def bootstrap(self, func=np.mean, n_resamples=1000, ci=0.95):
+        """
+        Return the bootstrap estimate of the confidence interval of a statistic of the stream.
+
+        Parameters
+        ----------
+        func : callable
+            The statistic, which takes an array of values and returns a float.
+        n_resamples : int
+            The number of bootstrap resamples.
+        ci : float
+            The confidence level.
+
+        Returns
+        -------
+        lower : float
+            The lower bound of the confidence interval.
+        upper : float
+            The upper bound of the confidence interval.
+        """
+        samples = np.asarray(self.samples, dtype=float)
+        if len(samples) == 0:
+            return math.nan, math.nan
+        idx = self.rng.integers(len(samples), size=(n_resamples, len(samples)))
+        stats = np.array([func(samples[i]) for i in idx])
+        return tuple(np.quantile(stats, [(1 - ci) / 2, (1 + ci) / 2]))
+
+
+class RunAggregator:
+    """
+    Streaming statistics of the summaries of runs (see :func:`summarize`), including the distributions of the
+    equilibration time (the time for all replicas to be equilibrated) and the final RMSE, and the per-state
+    errors of the final weights. The memory usage is constant in the number of runs.
+
+    Parameters
+    ----------
+    reservoir_size : int
+        The number of values kept for bootstrapping for each metric.
+    alpha : float
+        The relative accuracy of the quantiles.
+    seed : None, int or np.random.SeedSequence
+        The seed of the random number generator of the reservoirs.
+
+    Attributes
+    ----------
+    n_runs : int
+        The number of runs added.
+    n_unequilibrated : int
+        The number of runs with at least one replica that has not been equilibrated, which are excluded
+        from the statistics of the equilibration time.
+    metrics : dict
+        A dictionary mapping :code:`'equil_time'` and :code:`'rmse'` to dictionaries of a :class:`Welford`
+        object (:code:`moments`), a :class:`QuantileSketch` (:code:`sketch`) and a :class:`Reservoir`
+        (:code:`reservoir`).
+    weight_error : Welford
+        The element-wise running statistics of the errors of the final weights of all states.
+    """
+    METRICS = ['equil_time', 'rmse']
+
+    def __init__(self, reservoir_size=1000, alpha=0.01, seed=None):
+        seeds = np.random.SeedSequence(seed).spawn(len(self.METRICS))
+        self.metrics = {
+            name: {'moments': Welford(), 'sketch': QuantileSketch(alpha), 'reservoir': Reservoir(reservoir_size, s)}
+            for name, s in zip(self.METRICS, seeds)
+        }
+        self.weight_error = Welford()
+        self.n_runs = 0
+        self.n_unequilibrated = 0
+
+    def _add_value(self, name, x):
+        for acc in self.metrics[name].values():
+            acc.add(x)
+
+    def add(self, summary):
+        """
+        Add the summary of a run, which is a dictionary returned by :func:`summarize` (or a cached summary
+        of a campaign run), or a finished simulator, which is summarized and can then be discarded.
+        """
+        if not isinstance(summary, dict):
+            summary = summarize(summary)
+        self.n_runs += 1
+        equil_time_all = summary['equil_time_all']
+        if None in equil_time_all:
+            self.n_unequilibrated += 1
+        else:
+            self._add_value('equil_time', max(equil_time_all))
+        self._add_value('rmse', summary['rmse'])
+        if summary.get('weight_error') is not None:
+            self.weight_error.add(summary['weight_error'])
+
+    def merge(self, other):
+        """
+        Add the statistics of another :class:`RunAggregator` object (e.g. from another worker) to this one.
+        """
+        for name in self.METRICS:
+            for key, acc in self.metrics[name].items():
+                acc.merge(other.metrics[name][key])
+        self.weight_error.merge(other.weight_error)
+        self.n_runs += other.n_runs
+        self.n_unequilibrated += other.n_unequilibrated
+        return self
+
+    def bootstrap(self, name, func=np.mean, n_resamples=1000, ci=0.95):
+        """
+        Return the bootstrap confidence interval of a statistic of a metric (see :meth:`Reservoir.bootstrap`).
+        """
+        return self.metrics[name]['reservoir'].bootstrap(func, n_resamples, ci)
+
+    def as_dict(self, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        Return the statistics as a JSON-serializable dictionary.
+        """
+        results = {'n_runs': self.n_runs, 'n_unequilibrated': self.n_unequilibrated}
+        for name, accs in self.metrics.items():
+            moments, sketch = accs['moments'], accs['sketch']
+            results[name] = {
+                'n': moments.n,
+                'mean': float(moments.mean) if moments.n > 0 else None,
+                'std': float(moments.std) if moments.n > 1 else None,
+                'min': sketch.min if sketch.n > 0 else None,
+                'max': sketch.max if sketch.n > 0 else None,
+                'quantiles': {str(q): sketch.quantile(q) for q in quantiles} if sketch.n > 0 else None,
+            }
+        if self.weight_error.n > 0:
+            results['weight_error'] = {
+                'mean': np.asarray(self.weight_error.mean).tolist(),
+                'std': np.asarray(self.weight_error.std).tolist() if self.weight_error.n > 1 else None,
+            }
+        return results
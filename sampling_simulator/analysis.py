@@ -0,0 +1,280 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides an exact analysis of the Markov chain over the alchemical states for fixed
+alchemical weights. With :math:`f = f_{\\text{true}} - g`, a new state :math:`j` is proposed with
+probability :math:`q_j \\propto \\exp(-f_j)` regardless of the current state :math:`i` (see
+:meth:`.WL_Simulator.propose`) and accepted with probability :math:`\\min(1, \\exp(-(f_j - f_i)))`
+(see :meth:`.WL_Simulator.calc_prob_acc`). This is an independence Metropolis-Hastings sampler with the
+proposal :math:`q` and the target :math:`\\pi \\propto q \\exp(-f) \\propto \\exp(-2f)`, which is reversible.
+
+Dense linear algebra is used for small numbers of states. For large numbers of states, a matrix-free
+path exploits the fact that each row of the transition matrix only depends on the rank of :math:`f_i`,
+so a product with the transition matrix takes O(n log n) time, and the eigenvalues are known in closed
+form (Liu, Stat. Comput. 6, 113 (1996)).
+"""
+import numpy as np
+from sampling_simulator.utils.exceptions import ParameterError
+
+DENSE_MAX_STATES = 2000  # the largest number of states analyzed with dense linear algebra by default
+
+
+def _free_energies(f_true, g):
+    f = np.asarray(f_true, dtype=float)
+    if g is not None:
+        f = f - np.asarray(g, dtype=float)
+    return f - f.min()
+
+
+def transition_matrix(f_true, g=None):
+    """
+    Build the transition matrix of the chain for fixed alchemical weights.
+
+    Parameters
+    ----------
+    f_true : np.ndarray
+        The true free energies of all states.
+    g : np.ndarray
+        The alchemical weights of all states. Unbiased sampling is assumed if not specified.
+
+    Returns
+    -------
+    P : np.ndarray
+        The transition matrix, whose element :code:`P[i, j]` is the probability of moving from state
+        :code:`i` to state :code:`j` in one step.
+    """
+    f = _free_energies(f_true, g)
+    q = np.exp(-f)
+    q /= q.sum()
+    P = q[None, :] * np.exp(-np.maximum(f[None, :] - f[:, None], 0))
+    np.fill_diagonal(P, 0)
+    P[np.diag_indices_from(P)] = 1 - P.sum(axis=1)
+    return P
+
+
+def stationary_distribution(f_true, g=None):
+    """
+    Return the stationary distribution of the chain, which is proportional to :math:`\\exp(-2f)`.
+    """
+    f = _free_energies(f_true, g)
+    p = np.exp(-2 * f)
+    return p / p.sum()
+
+
+def _sorted_chain(f_true, g):
+    """
+    Return the free energies sorted in ascending order, the sorting indices, the proposal probabilities,
+    the stationary distribution and the rejection probabilities of all states (in the sorted order).
+    """
+    f = _free_energies(f_true, g)
+    order = np.argsort(f, kind='stable')
+    f = f[order]
+    q = np.exp(-f)
+    q /= q.sum()
+    pi = np.exp(-2 * f)
+    pi /= pi.sum()
+    # The probability of accepting a move from state i: the proposals to states with lower or equal free energies
+    # are always accepted, and those to state j with a higher free energy are accepted with exp(f_i - f_j)
+    ends = np.searchsorted(f, f, side='right')
+    upper = np.concatenate([np.cumsum((q * np.exp(-f))[::-1])[::-1], [0]])[ends]
+    with np.errstate(divide='ignore'):
+        p_move = np.cumsum(q)[ends - 1] + np.exp(f + np.log(upper))
+    p_stay = 1 - p_move + q  # the proposal of the current state is counted as a move above
+    return f, order, q, pi, p_stay
+
+
+def _matvec(f, q, p_stay, x):
+    """
+    Multiply the transition matrix (in the sorted order) with a vector in O(n log n) time given the sorted free
+    energies, where the binary search for the ends of ties dominates the cost.
+    """
+    ends = np.searchsorted(f, f, side='right')
+    lower = np.cumsum(q * x)[ends - 1]
+    upper = np.concatenate([np.cumsum((q * np.exp(-f) * x)[::-1])[::-1], [0]])[ends]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        upper = np.where(upper != 0, np.exp(f + np.log(np.abs(upper))) * np.sign(upper), 0)
+    return lower + upper - q * x + p_stay * x
+
+
+def eigenvalues(f_true, g=None, method='auto'):
+    """
+    Return the eigenvalues of the transition matrix in descending order, the first of which is 1.
+
+    Parameters
+    ----------
+    f_true : np.ndarray
+        The true free energies of all states.
+    g : np.ndarray
+        The alchemical weights of all states.
+    method : str
+        :code:`'dense'` to diagonalize the symmetrized transition matrix, :code:`'matrix_free'` to use
+        the closed form of the eigenvalues, or :code:`'auto'` to use the former for up to
+        :code:`DENSE_MAX_STATES` states.
+    """
+    method = _check_method(method, len(f_true))
+    if method == 'dense':
+        pi = stationary_distribution(f_true, g)
+        P = transition_matrix(f_true, g)
+        d = np.sqrt(pi)
+        S = d[:, None] * P / d[None, :]
+        return np.sort(np.linalg.eigvalsh((S + S.T) / 2))[::-1]
+
+    # With the importance weights w = pi / q sorted in descending order, the eigenvalues
+    # are 1 and sum_{i >= k} (q_i - pi_i / w_k) for k = 1, ..., n - 1 (0-based)
+    f, _, q, pi, _ = _sorted_chain(f_true, g)
+    w = pi / q
+    tail_q = np.cumsum(q[::-1])[::-1]
+    tail_pi = np.cumsum(pi[::-1])[::-1]
+    lam = tail_q[1:] - tail_pi[1:] / w[:-1]
+    return np.concatenate([[1], np.sort(lam)[::-1]])
+
+
+def spectral_gap(f_true, g=None, method='auto'):
+    """
+    Return the spectral gap of the chain and the corresponding relaxation time (in steps). The
+    eigenvalues of an independence sampler are non-negative, so the spectral gap is 1 minus the
+    second largest eigenvalue.
+    """
+    lam = eigenvalues(f_true, g, method)
+    gap = 1 - lam[1] if len(lam) > 1 else 1.0
+    return gap, 1 / gap
+
+
+def mean_first_passage_times(f_true, g=None, target=-1, method='auto', tol=1e-10, maxiter=None):
+    """
+    Return the mean first-passage times (in steps) from all states to the target state.
+
+    Parameters
+    ----------
+    f_true : np.ndarray
+        The true free energies of all states.
+    g : np.ndarray
+        The alchemical weights of all states.
+    target : int
+        The index of the target state, whose mean first-passage time is 0.
+    method : str
+        :code:`'dense'` to solve the linear system directly, :code:`'matrix_free'` to solve the symmetrized
+        system by the conjugate gradient method using O(n log n) matrix-vector products, or :code:`'auto'`.
+    tol : float
+        The relative tolerance of the residual of the conjugate gradient method.
+    maxiter : int
+        The maximum number of iterations of the conjugate gradient method (:code:`10 * n` by default).
+
+    Returns
+    -------
+    mfpt : np.ndarray
+        The mean first-passage times from all states to the target state.
+    """
+    n = len(f_true)
+    target = target % n
+    method = _check_method(method, n)
+    keep = np.arange(n) != target
+    if method == 'dense':
+        P = transition_matrix(f_true, g)
+        mfpt = np.zeros(n)
+        mfpt[keep] = np.linalg.solve(np.eye(n - 1) - P[np.ix_(keep, keep)], np.ones(n - 1))
+        return mfpt
+
+    # (I - P) restricted to the non-target states is symmetric positive definite after the similarity
+    # transformation with D = diag(sqrt(pi)) since the chain is reversible
+    f, order, q, pi, p_stay = _sorted_chain(f_true, g)
+    rank = np.empty(n, dtype=int)
+    rank[order] = np.arange(n)
+    keep_sorted = np.arange(n) != rank[target]
+    d = np.sqrt(pi)
+
+    def matvec(y):
+        x = np.zeros(n)
+        x[keep_sorted] = y / d[keep_sorted]
+        return (y - (d * _matvec(f, q, p_stay, x))[keep_sorted])
+
+    y = _conjugate_gradient(matvec, d[keep_sorted], tol, 10 * n if maxiter is None else maxiter)
+    mfpt_sorted = np.zeros(n)
+    mfpt_sorted[keep_sorted] = y / d[keep_sorted]
+    return mfpt_sorted[rank]
+
+
+def _conjugate_gradient(matvec, b, tol, maxiter):
+    x = np.zeros_like(b)
+    r = b.copy()
+    p = r.copy()
+    rr = r @ r
+    b_norm = np.sqrt(b @ b)
+    for _ in range(maxiter):
+        if np.sqrt(rr) <= tol * b_norm:
+            break
+        Ap = matvec(p)
+        alpha = rr / (p @ Ap)
+        x += alpha * p
+        r -= alpha * Ap
+        rr_new = r @ r
+        p = r + (rr_new / rr) * p
+        rr = rr_new
+    return x
+
+
+def _check_method(method, n):
+    if method == 'auto':
+        return 'dense' if n <= DENSE_MAX_STATES else 'matrix_free'
+    if method not in ['dense', 'matrix_free']:
+        raise ParameterError(f"The method should be 'auto', 'dense' or 'matrix_free', not '{method}'.")
+    return method
+
+
+def analyze(f_true, g=None, method='auto'):
+    """
+    Analyze the chain for fixed alchemical weights.
+
+    Parameters
+    ----------
+    f_true : np.ndarray
+        The true free energies of all states.
+    g : np.ndarray
+        The alchemical weights of all states. Unbiased sampling is assumed if not specified.
+    method : str
+        :code:`'dense'`, :code:`'matrix_free'` or :code:`'auto'` (see :func:`mean_first_passage_times`).
+
+    Returns
+    -------
+    results : dict
+        A dictionary with the stationary distribution (:code:`stationary`), the spectral gap
+        (:code:`spectral_gap`), the relaxation time (:code:`relaxation_time`), the mean first-passage
+        times from the first to the last state (:code:`mfpt_forward`) and back (:code:`mfpt_backward`),
+        and the mean round-trip time between the two end states (:code:`round_trip_time`), all in steps.
+    """
+    gap, t_relax = spectral_gap(f_true, g, method)
+    mfpt_forward = mean_first_passage_times(f_true, g, -1, method)[0]
+    mfpt_backward = mean_first_passage_times(f_true, g, 0, method)[-1]
+    return {
+        'stationary': stationary_distribution(f_true, g),
+        'spectral_gap': gap,
+        'relaxation_time': t_relax,
+        'mfpt_forward': mfpt_forward,
+        'mfpt_backward': mfpt_backward,
+        'round_trip_time': mfpt_forward + mfpt_backward,
+    }
+
+
+def analyze_simulator(sim, method='auto', use_equil=False):
+    """
+    Analyze the chain of a :class:`.WL_Simulator` with its current (or equilibrated) alchemical weights.
+    """
+    g = sim.g_equil if use_equil else sim.g
+    if g is None:
+        raise ParameterError('The alchemical weights of the simulator have not been equilibrated.')
+    return analyze(sim.f_true, g, method)
+
+
+def analyze_replicas(eexe, method='auto', use_equil=False):
+    """
+    Analyze the chain of each replica of an :class:`.EnsembleEXE` simulation over its subrange of states,
+    with its current (or equilibrated) alchemical weights. Returns a list of results of :func:`analyze`.
+    """
+    return [analyze_simulator(sim, method, use_equil) for sim in eexe.simulators]
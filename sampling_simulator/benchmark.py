@@ -0,0 +1,431 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides a benchmark suite measuring how the simulators and their building blocks scale
+with the number of states, the layout of the replicas and the length of the runs. Each case reports
+its throughput, peak memory usage and, for full runs, the time to equilibration. The results can be
+stored as a JSON baseline and compared against later runs to detect regressions. By default, the results
+are compared against the reference baseline of the quick suite shipped in :code:`data/benchmark_baseline.json`,
+whose :code:`meta` entry records the machine it was measured on. Throughputs depend on the machine, so a baseline
+measured on the same machine gives more meaningful comparisons. The suite runs offline from a single command::
+
+    python -m sampling_simulator.benchmark --quick
+    python -m sampling_simulator.benchmark --quick --save baseline.json
+    python -m sampling_simulator.benchmark --quick --baseline baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import contextlib
+import numpy as np
+from sampling_simulator.utils import utils
+from sampling_simulator.wang_landau_algorithm import WL_Simulator, BatchWLSimulator
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.observers import Observer
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'data', 'benchmark_baseline.json')
+
+SUITES = {
+    'default': {
+        'n_states': [10, 100, 1000, 10000],
+        'n_steps': [1000, 10000],
+        'layouts': [(2, 1), (4, 2), (8, 4)],  # (n_sim, s)
+        'eexe_n_states': [20, 100, 1000],
+        'proposals': ['direct', 'sum_tree'],
+        'batch_n_walkers': [100, 1000],
+        'n_calls': 1000,
+        'repeats': 3,
+    },
+    'quick': {
+        'n_states': [10, 100, 1000],
+        'n_steps': [1000],
+        'layouts': [(2, 1), (4, 2)],
+        'eexe_n_states': [20],
+        'proposals': ['direct', 'sum_tree'],
+        'batch_n_walkers': [100],
+        'n_calls': 200,
+        'repeats': 1,
+    },
+}
+
+WL_PARAMS = {
+    'wl_delta': 10,
+    'wl_delta_cutoff': 0.001,
+    'wl_ratio': 0.7,
+    'wl_scale': 0.5,
+    'seed': 0,
+}
+
+# The metrics compared against a baseline, and whether larger values are better
+METRICS = {
+    'steps_per_sec': True,
+    'calls_per_sec': True,
+    'speedup': True,
+    'peak_memory_mb': False,
+}
+
+
+def make_profile(n_states, seed=0):
+    """
+    Generate a reproducible free energy profile of :code:`n_states` states, which is a random walk
+    with unit Gaussian increments, starting from 0.
+    """
+    rng = np.random.default_rng(seed)
+    return np.concatenate([[0], np.cumsum(rng.normal(size=n_states - 1))])
+
+
+class _EquilibrationTimer(Observer):
+    """
+    An observer recording the number of steps each simulator took to equilibrate.
+    """
+    def __init__(self):
+        super().__init__()
+        self.equil_steps = {}
+
+    def on_equilibration(self, sim, step, g_equil):
+        self.equil_steps[sim.label] = step + 1
+
+
+def _measure(func, repeats):
+    """
+    Call :code:`func` :code:`repeats` times and return the shortest wall time, the peak memory usage
+    of an additional traced call (in MB), and the return value of the last timed call.
+    """
+    wall_time = np.inf
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = func()
+        wall_time = min(wall_time, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return wall_time, peak / 1024 ** 2, out
+
+
+def bench_wl_run(n_states, n_steps, proposal, repeats=1):
+    """
+    Benchmark :meth:`.WL_Simulator.run` starting from an unbiased simulator.
+    """
+    f_true = make_profile(n_states)
+    params = dict(WL_PARAMS, n_steps=n_steps, proposal=proposal)
+
+    def func():
+        timer = _EquilibrationTimer()
+        WL_Simulator(dict(params, observers=[timer]), f_true).run()
+        return timer
+
+    wall_time, peak, timer = _measure(func, repeats)
+    equil_time = timer.equil_steps.get(None)
+    return {
+        'wall_time': wall_time,
+        'steps_per_sec': n_steps / wall_time,
+        'peak_memory_mb': peak,
+        'equil_time': equil_time,  # in steps, None if not equilibrated
+        'equil_wall_time': None if equil_time is None else equil_time / n_steps * wall_time,
+    }
+
+
+def bench_batch_run(n_states, n_walkers, n_steps, repeats=1, n_serial=10):
+    """
+    Benchmark :meth:`.BatchWLSimulator.run` against independent :class:`.WL_Simulator` runs, whose wall time
+    is extrapolated from :code:`n_serial` runs. The cutoff of the incrementor is never reached, so all walkers
+    perform all steps. The reported throughputs count the steps of all walkers, and :code:`speedup` is the
+    ratio of the throughput of the batched run to that of the independent runs.
+    """
+    f_true = make_profile(n_states)
+    params = dict(WL_PARAMS, n_steps=n_steps, wl_delta_cutoff=1e-300)
+
+    def func():
+        with contextlib.redirect_stdout(io.StringIO()):
+            BatchWLSimulator(dict(params, n_walkers=n_walkers), f_true).run()
+
+    def func_serial():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for seed in range(n_serial):
+                WL_Simulator(dict(params, seed=seed), f_true).run()
+
+    wall_time, peak, _ = _measure(func, repeats)
+    serial_time = _measure(func_serial, repeats)[0] / n_serial * n_walkers
+    return {
+        'wall_time': wall_time,
+        'steps_per_sec': n_walkers * n_steps / wall_time,
+        'serial_steps_per_sec': n_walkers * n_steps / serial_time,
+        'speedup': serial_time / wall_time,
+        'peak_memory_mb': peak,
+    }
+
+
+def bench_eexe_run(n_states, n_sim, s, n_steps, repeats=1):
+    """
+    Benchmark :meth:`.EnsembleEXE.run` with weight combination, running 5 iterations of
+    :code:`n_steps` steps per replica. The reported throughput counts the steps of all replicas.
+    """
+    f_true = make_profile(n_states)
+    n_iters = 5
+    params = dict(WL_PARAMS, n_steps=n_steps, n_sim=n_sim, s=s, n_iters=n_iters, w_combine=True)
+
+    def func():
+        timer = _EquilibrationTimer()
+        eexe = EnsembleEXE(params, f_true)
+        eexe.attach(timer)
+        with contextlib.redirect_stdout(io.StringIO()):
+            eexe.run()
+        return eexe, timer
+
+    wall_time, peak, (eexe, timer) = _measure(func, repeats)
+    n_steps_total = sum(sim.n_steps_done for sim in eexe.simulators)
+    equil_time = max(timer.equil_steps.values()) if len(timer.equil_steps) == n_sim else None  # the slowest replica
+    return {
+        'wall_time': wall_time,
+        'steps_per_sec': n_steps_total / wall_time,
+        'peak_memory_mb': peak,
+        'equil_time': equil_time,
+        'equil_wall_time': None if equil_time is None else equil_time * n_sim / n_steps_total * wall_time,
+    }
+
+
+def bench_check_flatness(n_states, n_calls, repeats=1):
+    """
+    Benchmark :meth:`.WL_Simulator.check_flatness` on a histogram that is not flat.
+    """
+    sim = WL_Simulator(dict(WL_PARAMS, n_steps=0), make_profile(n_states))
+    sim.hist = np.arange(n_states, dtype=float)
+
+    def func():
+        for _ in range(n_calls):
+            sim.check_flatness()
+
+    wall_time, peak, _ = _measure(func, repeats)
+    return {'wall_time': wall_time, 'calls_per_sec': n_calls / wall_time, 'peak_memory_mb': peak}
+
+
+def bench_free2prob(n_states, n_calls, repeats=1):
+    """
+    Benchmark :func:`.utils.free2prob`.
+    """
+    f = make_profile(n_states)
+
+    def func():
+        for _ in range(n_calls):
+            utils.free2prob(f)
+
+    wall_time, peak, _ = _measure(func, repeats)
+    return {'wall_time': wall_time, 'calls_per_sec': n_calls / wall_time, 'peak_memory_mb': peak}
+
+
+def bench_combine_weights(n_states, n_sim, s, n_calls, repeats=1):
+    """
+    Benchmark :meth:`.EnsembleEXE.combine_weights` with randomly perturbed weights.
+    """
+    f_true = make_profile(n_states)
+    eexe = EnsembleEXE(dict(WL_PARAMS, n_steps=0, n_sim=n_sim, s=s, n_iters=1), f_true)
+    rng = np.random.default_rng(0)
+    for sim in eexe.simulators:
+        sim.g = sim.f_true - sim.f_true[0] + rng.normal(scale=0.1, size=eexe.n_sub)
+    eexe.equil_all = [False] * n_sim
+
+    def func():
+        for _ in range(n_calls):
+            eexe.combine_weights()
+
+    wall_time, peak, _ = _measure(func, repeats)
+    return {'wall_time': wall_time, 'calls_per_sec': n_calls / wall_time, 'peak_memory_mb': peak}
+
+
+def _valid_layouts(n_states, layouts):
+    """
+    Return the layouts :code:`(n_sim, s)` for which each replica samples at least 2 states,
+    with overlapping state ranges.
+    """
+    return [(n_sim, s) for n_sim, s in layouts if s < n_states - s * (n_sim - 1) and n_states - s * (n_sim - 1) >= 2]  # noqa: E501
+
+
+def iter_cases(suite):
+    """
+    Yield the name and benchmark function of each case of a suite.
+
+    Parameters
+    ----------
+    suite : dict
+        A dictionary with the same keys as the entries of :code:`SUITES`.
+    """
+    repeats, n_calls = suite['repeats'], suite['n_calls']
+    for n in suite['n_states']:
+        for n_steps in suite['n_steps']:
+            for proposal in suite['proposals']:
+                yield f'wl_run[n_states={n},n_steps={n_steps},proposal={proposal}]', \
+                    lambda n=n, n_steps=n_steps, proposal=proposal: bench_wl_run(n, n_steps, proposal, repeats)
+        for n_walkers in suite.get('batch_n_walkers', []):
+            for n_steps in suite['n_steps']:
+                yield f'batch_run[n_states={n},n_walkers={n_walkers},n_steps={n_steps}]', \
+                    lambda n=n, n_walkers=n_walkers, n_steps=n_steps: bench_batch_run(n, n_walkers, n_steps, repeats)
+        yield f'check_flatness[n_states={n}]', lambda n=n: bench_check_flatness(n, n_calls, repeats)
+        yield f'free2prob[n_states={n}]', lambda n=n: bench_free2prob(n, n_calls, repeats)
+    for n in suite['eexe_n_states']:
+        for n_sim, s in _valid_layouts(n, suite['layouts']):
+            for n_steps in suite['n_steps']:
+                yield f'eexe_run[n_states={n},n_sim={n_sim},s={s},n_steps={n_steps}]', \
+                    lambda n=n, n_sim=n_sim, s=s, n_steps=n_steps: bench_eexe_run(n, n_sim, s, n_steps, repeats)
+            yield f'combine_weights[n_states={n},n_sim={n_sim},s={s}]', \
+                lambda n=n, n_sim=n_sim, s=s: bench_combine_weights(n, n_sim, s, n_calls, repeats)
+
+
+def run_benchmarks(suite='default', select=None, verbose=False):
+    """
+    Run a benchmark suite.
+
+    Parameters
+    ----------
+    suite : str or dict
+        The name of a suite in :code:`SUITES` or a dictionary with the same keys.
+    select : str
+        If specified, only the cases whose names contain this string are run.
+    verbose : bool
+        Whether to print the results of each case as it finishes.
+
+    Returns
+    -------
+    report : dict
+        A JSON-serializable dictionary with the metadata of the environment (:code:`meta`)
+        and the results of all cases keyed by their names (:code:`results`).
+    """
+    if isinstance(suite, str):
+        suite = SUITES[suite]
+    results = {}
+    for name, func in iter_cases(suite):
+        if select is not None and select not in name:
+            continue
+        results[name] = func()
+        if verbose:
+            print(format_result(name, results[name]))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    return report
+
+
+def format_result(name, result):
+    """
+    Format the result of a benchmark case as a single line.
+    """
+    rate = f"{result['steps_per_sec']:12.0f} steps/s" if 'steps_per_sec' in result else f"{result['calls_per_sec']:12.0f} calls/s"  # noqa: E501
+    line = f"{name:<60s} {rate}  {result['peak_memory_mb']:8.2f} MB"
+    if result.get('speedup') is not None:
+        line += f"  {result['speedup']:.1f}x faster than independent runs"
+    if result.get('equil_time') is not None:
+        line += f"  equilibrated after {result['equil_time']} steps ({result['equil_wall_time']:.3f} s)"
+    return line
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Compare a benchmark report against a baseline report. Cases that are missing from
+    either report are ignored.
+
+    Parameters
+    ----------
+    report : dict
+        The report returned by :func:`run_benchmarks`.
+    baseline : dict
+        A baseline report, e.g. loaded from a JSON file written by :func:`save_report`.
+    tolerance : float
+        The relative change of a metric beyond which it is considered a regression, i.e. a throughput
+        below :code:`(1 - tolerance)` times or a peak memory above :code:`(1 + tolerance)` times the baseline.
+
+    Returns
+    -------
+    regressions : list
+        A list of tuples :code:`(name, metric, baseline_value, value)`, one for each regressed metric.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            continue
+        for metric, larger_is_better in METRICS.items():
+            if metric not in result or metric not in baseline['results'][name]:
+                continue
+            value, ref = result[metric], baseline['results'][name][metric]
+            if (larger_is_better and value < ref * (1 - tolerance)) or (not larger_is_better and value > ref * (1 + tolerance)):  # noqa: E501
+                regressions.append((name, metric, ref, value))
+
+    return regressions
+
+
+def save_report(report, fname):
+    """
+    Save a benchmark report to a JSON file.
+    """
+    with open(fname, 'w') as fh:
+        json.dump(report, fh, indent=2)
+
+
+def load_report(fname):
+    """
+    Load a benchmark report from a JSON file.
+    """
+    with open(fname) as fh:
+        return json.load(fh)
+
+
+def initialize(args):
+    parser = argparse.ArgumentParser(
+        description='Run the benchmark suite of sampling_simulator and optionally compare the results against a baseline.')  # noqa: E501
+    parser.add_argument('-q', '--quick', action='store_true', help='Run the quick suite instead of the default one.')
+    parser.add_argument('-k', '--select', help='Only run the cases whose names contain the given string.')
+    parser.add_argument('-s', '--save', help='The JSON file to which the results are saved.')
+    parser.add_argument('-b', '--baseline', default=BASELINE, help='A JSON file of baseline results to compare against. The default is the reference baseline shipped with the package.')  # noqa: E501
+    parser.add_argument('-n', '--no_compare', action='store_true', help='Do not compare the results against a baseline.')  # noqa: E501
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2, help='The relative tolerance of regressions. The default is 0.2.')  # noqa: E501
+    args_parse = parser.parse_args(args)
+
+    return args_parse
+
+
+def main(args=None):
+    """
+    Run the benchmark suite from the command line. The exit code is 1 if any regression is detected.
+    """
+    args = initialize(args)
+    report = run_benchmarks('quick' if args.quick else 'default', args.select, verbose=True)
+    if args.save is not None:
+        save_report(report, args.save)
+        print(f'\nResults saved to {args.save}.')
+
+    if not args.no_compare:
+        regressions = compare(report, load_report(args.baseline), args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) detected against {args.baseline}:')
+            for name, metric, ref, value in regressions:
+                print(f'  {name}: {metric} changed from {ref:.4g} to {value:.4g}')
+            return 1
+        print(f'\nNo regressions detected against {args.baseline}.')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides a runner of parameter-sweep campaigns, which run :class:`.WL_Simulator` or
+:class:`.EnsembleEXE` simulations for all points of a parameter grid and all given seeds on a pool of
+worker processes. The summary of each run is cached in a directory under a stable hash of the simulator
+type, the parameters, :code:`f_true` and the seed, so re-running a campaign only computes the missing runs.
+A campaign can also be run from the command line given a JSON configuration file::
+
+    sampling_campaign -c campaign.json -d cache -n 4 -o results.json
+
+where the configuration file specifies :code:`simulator` (:code:`'wl'` or :code:`'eexe'`), :code:`f_true`
+(a list or the path of a text file), :code:`grid` (a dictionary mapping each parameter to a value or a list
+of values) and :code:`seeds` (a list of seeds).
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import contextlib
+import multiprocessing as mp
+import numpy as np
+from sampling_simulator.utils.exceptions import ParameterError
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.aggregation import summarize
+from sampling_simulator.results import ResultsStore
+
+SIMULATORS = {
+    'wl': WL_Simulator,
+    'eexe': EnsembleEXE,
+}
+
+# The parameters that do not affect the results of a run and are therefore excluded from its hash
+IGNORED_PARAMS = ['verbose', 'profile', 'n_workers']
+
+# The parameters that are the paths of files written by a run, which are made unique for each run
+PATH_PARAMS = ['record_path', 'checkpoint_file']
+
+
+def _to_builtin(obj):
+    """
+    Convert NumPy scalars and arrays to Python objects for JSON serialization.
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def expand_grid(grid):
+    """
+    Return the list of all parameter dictionaries of a grid. The values of the grid that are lists
+    are scanned, and other values are shared by all points.
+
+    Parameters
+    ----------
+    grid : dict
+        A dictionary mapping each parameter to a value or a list of values.
+
+    Returns
+    -------
+    points : list
+        A list of dictionaries of parameters, in the order of the Cartesian product of the scanned values.
+    """
+    keys = list(grid)
+    values = [grid[key] if isinstance(grid[key], list) else [grid[key]] for key in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+def run_key(simulator, params, f_true, seed):
+    """
+    Return the hash identifying a run, which is the SHA-256 digest of the canonical JSON representation
+    of the simulator type, the parameters (except for :code:`IGNORED_PARAMS`), :code:`f_true` and the seed.
+    """
+    for key, value in params.items():
+        if callable(value):
+            raise ParameterError(f"The parameter '{key}' of a campaign cannot be a callable.")
+    content = {
+        'simulator': simulator,
+        'params': {key: value for key, value in params.items() if key not in IGNORED_PARAMS},
+        'f_true': [float(f) for f in f_true],
+        'seed': seed,
+    }
+    s = json.dumps(content, sort_keys=True, default=_to_builtin)
+    return hashlib.sha256(s.encode()).hexdigest()
+
+
+def run_params(simulator, params, f_true, seed):
+    """
+    Return the parameters of a run including its seed, where the paths of the files written by the run
+    (:code:`PATH_PARAMS`) are suffixed with the first 12 characters of its hash (see :func:`run_key`), so
+    the runs of a campaign never write to the same files.
+    """
+    key = run_key(simulator, params, f_true, seed)[:12]
+    params = dict(params, seed=seed)
+    for name in PATH_PARAMS:
+        if params.get(name) is not None:
+            root, ext = os.path.splitext(params[name])
+            params[name] = f'{root}_{key}{ext}'
+    return params
+
+
+def run_point(simulator, params, f_true, seed, results_dir=None, run_id=None):
+    """
+    Run a single simulation and return its summary (see :func:`.aggregation.summarize`) with the wall time
+    of the run (:code:`wall_time`). The output printed by the simulators is suppressed, and the paths of the
+    files written by the run are made unique (see :func:`run_params`). If :code:`results_dir` is specified,
+    the results of the run are also appended to the :class:`.ResultsStore` in this directory under the ID
+    :code:`run_id`, with the wall time as an additional column.
+    """
+    params = run_params(simulator, params, f_true, seed)
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = SIMULATORS[simulator](params, np.array(f_true, dtype=float))
+        sim.run()
+    summary = summarize(sim)
+    summary['wall_time'] = time.perf_counter() - t0
+    if results_dir is not None:
+        store = ResultsStore(results_dir)
+        if run_id not in store:
+            store.append_simulator(sim, run_id, json.loads(json.dumps(params, default=_to_builtin)), wall_time=summary['wall_time'])  # noqa: E501
+    return summary
+
+
+def _run_task(task):
+    key, simulator, params, f_true, seed, results_dir = task
+    return key, run_point(simulator, params, f_true, seed, results_dir, key)
+
+
+class ResultCache:
+    """
+    A cache of run summaries stored as one JSON file per run in a directory. Files are written to a
+    temporary file and renamed, so an interrupted campaign never leaves a partially written entry.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the cache, which is created if it does not exist.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """
+        Return the cached entry of a run, or None if the run is not cached.
+        """
+        if key not in self:
+            return None
+        with open(self._path(key)) as fh:
+            return json.load(fh)
+
+    def put(self, key, entry):
+        """
+        Store the entry of a run.
+        """
+        tmp = f'{self._path(key)}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(entry, fh, default=_to_builtin)
+        os.replace(tmp, self._path(key))
+
+
+def run_campaign(grid, f_true, seeds, simulator='eexe', cache_dir='campaign_cache', n_workers=1, verbose=False,
+                 results_dir=None):
+    """
+    Run a parameter-sweep campaign, computing only the runs that are not in the cache.
+
+    Parameters
+    ----------
+    grid : dict
+        A dictionary mapping each parameter to a value or a list of values to scan (see :func:`expand_grid`).
+    f_true : list or np.ndarray
+        The true free energies of all states.
+    seeds : list
+        The seeds, each of which is run for every point of the grid.
+    simulator : str
+        :code:`'wl'` for :class:`.WL_Simulator` or :code:`'eexe'` for :class:`.EnsembleEXE`.
+    cache_dir : str
+        The directory of the cache of run summaries.
+    n_workers : int
+        The number of worker processes. The runs are computed serially if :code:`n_workers` is 1.
+    verbose : bool
+        Whether to print the progress.
+    results_dir : str
+        If specified, the results of the computed runs, including their trajectories, are appended by the
+        workers to the :class:`.ResultsStore` in this directory, with the hashes of the runs as their IDs.
+        The cached runs that are not in the store are appended from their summaries, without trajectories.
+
+    Returns
+    -------
+    results : list
+        A list of dictionaries, one for each pair of a point and a seed, with the parameters (:code:`params`),
+        the seed (:code:`seed`), the hash of the run (:code:`key`), whether the summary was read from the cache
+        (:code:`cached`) and the summary (:code:`summary`, see :func:`run_point`).
+    """
+    if simulator not in SIMULATORS:
+        raise ParameterError(f"The simulator should be one of {list(SIMULATORS)}, not '{simulator}'.")
+    points = expand_grid(grid)
+    if n_workers > 1 and any(point.get('n_workers', 1) > 1 for point in points):
+        raise ParameterError("The parameter 'n_workers' of the runs must be 1 if the campaign runs on multiple workers.")  # noqa: E501
+    cache = ResultCache(cache_dir)
+    results, tasks = [], {}
+    for params, seed in itertools.product(points, seeds):
+        key = run_key(simulator, params, f_true, seed)
+        results.append({'params': params, 'seed': seed, 'key': key, 'cached': key in cache})
+        if not results[-1]['cached']:
+            tasks[key] = (key, simulator, params, list(f_true), seed, results_dir)  # duplicate points are run once
+    if verbose:
+        print(f'{len(results)} runs in the campaign, {len(tasks)} of which are not cached.')
+
+    def cache_result(i, key, summary):
+        cache.put(key, {'simulator': simulator, 'params': tasks[key][2], 'seed': tasks[key][4], 'summary': summary})
+        if verbose:
+            print(f'[{i + 1}/{len(tasks)}] Finished run {key[:12]} (RMSE: {summary["rmse"]:.3f} kT)')
+
+    if n_workers > 1 and len(tasks) > 1:
+        with mp.Pool(min(n_workers, len(tasks))) as pool:
+            for i, (key, summary) in enumerate(pool.imap_unordered(_run_task, tasks.values())):
+                cache_result(i, key, summary)
+    else:
+        for i, task in enumerate(tasks.values()):
+            cache_result(i, *_run_task(task))
+
+    for result in results:
+        result['summary'] = cache.get(result['key'])['summary']
+
+    if results_dir is not None:
+        store = ResultsStore(results_dir)
+        for result in results:
+            if result['cached'] and result['key'] not in store:
+                params = run_params(simulator, result['params'], f_true, result['seed'])
+                params = json.loads(json.dumps(params, default=_to_builtin))
+                store.append_summary(result['summary'], result['key'], params, wall_time=result['summary']['wall_time'])  # noqa: E501
+
+    return results
+
+
+def initialize(args):
+    parser = argparse.ArgumentParser(
+        description='Run a parameter-sweep campaign of WL or EEXE simulations, computing only the runs that are not cached.')  # noqa: E501
+    parser.add_argument('-c', '--config', required=True, help='The JSON configuration file of the campaign.')
+    parser.add_argument('-d', '--cache_dir', default='campaign_cache', help='The directory of the cache of run summaries. The default is campaign_cache.')  # noqa: E501
+    parser.add_argument('-n', '--n_workers', type=int, default=1, help='The number of worker processes. The default is 1.')  # noqa: E501
+    parser.add_argument('-o', '--output', help='The JSON file to which the results of all runs are saved.')
+    parser.add_argument('-r', '--results_dir', help='The directory of a results store to which the results of all runs are appended, including the trajectories of the computed runs.')  # noqa: E501
+    args_parse = parser.parse_args(args)
+
+    return args_parse
+
+
+def main(args=None):
+    """
+    Run a campaign from the command line.
+    """
+    args = initialize(args)
+    with open(args.config) as fh:
+        config = json.load(fh)
+    f_true = config['f_true']
+    if isinstance(f_true, str):
+        f_true = np.loadtxt(f_true).tolist()
+    results = run_campaign(
+        config['grid'], f_true, config['seeds'], config.get('simulator', 'eexe'),
+        args.cache_dir, args.n_workers, verbose=True, results_dir=args.results_dir)
+    if args.output is not None:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, default=_to_builtin)
+        print(f'\nResults saved to {args.output}.')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
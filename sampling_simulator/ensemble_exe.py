@@ -10,110 +10,491 @@
 """
 This module provide methods to mock the alchemical sampling in EEXE simulations.
 """
+import json
+from collections import deque
 import numpy as np
 from sampling_simulator.utils import utils
+from sampling_simulator.utils.profiling import ProfileStats
+from sampling_simulator.utils.exceptions import ParameterError
 from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.parallel import ReplicaPool
+from sampling_simulator.observers import readonly
 
 
 class EnsembleEXE(WL_Simulator):
+    # The phases of the replicas are timed by the replicas themselves
+    _profiled_methods = {
+        'run': ('run', None),
+        '_run_replicas': ('run_replicas', None),
+        'combine_weights': ('combine_weights', None),
+        '_save_checkpoint': ('checkpoint', None),
+    }
+
     def __init__(self, params_dict, f_true):
         super().__init__(params_dict, f_true)
         self.params_dict = params_dict
         self.required_args.extend(['n_sim', 'n_iters', 's'])
         self.optional_args['w_combine'] = False
         self.optional_args['hist_correction'] = False
+        self.optional_args['n_workers'] = 1  # the number of worker processes for running the replicas
+        self.optional_args['combine_rule'] = 'mean'  # 'mean' or 'hist' (histogram-weighted average)
+        self.optional_args['scheduler'] = 'sync'  # 'sync' (all replicas per iteration) or 'async' (see run)
+        self.optional_args['exchange_interval'] = None  # the number of steps between replica exchanges (see _run_replicas)  # noqa: E501
         self.check_params_dict()
+        if self.combine_rule not in ['mean', 'hist']:
+            raise ParameterError(f"The parameter 'combine_rule' should be either 'mean' or 'hist', not '{self.combine_rule}'.")  # noqa: E501
+        if self.scheduler not in ['sync', 'async']:
+            raise ParameterError(f"The parameter 'scheduler' should be either 'sync' or 'async', not '{self.scheduler}'.")  # noqa: E501
+        if self.scheduler == 'async' and self.checkpoint_every is not None:
+            raise ParameterError("The parameter 'checkpoint_every' is not supported by the 'async' scheduler.")
+        if self.exchange_interval is not None:
+            if self.scheduler == 'async':
+                raise ParameterError("Replica exchanges are not supported by the 'async' scheduler.")
+            if self.exchange_interval <= 0 or (self.n_steps % self.exchange_interval != 0 and self.exchange_interval % self.n_steps != 0):  # noqa: E501
+                raise ParameterError("The parameter 'exchange_interval' should be a positive divisor or multiple of 'n_steps'.")  # noqa: E501
 
         # Some EEXE-specific parameters
         self.n_sub = self.n_states - self.s * (self.n_sim - 1)
         start_idx = [i * self.s for i in range(self.n_sim)]
         self.state_ranges = [list(np.arange(i, i + self.n_sub)) for i in start_idx]
+
+        # Index arrays describing the overlap between the state ranges, used in weight combination
+        self._sub_idx = np.array(start_idx)[:, None] + np.arange(self.n_sub)  # global indices of the states of each replica  # noqa: E501
+        self._pair_idx = self._sub_idx[:, :-1].ravel()  # global index of the first state of each adjacent pair
+        self._pair_counts = np.bincount(self._pair_idx, minlength=self.n_states - 1)  # number of replicas sampling each pair  # noqa: E501
         self.equil_all = [None] * self.n_sim
-        self.equil_time_all = [None] * self.n_sim
+        self.equil_time_all = [None] * self.n_sim  # the number of steps each replica took to equilibrate
+        self.n_segments = [0] * self.n_sim  # the number of runs of n_steps steps finished by each replica
+        self.iteration = 0  # the number of finished iterations (or combinations in the async mode)
+        self.g_vec = None  # the latest combined profile of alchemical weights
+        self.rmse = None
+        self.n_exchange_sweeps = 0
+        self.exchange_attempts = np.zeros(self.n_sim - 1, dtype=int)  # the number of exchange attempts of each neighboring pair  # noqa: E501
+        self.exchange_swappable = np.zeros(self.n_sim - 1, dtype=int)  # the number of attempts with the states of both replicas in the overlap  # noqa: E501
+        self.exchange_accepted = np.zeros(self.n_sim - 1, dtype=int)
+        self._push_states = False  # whether the states have been changed by exchanges since the last run of the workers  # noqa: E501
 
         # Initialize the simulators
         f_true_sub = [self.f_true[i * self.s:i * self.s + self.n_sub] for i in range(self.n_sim)]
-        self.simulators = [WL_Simulator(self.params_dict, f_true_sub[i]) for i in range(self.n_sim)]
+        self._replica_seeds = self.rng.seed_seq.spawn(self.n_sim)
+        self.simulators = [WL_Simulator(self._replica_params(i), f_true_sub[i]) for i in range(self.n_sim)]
+
+    def _record_fnames(self):
+        # The replicas stream their trajectories to {record_path}_rep{j}_*.npy, and the ensemble records nothing
+        return None, None
+
+    def _replica_params(self, idx):
+        """
+        Return the parameters for the replica of index :code:`idx`. Each replica has its own random
+        stream spawned from the ensemble's seed and streams its trajectories to a separate set of files.
+        With an energy table, each replica reads the columns of its states, starting from frames evenly
+        spaced over the table so that the replicas do not share configurations.
+        """
+        params = dict(self.params_dict)
+        params['seed'] = self._replica_seeds[idx]
+        params['label'] = idx
+        if self._energies is not None:
+            start = (0 if self.energy_columns is None else self.energy_columns[0]) + idx * self.s
+            params['energy_columns'] = [start, start + self.n_sub]
+            params['energy_offset'] = self.energy_offset + idx * self._energies.n_frames // self.n_sim
+        if self.record_path is not None:
+            params['record_path'] = f'{self.record_path}_rep{idx}'
+        if self.exchange_interval is not None and self.exchange_interval < self.n_steps:
+            params['n_steps'] = self.exchange_interval  # each iteration is run as several runs with exchanges in between  # noqa: E501
+        return params
+
+    def attach(self, observer):
+        """
+        Attach an observer (see :mod:`sampling_simulator.observers`) to the EEXE simulation and all replicas.
+        In the parallel mode, the replicas call the step-level hooks of copies of the observer in the worker
+        processes, whose records are merged into the observer when the run finishes (see :meth:`run`).
+        """
+        super().attach(observer)
+        for sim in self.simulators:
+            sim.attach(observer)
 
     def run(self):
-        for i in range(self.n_iters):
-            section_title = f'Iteration {i+1} / {self.n_iters}'
-            if self.verbose:
-                print()
-                print(section_title)
-                print('=' * len(section_title))
-                print('Current alchemical weights:')
-            for j in range(self.n_sim):
-                self.simulators[j].run()
-                self.simulators[j].f_current = self.simulators[j].f_true - self.simulators[j].g
-                if self.verbose:
-                    print(f'  States {j * self.s} to {j * self.s + self.n_sub - 1}: {np.round(self.simulators[j].g, decimals=3).tolist()}')  # noqa: E501
+        """
+        Run the EEXE simulation. With the 'sync' scheduler, all replicas run :code:`n_steps` steps in each
+        of the :code:`n_iters` iterations, after which the weights are combined. With the 'async' scheduler,
+        each replica runs up to :code:`n_iters` segments of :code:`n_steps` steps independently. Whenever
+        a replica finishes a segment, its weights are published, the latest weights of all replicas are
+        combined, and the replica continues with its modified weights (if :code:`w_combine` is True),
+        unless it is equilibrated or has used up its segments, in which case it is retired. A worker
+        process whose replicas are all retired is shut down. The iteration-level hooks of observers are
+        called upon each combination, except for :code:`on_iteration_start`.
+
+        With :code:`n_workers > 1`, the step-level hooks are called on copies of the observers in the worker
+        processes, and the records of the copies are merged into the observers when the workers are shut down
+        at the end of the run (see :meth:`.Observer.merge`), so they are grouped by replica.
+        """
+        if self.equil_all.count(True) == self.n_sim:
+            return  # e.g. restarting from the checkpoint of a finished run
+        pool = ReplicaPool(self.simulators, self.n_workers) if self.n_workers > 1 else None
+        try:
+            if self.scheduler == 'async':
+                self._run_async(pool)
+            else:
+                self._run_iterations(pool)
+        finally:
+            if pool is not None:
+                self.simulators = pool.close()
+                self._merge_observers()
+
+    def _merge_observers(self):
+        """
+        Merge the copies of the observers used by the replicas in the worker processes into the observers of the
+        ensemble, and let the replicas share the observers of the ensemble again, as in the serial mode.
+        """
+        merged = []  # the replicas of a worker share the same copies
+        for sim in self.simulators:
+            for k, obs in enumerate(self.observers[:len(sim.observers)]):
+                copy = sim.observers[k]
+                if copy is not obs and not any(copy is m for m in merged):
+                    obs.merge(copy)
+                    merged.append(copy)
+                sim.observers[k] = obs
+
+    def _run_iterations(self, pool):
+        """
+        Run all iterations, with the replicas run serially or on the given :class:`.ReplicaPool`.
+        """
+        for i in range(self.iteration, self.n_iters):
+            notify = [obs for obs in self.observers if i % obs.iteration_stride == 0]
+            for obs in notify:
+                obs.on_iteration_start(self, i)
+            self._run_replicas(pool, i)
 
             # Update some attributes
-            self.equil_all = [self.simulators[i].equil for i in range(self.n_sim)]
-            self.equil_time_all = [self.simulators[k].equil_time + i * self.n_steps if self.simulators[k].equil is True else None for k in range(self.n_sim)]  # noqa: E501
+            for j in range(self.n_sim):
+                self._update_replica_status(j)
+            notify = [obs for obs in notify if obs.observes('on_iteration_end') or obs.observes('on_combine')]
+            if notify:
+                weights = readonly(np.array([self.simulators[j].g for j in range(self.n_sim)]))
+                for obs in notify:
+                    obs.on_iteration_end(self, i, weights, self.wl_delta_all)
             if self.equil_all.count(True) == self.n_sim:
-                print('\nThe alchemical weights have been equilibrated in all replicas!')
-                for j in range(self.n_sim):
-                    print(f'  Equilibration time of states {j * self.s} to {j * self.s + self.n_sub - 1}: {self.equil_time_all[j]} steps')  # noqa: E501
+                self._report_equilibration()
+                if self.g_vec is None:
+                    # All replicas equilibrated in the first iteration, so there is no previous combination
+                    _, self.g_vec = self.combine_weights()
+                self.iteration = i + 1
                 break
 
-            self.wl_delta_all = [self.simulators[i].wl_delta for i in range(self.n_sim)]
-            if self.verbose:
-                print(f'\nFinal Wang-Landau incrementors: {np.round(self.wl_delta_all, decimals=6).tolist()}')
-
+            weights_modified, self.g_vec = self.combine_weights()
+            for obs in notify:
+                obs.on_combine(self, i, weights, readonly(weights_modified), readonly(self.g_vec))
             if self.w_combine is True:
-                if self.verbose:
-                    print('\nPerforming weight combination ...')
-                weights_modified, g_vec = self.combine_weights()
                 for j in range(self.n_sim):
                     self.simulators[j].g = weights_modified[j]
-                    self.simulators[j].f_current = self.simulators[j].f_true - self.simulators[j].g
-            else:
-                # Calcualte g_vec but do not modify g and f_current
-                _, g_vec = self.combine_weights()
+            # Otherwise, g_vec is calculated but g and f_current are not modified
+
+            self.iteration = i + 1
+            if self.checkpoint_every is not None and self.iteration % self.checkpoint_every == 0:
+                self._save_checkpoint(pool)
+
+        self._finalize(pool)
+
+    def _run_async(self, pool):
+        """
+        Run the replicas with the 'async' scheduler (see :meth:`run`), serially in a round-robin order
+        or on the given :class:`.ReplicaPool` in the order in which the replicas finish their segments.
+        """
+        active = [j for j in range(self.n_sim) if not self.equil_all[j] and self.n_segments[j] < self.n_iters]
+        if pool is None:
+            queue = deque(active)
+            while queue:
+                j = queue.popleft()
+                self.simulators[j].run()
+                if not self._finish_segment(j):
+                    queue.append(j)
+        else:
+            for j in active:
+                pool.submit(j)
+            for j in range(self.n_sim):
+                if j not in active:
+                    pool.retire(j)
+            n_pending = len(active)
+            while n_pending > 0:
+                for j in pool.wait_any():
+                    if self._finish_segment(j):
+                        pool.retire(j)
+                        n_pending -= 1
+                    else:
+                        pool.submit(j, self.simulators[j].g if self.w_combine is True else None)
+
+        if self.equil_all.count(True) == self.n_sim:
+            self._report_equilibration()
+        self._finalize(pool)
+
+    def _finish_segment(self, j):
+        """
+        Publish the weights of replica :code:`j` after it has finished a segment in the 'async' mode, combine
+        the latest weights of all replicas and modify the weights of replica :code:`j` if :code:`w_combine`
+        is True. Return whether the replica should be retired.
+        """
+        self._update_replica_status(j)
+        i = self.iteration
+        notify = [obs for obs in self.observers if i % obs.iteration_stride == 0]
+        notify = [obs for obs in notify if obs.observes('on_iteration_end') or obs.observes('on_combine')]
+        weights_modified, self.g_vec = self.combine_weights()
+        if notify:
+            weights = readonly(np.array([self.simulators[k].g for k in range(self.n_sim)]))
+            for obs in notify:
+                obs.on_iteration_end(self, i, weights, self.wl_delta_all)
+                obs.on_combine(self, i, weights, readonly(weights_modified), readonly(self.g_vec))
+        self.iteration = i + 1
+
+        retire = self.equil_all[j] is True or self.n_segments[j] >= self.n_iters
+        if self.w_combine is True and not retire:
+            self.simulators[j].g = weights_modified[j]
+        return retire
+
+    def _update_replica_status(self, j):
+        """
+        Update the attributes describing replica :code:`j` after it has finished a run of :code:`n_steps` steps.
+        The equilibration time is recorded once, when the replica is first found to be equilibrated.
+        """
+        self.n_segments[j] += 1
+        self.equil_all[j] = self.simulators[j].equil
+        self._record_equil_time(j)
+        self.wl_delta_all = [self.simulators[k].wl_delta for k in range(self.n_sim)]
 
-            if self.verbose:
-                print(f'Current profile of alchemical weieghts after combination: {np.round(g_vec, decimals=3).tolist()}')  # noqa: E501
+    def _record_equil_time(self, j):
+        """
+        Record the equilibration time of replica :code:`j` if it has been equilibrated in its latest run.
+        """
+        sim = self.simulators[j]
+        if sim.equil is True and self.equil_time_all[j] is None:
+            # sim.equil_time is counted from the start of the run in which the replica equilibrated
+            self.equil_time_all[j] = sim.n_steps_done - sim.n_steps + sim.equil_time
 
-        # Calculate RMSE for the whole-range alchemical weights
-        self.rmse = utils.calc_rmse(g_vec, self.f_true)
+    def _report_equilibration(self):
+        print('\nThe alchemical weights have been equilibrated in all replicas!')
+        for j in range(self.n_sim):
+            print(f'  Equilibration time of states {j * self.s} to {j * self.s + self.n_sub - 1}: {self.equil_time_all[j]} steps')  # noqa: E501
+
+    def _finalize(self, pool):
+        """
+        Calculate the RMSE of the whole-range alchemical weights and save the final checkpoint.
+        """
+        self.rmse = utils.calc_rmse(self.g_vec, self.f_true)
         print(f'\nRMSE of the whole-range alchemical weights: {self.rmse:.3f} kT')
+        if self.checkpoint_file is not None:
+            self._save_checkpoint(pool)
+
+    def _run_replicas(self, pool, i):
+        """
+        Run all replicas for iteration :code:`i`, serially or on the given :class:`.ReplicaPool`. If
+        :code:`exchange_interval` is a divisor of :code:`n_steps`, the replicas run :code:`exchange_interval`
+        steps at a time with exchanges in between (see :meth:`attempt_exchanges`). If it is a multiple of
+        :code:`n_steps`, exchanges are attempted after every :code:`exchange_interval // n_steps` iterations.
+        """
+        n_runs = 1 if self.exchange_interval is None else max(self.n_steps // self.exchange_interval, 1)
+        for k in range(n_runs):
+            if pool is None:
+                for j in range(self.n_sim):
+                    self.simulators[j].run()
+            else:
+                pool.run(push_weights=self.w_combine is True and i > 0 and k == 0, push_states=self._push_states)
+                self._push_states = False
+            if self.exchange_interval is None:
+                continue
+            for j in range(self.n_sim):
+                self._record_equil_time(j)
+            if self.exchange_interval < self.n_steps or ((i + 1) * self.n_steps) % self.exchange_interval == 0:
+                self.attempt_exchanges()
+
+    def attempt_exchanges(self):
+        """
+        Attempt to exchange the states of neighboring replicas, alternating between the pairs :code:`(j, j + 1)`
+        with even and odd :code:`j` in successive calls. An exchange is only possible if the state of each
+        replica is in the range of the other, and it is accepted with the probability
+        :math:`\\min(1, \\exp(-\\Delta))`, where :math:`\\Delta` is the change in the sum of the biased
+        free energies :code:`f_current` of the two replicas at their states. All pairs are handled at once.
+
+        Returns
+        -------
+        accepted : np.ndarray
+            The indices :code:`j` of the pairs :code:`(j, j + 1)` whose exchanges were accepted.
+        """
+        left = np.arange(self.n_exchange_sweeps % 2, self.n_sim - 1, 2)
+        self.n_exchange_sweeps += 1
+        right = left + 1
+        start = self._sub_idx[:, 0]
+        local = np.array([sim.state for sim in self.simulators])
+        state = start + local  # the global indices of the states of all replicas
+        self.exchange_attempts[left] += 1
+        swappable = (state[right] < start[left] + self.n_sub) & (state[left] >= start[right])
+        left, right = left[swappable], right[swappable]
+        self.exchange_swappable[left] += 1
+        if len(left) == 0:
+            return left
+
+        # The new local states of the replicas of each pair after an exchange
+        new_left, new_right = state[right] - start[left], state[left] - start[right]
+        f = np.array([self.simulators[j].f_current for j in range(self.n_sim)])
+        delta = f[left, new_left] + f[right, new_right] - f[left, local[left]] - f[right, local[right]]
+        accepted = self.rng.random_array(len(left)) < np.exp(-np.maximum(delta, 0))
+        for j, state_left, state_right in zip(left[accepted], new_left[accepted], new_right[accepted]):
+            self.simulators[j].state = int(state_left)
+            self.simulators[j + 1].state = int(state_right)
+        self.exchange_accepted[left[accepted]] += 1
+        self._push_states = self._push_states or bool(accepted.any())
+
+        return left[accepted]
+
+    def exchange_stats(self):
+        """
+        Return the exchange statistics of all neighboring pairs :code:`(j, j + 1)` as a dictionary of lists
+        of the numbers of attempts (:code:`attempts`), attempts in which both replicas were in the overlap of
+        their ranges (:code:`swappable`) and accepted exchanges (:code:`accepted`), and the acceptance ratios
+        of all attempts (:code:`acceptance_ratio`) and of swappable attempts (:code:`swappable_acceptance_ratio`).
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'attempts': self.exchange_attempts.tolist(),
+                'swappable': self.exchange_swappable.tolist(),
+                'accepted': self.exchange_accepted.tolist(),
+                'acceptance_ratio': (self.exchange_accepted / self.exchange_attempts).tolist(),
+                'swappable_acceptance_ratio': (self.exchange_accepted / self.exchange_swappable).tolist(),
+            }
+
+    def replica_stats(self):
+        """
+        Return the profiling statistics aggregated over all replicas. Profiling must be enabled by
+        the parameter :code:`profile`.
+        """
+        if self.stats is None:
+            raise ParameterError("Profiling is not enabled. Set the parameter 'profile' to True.")
+        stats = ProfileStats()
+        for sim in self.simulators:
+            stats.merge(sim.stats)
+        return stats
+
+    def dump_stats(self, fname=None):
+        """
+        Return the profiling statistics of the EEXE simulation (:code:`ensemble`), aggregated over all replicas
+        (:code:`replicas`) and of each replica (:code:`per_replica`) as a JSON string, which is also written
+        to :code:`fname` if specified. Profiling must be enabled by the parameter :code:`profile`.
+        """
+        stats = {
+            'ensemble': self.stats.as_dict() if self.stats is not None else None,
+            'replicas': self.replica_stats().as_dict(),
+            'per_replica': [sim.stats.as_dict() for sim in self.simulators],
+        }
+        s = json.dumps(stats, indent=2)
+        if fname is not None:
+            with open(fname, 'w') as fh:
+                fh.write(s)
+        return s
+
+    def _save_checkpoint(self, pool):
+        """
+        Save a checkpoint to :code:`checkpoint_file`, fetching the replicas from the workers in the parallel mode.
+        """
+        if self.checkpoint_file is None:
+            raise ParameterError("The parameter 'checkpoint_file' must be specified if 'checkpoint_every' is specified.")  # noqa: E501
+        if pool is not None:
+            self.simulators = pool.fetch()
+        self.save_checkpoint(self.checkpoint_file)
+
+    def _get_checkpoint_state(self, prefix=''):
+        meta, arrays = super()._get_checkpoint_state(prefix)
+        meta['iteration'] = self.iteration
+        meta['equil_all'] = self.equil_all
+        meta['equil_time_all'] = self.equil_time_all
+        meta['n_segments'] = self.n_segments
+        meta['n_exchange_sweeps'] = self.n_exchange_sweeps
+        meta['exchanges'] = [self.exchange_attempts.tolist(), self.exchange_swappable.tolist(), self.exchange_accepted.tolist()]  # noqa: E501
+        meta['rmse'] = self.rmse
+        meta['replicas'] = []
+        for j in range(self.n_sim):
+            meta_j, arrays_j = self.simulators[j]._get_checkpoint_state(f'{prefix}rep{j}.')
+            meta['replicas'].append(meta_j)
+            arrays.update(arrays_j)
+        if self.g_vec is not None:
+            arrays[f'{prefix}g_vec'] = self.g_vec
+
+        return meta, arrays
+
+    def _set_checkpoint_state(self, meta, arrays, prefix=''):
+        super()._set_checkpoint_state(meta, arrays, prefix)
+        for attr in ['iteration', 'equil_all', 'equil_time_all', 'rmse']:
+            setattr(self, attr, meta[attr])
+        self.n_segments = meta.get('n_segments', [self.iteration] * self.n_sim)
+        self.n_exchange_sweeps = meta.get('n_exchange_sweeps', 0)
+        if 'exchanges' in meta:
+            self.exchange_attempts, self.exchange_swappable, self.exchange_accepted = [np.array(x, dtype=int) for x in meta['exchanges']]  # noqa: E501
+        for j in range(self.n_sim):
+            self.simulators[j]._set_checkpoint_state(meta['replicas'][j], arrays, f'{prefix}rep{j}.')
+        self.g_vec = np.array(arrays[f'{prefix}g_vec']) if f'{prefix}g_vec' in arrays else None
+
+    def plot_replicas(self, var='dg', fname=None, n_buckets=1000):
+        """
+        Plot the recorded timeseries of all replicas in a grid of panels, reading the recorded values
+        chunk by chunk. See :func:`.plotting.plot_replicas`.
+
+        Parameters
+        ----------
+        var : str
+            The timeseries to plot, which should be either :code:`'dg'` or :code:`'traj'`.
+        fname : str
+            If specified, the figure is saved to this file.
+        n_buckets : int
+            The number of buckets used for decimating each timeseries.
+
+        Returns
+        -------
+        fig : matplotlib.figure.Figure
+            The figure.
+        """
+        from sampling_simulator import plotting  # matplotlib is only imported when plotting
+        if var not in ['dg', 'traj']:
+            raise ParameterError(f"The timeseries to plot should be either 'dg' or 'traj', not '{var}'.")
+        series = [getattr(sim, f'_{var}') for sim in self.simulators]
+        titles = [f'States {i * self.s} to {i * self.s + self.n_sub - 1}' for i in range(self.n_sim)]
+        label = r'$\Delta g$ (kT)' if var == 'dg' else 'State index'
+        return plotting.plot_replicas(series, label, fname, self.record_stride, n_buckets, titles)
 
     def combine_weights(self):
-        weights = [self.simulators[i].g for i in range(self.n_sim)]
-        w = np.round(weights, decimals=3).tolist()  # just for printing
-        if self.verbose:
-            print('  Original weights:')
-        for i in range(self.n_sim):
-            if self.verbose:
-                print(f'      States {i * self.s} to {i * self.s + self.n_sub - 1}: {w[i]}')
+        """
+        Combine the alchemical weights of all replicas into a whole-range profile by averaging the weight
+        differences between adjacent states over the replicas sampling both states, and determine the
+        modified weights of each replica from the profile. Equilibrated replicas keep their equilibrated weights.
+        In the 'async' mode, only the replicas that have published their weights (i.e. finished a segment)
+        are averaged over, unless none of them samples a pair of states.
 
-        dg_vec = []
-        dg_adjacent = [list(np.diff(weights[i])) for i in range(self.n_sim)]
-        for i in range(self.n_states - 1):
-            dg_list = []
-            for j in range(self.n_sim):
-                if i in self.state_ranges[j] and i + 1 in self.state_ranges[j]:
-                    idx = self.state_ranges[j].index(i)
-                    dg_list.append(dg_adjacent[j][idx])
-            dg_vec.append(np.mean(dg_list))
-        dg_vec.insert(0, 0)
-        g_vec = np.array([np.sum(dg_vec[:(i + 1)]) for i in range(len(dg_vec))])
+        Returns
+        -------
+        weights_modified : np.ndarray
+            The modified weights of all replicas, with shape :code:`(n_sim, n_sub)`.
+        g_vec : np.ndarray
+            The combined profile of alchemical weights of all states.
+        """
+        weights = np.array([self.simulators[i].g for i in range(self.n_sim)])
+        dg_adjacent = np.diff(weights, axis=1).ravel()
+        published = np.repeat(np.array(self.n_segments) > 0, self.n_sub - 1)
+        n_published = np.bincount(self._pair_idx, weights=published, minlength=self.n_states - 1)
+        pair_mask = np.where(n_published[self._pair_idx] > 0, published, True)  # all replicas if none published
+        if self.combine_rule == 'hist':
+            # Weight the difference between states i and i + 1 of each replica by the counts of both states
+            hist = np.array([self.simulators[i].hist for i in range(self.n_sim)])
+            w_pair = (hist[:, :-1] + hist[:, 1:]).ravel() * pair_mask
+            w_sum = np.bincount(self._pair_idx, weights=w_pair, minlength=self.n_states - 1)
+            dg_sum = np.bincount(self._pair_idx, weights=w_pair * dg_adjacent, minlength=self.n_states - 1)
+            unvisited = w_sum == 0  # fall back to the plain average if none of the replicas visited the pair
+            w_sum[unvisited] = np.bincount(self._pair_idx, weights=pair_mask, minlength=self.n_states - 1)[unvisited]  # noqa: E501
+            dg_sum[unvisited] = np.bincount(self._pair_idx, weights=pair_mask * dg_adjacent, minlength=self.n_states - 1)[unvisited]  # noqa: E501
+        else:
+            w_sum = np.bincount(self._pair_idx, weights=pair_mask, minlength=self.n_states - 1)
+            dg_sum = np.bincount(self._pair_idx, weights=pair_mask * dg_adjacent, minlength=self.n_states - 1)
+        g_vec = np.concatenate([[0], np.cumsum(dg_sum / w_sum)])
 
         # Determine the vector of alchemical weights for each replica
-        weights_modified = np.zeros_like(weights)
+        weights_modified = g_vec[self._sub_idx] - g_vec[self._sub_idx[:, :1]]
         for i in range(self.n_sim):
-            if self.equil_all[i] is False:  # unequilibrated
-                weights_modified[i] = list(g_vec[i * self.s: i * self.s + self.n_sub] - g_vec[i * self.s: i * self.s + self.n_sub][0])  # noqa: E501
-            else:
+            if self.n_segments[i] > 0 and self.equil_all[i] is True:  # equilibrated
                 weights_modified[i] = self.simulators[i].g_equil
 
-        w = np.round(weights_modified, decimals=3).tolist()  # just for printing
-        if self.verbose:
-            print('\n  Modified weights:')
-        for i in range(len(w)):
-            if self.verbose:
-                print(f'      States {i * self.s} to {i * self.s + self.n_sub - 1}: {w[i]}')
-
         return weights_modified, g_vec
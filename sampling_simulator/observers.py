@@ -0,0 +1,340 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides observers that can be attached to :class:`.WL_Simulator` and :class:`.EnsembleEXE`
+to monitor a run. Observers are called at a configurable stride and receive read-only views of the arrays
+of the simulators. A run without observers does not pay for any of the hooks.
+
+In the parallel mode of :class:`.EnsembleEXE`, the replicas call the step-level hooks of copies of the
+observers in the worker processes. When the workers are shut down, the records of the copies are merged
+into the observers in the parent process (see :meth:`Observer.merge`), replica by replica.
+"""
+import json
+import time
+import numpy as np
+
+
+def readonly(arr):
+    """
+    Return a read-only view of an array.
+    """
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
+class Observer:
+    """
+    The base class of observers. Subclasses override the hooks they are interested in.
+    Hooks that are not overridden are never called.
+
+    Parameters
+    ----------
+    stride : int
+        The number of steps between two calls of :meth:`on_step`.
+    iteration_stride : int
+        The number of iterations between two calls of the iteration-level hooks.
+    """
+    def __init__(self, stride=1, iteration_stride=1):
+        self.stride = stride
+        self.iteration_stride = iteration_stride
+
+    def merge(self, other):
+        """
+        Merge the records of :code:`other`, a copy of the observer used by a replica in a worker process,
+        into the observer. Observers that keep records in memory override this method.
+        """
+        pass
+
+    def observes(self, hook):
+        """
+        Whether the hook of the given name is overridden by the observer.
+        """
+        return getattr(type(self), hook) is not getattr(Observer, hook)
+
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        """
+        Called after every :code:`stride` steps of a simulator.
+
+        Parameters
+        ----------
+        sim : WL_Simulator
+            The simulator.
+        step : int
+            The index of the step, counted over all runs of the simulator.
+        state : int
+            The state before the move.
+        proposed : int
+            The proposed state.
+        accepted : bool
+            Whether the move was accepted.
+        g : np.ndarray
+            A read-only view of the alchemical weights after the step.
+        hist : np.ndarray
+            A read-only view of the histogram after the step.
+        """
+        pass
+
+    def on_flatness_reset(self, sim, step, wl_delta):
+        """
+        Called when the histogram of a simulator is found to be flat and is reset.
+        :code:`wl_delta` is the scaled Wang-Landau incrementor.
+        """
+        pass
+
+    def on_equilibration(self, sim, step, g_equil):
+        """
+        Called when the alchemical weights of a simulator are equilibrated.
+        """
+        pass
+
+    def on_run_end(self, sim, n_steps_done):
+        """
+        Called at the end of each run of a simulator (e.g. each segment of a replica of an EEXE simulation),
+        where :code:`n_steps_done` is the number of steps performed over all runs.
+        """
+        pass
+
+    def on_iteration_start(self, ensemble, iteration):
+        """
+        Called before the replicas of an EEXE simulation start every :code:`iteration_stride` iterations.
+        """
+        pass
+
+    def on_iteration_end(self, ensemble, iteration, weights, wl_delta_all):
+        """
+        Called after every :code:`iteration_stride` iterations of an EEXE simulation, after all
+        replicas have finished the iteration and before the weights are combined.
+
+        Parameters
+        ----------
+        ensemble : EnsembleEXE
+            The EEXE simulation.
+        iteration : int
+            The index of the iteration.
+        weights : np.ndarray
+            A read-only array of the alchemical weights of all replicas, with shape :code:`(n_sim, n_sub)`.
+        wl_delta_all : list
+            The Wang-Landau incrementors of all replicas.
+        """
+        pass
+
+    def on_combine(self, ensemble, iteration, weights, weights_modified, g_vec):
+        """
+        Called after the weights are combined in every :code:`iteration_stride` iterations,
+        with read-only arrays of the original and modified weights and the combined profile.
+        """
+        pass
+
+
+class ConsoleLogger(Observer):
+    """
+    An observer printing the progress of a run to the console, which is attached when :code:`verbose` is True.
+    """
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        print(f'Step {step + 1}: Attempting to move from state {state} to state {proposed} ... ', end='')
+        print('Move accepted!' if accepted else 'Move rejected!')
+
+    def on_flatness_reset(self, sim, step, wl_delta):
+        print('  Scaling down the Wang-Landau incrmentor and resetting the histogram ...')
+        print(f'  New Wang-Landau incrmentor: {wl_delta:.6f}')
+
+    def on_equilibration(self, sim, step, g_equil):
+        print('  The alchemical weights have been equilibrated!')
+
+    def on_iteration_start(self, ensemble, iteration):
+        section_title = f'Iteration {iteration + 1} / {ensemble.n_iters}'
+        print()
+        print(section_title)
+        print('=' * len(section_title))
+
+    def on_iteration_end(self, ensemble, iteration, weights, wl_delta_all):
+        print('Current alchemical weights:')
+        self._print_weights(ensemble, weights, '  ')
+        print(f'\nFinal Wang-Landau incrementors: {np.round(wl_delta_all, decimals=6).tolist()}')
+
+    def on_combine(self, ensemble, iteration, weights, weights_modified, g_vec):
+        print('\nPerforming weight combination ...')
+        print('  Original weights:')
+        self._print_weights(ensemble, weights, '      ')
+        print('\n  Modified weights:')
+        self._print_weights(ensemble, weights_modified, '      ')
+        print(f'Current profile of alchemical weieghts after combination: {np.round(g_vec, decimals=3).tolist()}')  # noqa: E501
+
+    @staticmethod
+    def _print_weights(ensemble, weights, indent):
+        w = np.round(weights, decimals=3).tolist()
+        for i in range(ensemble.n_sim):
+            print(f'{indent}States {i * ensemble.s} to {i * ensemble.s + ensemble.n_sub - 1}: {w[i]}')
+
+
+class MemoryAggregator(Observer):
+    """
+    An observer keeping the observed quantities in memory. Each attribute is a list of records,
+    one per call of the corresponding hook. The numbers of observed and accepted moves are also counted.
+    """
+    def __init__(self, stride=1, iteration_stride=1):
+        super().__init__(stride, iteration_stride)
+        self.steps = []  # (label, step, state, accepted)
+        self.flatness_resets = []  # (label, step, wl_delta)
+        self.equilibrations = []  # (label, step)
+        self.iterations = []  # (iteration, wl_delta_all)
+        self.g_vecs = []  # (iteration, g_vec)
+        self.n_observed = 0
+        self.n_accepted = 0
+
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        self.steps.append((sim.label, step, state, accepted))
+        self.n_observed += 1
+        self.n_accepted += accepted
+
+    def on_flatness_reset(self, sim, step, wl_delta):
+        self.flatness_resets.append((sim.label, step, wl_delta))
+
+    def on_equilibration(self, sim, step, g_equil):
+        self.equilibrations.append((sim.label, step))
+
+    def on_iteration_end(self, ensemble, iteration, weights, wl_delta_all):
+        self.iterations.append((iteration, list(wl_delta_all)))
+
+    def on_combine(self, ensemble, iteration, weights, weights_modified, g_vec):
+        self.g_vecs.append((iteration, np.array(g_vec)))
+
+    def merge(self, other):
+        for attr in ['steps', 'flatness_resets', 'equilibrations', 'iterations', 'g_vecs']:
+            getattr(self, attr).extend(getattr(other, attr))
+        self.n_observed += other.n_observed
+        self.n_accepted += other.n_accepted
+
+    @property
+    def acceptance_rate(self):
+        """
+        The fraction of accepted moves among the observed steps.
+        """
+        return self.n_accepted / self.n_observed if self.n_observed > 0 else np.nan
+
+
+class FileStreamer(Observer):
+    """
+    An observer writing one JSON record per call of a hook to a text file. In the parallel mode of
+    :class:`.EnsembleEXE`, each worker process appends to the file through its own copy of the observer.
+    The file is line-buffered, so records of different processes might interleave but are never split.
+
+    Parameters
+    ----------
+    fname : str
+        The path of the output file, which is overwritten when the observer is created.
+    stride : int
+        The number of steps between two records of steps.
+    iteration_stride : int
+        The number of iterations between two records of iterations.
+    """
+    def __init__(self, fname, stride=1, iteration_stride=1):
+        super().__init__(stride, iteration_stride)
+        self.fname = fname
+        self._fh = None
+        open(fname, 'w').close()
+
+    def __getstate__(self):
+        # File handles cannot be pickled, e.g. when sent to worker processes
+        self.close()
+        state = self.__dict__.copy()
+        state['_fh'] = None
+        return state
+
+    def _write(self, record):
+        if self._fh is None:
+            self._fh = open(self.fname, 'a', buffering=1)
+        self._fh.write(json.dumps(record) + '\n')
+
+    def close(self):
+        """
+        Flush and close the output file. Subsequent records are appended to the file.
+        """
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        self._write({'event': 'step', 'label': sim.label, 'step': step, 'state': int(state), 'accepted': bool(accepted), 'dg': float(g[-1] - g[0])})  # noqa: E501
+
+    def on_flatness_reset(self, sim, step, wl_delta):
+        self._write({'event': 'flatness_reset', 'label': sim.label, 'step': step, 'wl_delta': wl_delta})
+
+    def on_equilibration(self, sim, step, g_equil):
+        self._write({'event': 'equilibration', 'label': sim.label, 'step': step, 'g_equil': g_equil.tolist()})
+        self._fh.flush()
+
+    def on_iteration_end(self, ensemble, iteration, weights, wl_delta_all):
+        self._write({'event': 'iteration_end', 'iteration': iteration, 'wl_delta_all': list(wl_delta_all)})
+        self._fh.flush()
+
+    def on_combine(self, ensemble, iteration, weights, weights_modified, g_vec):
+        self._write({'event': 'combine', 'iteration': iteration, 'g_vec': g_vec.tolist()})
+
+
+class ConvergenceTracer(Observer):
+    """
+    An observer tracing the root-mean-square error (RMSE) of the alchemical weights with respect to the
+    true free energy profile (shifted such that the free energy of the first state is 0) against the number
+    of steps and the wall time since the tracer was created, e.g. to compare the time-to-accuracy of different
+    schedules of the Wang-Landau incrementor. For simulators, the RMSE of the weights is computed whenever the
+    histogram is reset and at the end of each run, so the tracer does not observe single steps and does not
+    slow down the fast paths of the simulators. Runs of fewer steps give a finer resolution, which matters
+    after the switch of the 1/t schedule, when the histogram is no longer reset. For EEXE simulations, the RMSE
+    of the combined profile is also computed every :code:`iteration_stride` iterations (or combinations in the
+    'async' mode), with steps averaged over the replicas.
+
+    Attributes
+    ----------
+    traces : dict
+        The traces keyed by the labels of the simulators (:code:`'ensemble'` for EEXE simulations),
+        each of which is a list of tuples :code:`(step, wall_time, rmse)`.
+    """
+    def __init__(self, iteration_stride=1):
+        super().__init__(iteration_stride=iteration_stride)
+        self.traces = {}
+        self._t0 = time.perf_counter()
+
+    def _record(self, label, step, g, f_true):
+        trace = self.traces.setdefault(label, [])
+        if trace and trace[-1][0] == step:
+            return  # e.g. a reset in the last step of a run
+        rmse = float(np.sqrt(np.mean((g - (f_true - f_true[0])) ** 2)))
+        trace.append((step, time.perf_counter() - self._t0, rmse))
+
+    def on_flatness_reset(self, sim, step, wl_delta):
+        self._record(sim.label, step + 1, sim.g, sim.f_true)
+
+    def on_run_end(self, sim, n_steps_done):
+        self._record(sim.label, n_steps_done, sim.g, sim.f_true)
+
+    def merge(self, other):
+        # The copy was forked from the tracer, so its wall times are measured from the same start time. The copy
+        # inherited the traces recorded before the fork, which are skipped; the traces of the replicas are only
+        # extended by the worker running them, and the trace of the ensemble only by the parent process.
+        for label, trace in other.traces.items():
+            own = self.traces.setdefault(label, [])
+            own.extend(trace[len(own):])
+
+    def on_combine(self, ensemble, iteration, weights, weights_modified, g_vec):
+        step = sum(sim.n_steps_done for sim in ensemble.simulators) / ensemble.n_sim
+        self._record('ensemble', step, g_vec, ensemble.f_true)
+
+    def time_to_rmse(self, target, label=None):
+        """
+        Return the first record :code:`(step, wall_time, rmse)` of a trace whose RMSE is not larger than
+        :code:`target`, or None if the target has not been reached. For EEXE simulations, use
+        :code:`label='ensemble'` for the combined profile.
+        """
+        for record in self.traces.get(label, []):
+            if record[2] <= target:
+                return record
+        return None
@@ -0,0 +1,268 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides a pool of persistent worker processes for running the replicas of an EEXE simulation
+in parallel. Each replica lives in one worker process across iterations, and its alchemical weights and
+histogram are exchanged with the parent process through a shared-memory NumPy buffer. An exception raised
+by a replica in a worker is sent back to the parent process and re-raised there.
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+import numpy as np
+
+_G, _HIST = 0, 1  # rows of the shared buffer of each replica
+
+
+def _worker(conn, simulators, shm_name, shape):
+    """
+    The main loop of a worker process, which runs the replicas in :code:`simulators`
+    (a dictionary keyed by the replica indices) upon request of the parent process.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = np.ndarray(shape, dtype=float, buffer=shm.buf)
+    try:
+        while True:
+            cmd, idx, push_weights, state = conn.recv()
+            if cmd == 'run':
+                sim = simulators[idx]
+                try:
+                    if push_weights:
+                        sim.g = buffer[idx, _G]
+                    if state is not None:
+                        sim.state = state
+                    sim.run()
+                except Exception as err:
+                    conn.send((idx, err))
+                    continue
+                buffer[idx, _G] = sim.g
+                buffer[idx, _HIST] = sim.hist
+                conn.send((idx, _get_scalars(sim)))
+            elif cmd == 'fetch':
+                conn.send(simulators)
+            elif cmd == 'close':
+                conn.send(simulators)
+                break
+    finally:
+        del buffer
+        shm.close()
+
+
+def _get_scalars(sim):
+    """
+    Return the attributes of a simulator that are sent back to the parent process along with the shared buffer.
+    """
+    return {
+        'state': sim.state,
+        'n_steps_done': sim.n_steps_done,
+        'wl_delta': sim.wl_delta,
+        'equil': sim.equil,
+        'equil_time': sim.equil_time,
+        'g_equil': sim.g_equil,
+        'stats': sim.stats,
+    }
+
+
+class ReplicaPool:
+    """
+    A pool of worker processes, each of which keeps a subset of the replicas alive across iterations.
+    The simulators passed to the pool are kept in the parent process as proxies whose weights, histograms
+    and equilibration-related attributes are updated after each iteration, while their trajectories are
+    only synchronized when the pool is closed.
+
+    Parameters
+    ----------
+    simulators : list
+        A list of :class:`.WL_Simulator` objects, one for each replica.
+    n_workers : int
+        The number of worker processes. Replica :code:`j` is assigned to worker :code:`j % n_workers`.
+    """
+    def __init__(self, simulators, n_workers):
+        self.simulators = simulators
+        self.n_workers = min(n_workers, len(simulators))
+        n_sub = len(simulators[0].g)
+        self.shape = (len(simulators), 2, n_sub)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * 8)
+        self.buffer = np.ndarray(self.shape, dtype=float, buffer=self.shm.buf)
+
+        self.conns, self.procs = [], []
+        self._retired = set()  # the replicas that will not be run anymore
+        self._closed = set()  # the workers that have been shut down
+        self._failed = False  # whether a replica raised an exception, after which the workers are terminated
+        for k in range(self.n_workers):
+            parent_conn, child_conn = mp.Pipe()
+            subset = {j: simulators[j] for j in range(k, len(simulators), self.n_workers)}
+            proc = mp.Process(target=_worker, args=(child_conn, subset, self.shm.name, self.shape), daemon=True)
+            proc.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.procs.append(proc)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def run(self, push_weights=False, push_states=False):
+        """
+        Run all replicas for one iteration and update the proxies in the parent process.
+
+        Parameters
+        ----------
+        push_weights : bool
+            Whether to send the current weights of the proxies to the workers before running,
+            e.g. after weight combination.
+        push_states : bool
+            Whether to send the current states of the proxies to the workers before running,
+            e.g. after replica exchanges.
+        """
+        for j, sim in enumerate(self.simulators):
+            if push_weights:
+                self.buffer[j, _G] = sim.g
+            self.conns[j % self.n_workers].send(('run', j, push_weights, sim.state if push_states else None))
+
+        n_pending = len(self.simulators)
+        while n_pending > 0:
+            for conn in wait(self.conns):
+                j, scalars = conn.recv()
+                self._update_proxy(j, scalars)
+                n_pending -= 1
+
+    def submit(self, idx, weights=None):
+        """
+        Start a run of replica :code:`idx` without waiting for it to finish (see :meth:`wait_any`).
+
+        Parameters
+        ----------
+        idx : int
+            The index of the replica.
+        weights : np.ndarray
+            If specified, the weights assigned to the replica before running.
+        """
+        if weights is not None:
+            self.buffer[idx, _G] = weights
+        self.conns[idx % self.n_workers].send(('run', idx, weights is not None, None))
+
+    def wait_any(self):
+        """
+        Wait until at least one of the submitted runs has finished, update the proxies of the replicas
+        whose runs have finished and return their indices.
+        """
+        finished = []
+        for conn in wait([conn for k, conn in enumerate(self.conns) if k not in self._closed]):
+            j, scalars = conn.recv()
+            self._update_proxy(j, scalars)
+            finished.append(j)
+        return finished
+
+    def retire(self, idx):
+        """
+        Mark replica :code:`idx`, which must not have a pending run, as retired. Once all replicas of a worker
+        are retired, the worker is shut down to free its core, and the proxies of its replicas are replaced by
+        the simulators kept in the worker.
+        """
+        self._retired.add(idx)
+        k = idx % self.n_workers
+        if all(j in self._retired for j in range(k, len(self.simulators), self.n_workers)):
+            self.conns[k].send(('close', None, None, None))
+            self._receive_simulators(self.conns[k])
+            self.conns[k].close()
+            self.procs[k].join(timeout=10)
+            self._closed.add(k)
+
+    def _update_proxy(self, idx, scalars):
+        """
+        Update the proxy of replica :code:`idx` using the shared buffer and the attributes sent by the worker,
+        or raise the exception sent by the worker if the run of the replica failed.
+        """
+        if isinstance(scalars, Exception):
+            self._failed = True
+            raise RuntimeError(f'The run of replica {idx} failed in a worker process.') from scalars
+        sim = self.simulators[idx]
+        sim.g = self.buffer[idx, _G]
+        sim.hist = self.buffer[idx, _HIST]
+        stats = scalars.pop('stats')
+        if stats is not None:
+            # Keep the object referred to by the timers of the proxy
+            sim.stats.reset()
+            sim.stats.merge(stats)
+        for attr, value in scalars.items():
+            setattr(sim, attr, value)
+
+    def fetch(self):
+        """
+        Replace the proxies with copies of the simulators kept in the workers, which carry the full
+        trajectories and random number generator states, e.g. for checkpointing. The workers keep running.
+        The weights and states of the proxies, which might have been modified in the parent process (e.g. by
+        weight combination or replica exchanges) since the last iteration, are kept.
+
+        Returns
+        -------
+        simulators : list
+            The updated list of simulators (the same list object passed to the pool).
+        """
+        self._collect('fetch')
+        return self.simulators
+
+    def _collect(self, cmd):
+        """
+        Send a command to all workers and replace the proxies with the simulators sent back, keeping
+        the weights and states of the proxies.
+        """
+        weights, states = [sim.g for sim in self.simulators], [sim.state for sim in self.simulators]
+        conns = [conn for k, conn in enumerate(self.conns) if k not in self._closed]
+        for conn in conns:
+            conn.send((cmd, None, None, None))
+        for conn in conns:
+            self._receive_simulators(conn)
+        for sim, g, state in zip(self.simulators, weights, states):
+            sim.g = g
+            sim.state = state
+
+    def _receive_simulators(self, conn):
+        for j, sim in conn.recv().items():
+            self.simulators[j] = sim
+
+    def close(self):
+        """
+        Shut down the workers and replace the proxies with the simulators kept in the workers,
+        which carry the full trajectories and random number generator states. As in :meth:`fetch`, the weights
+        and states of the proxies, which might have been modified by weight combination or replica exchanges
+        after the last run, are kept. If a replica failed,
+        the workers are terminated without sending back the simulators.
+
+        Returns
+        -------
+        simulators : list
+            The updated list of simulators (the same list object passed to the pool).
+        """
+        if self.shm is None:
+            return self.simulators
+        try:
+            if not self._failed:
+                self._collect('close')
+        finally:
+            for k, conn in enumerate(self.conns):
+                if k not in self._closed:
+                    conn.close()
+            for proc in self.procs:
+                if self._failed:
+                    proc.terminate()  # the workers might still be running other replicas
+                proc.join(timeout=10)
+                if proc.is_alive():
+                    proc.terminate()
+                    proc.join()
+            del self.buffer
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+        return self.simulators
@@ -0,0 +1,197 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides the plotting functions of the simulators. It is the only module of the package
+that imports matplotlib, and it is only imported when a plotting method is called, so that running
+simulations (e.g. in worker processes) does not pay for importing matplotlib.
+
+Long timeseries are decimated by keeping the minimum and maximum of each of a fixed number of
+buckets, which preserves the visual envelope (including short spikes) of the full timeseries.
+The input is read chunk by chunk, so memory-mapped timeseries are never fully loaded into memory.
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+from sampling_simulator.utils import utils
+
+
+def plot_hist(hist, fname=None):
+    """
+    Plot the histogram counts of all states.
+
+    Parameters
+    ----------
+    hist : np.ndarray
+        The histogram counts of all states.
+    fname : str
+        If specified, the figure is saved to this file.
+    """
+    bin_centers = np.arange(len(hist))
+    bin_width = 1
+    plt.bar(bin_centers, hist, width=bin_width, align='center', alpha=0.5, edgecolor='black')
+    plt.xlabel('State index')
+    plt.ylabel('Count')
+    plt.grid()
+    ax = plt.gca()
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    if fname is not None:
+        plt.savefig(fname, dpi=600)
+
+
+def iter_chunks(var, chunk_size=1048576):
+    """
+    Iterate over a timeseries chunk by chunk.
+
+    Parameters
+    ----------
+    var : array-like or TrajectoryRecorder
+        The timeseries, which can be any object supporting :code:`len` and slicing (e.g. a memory map),
+        or an object with an :code:`iter_chunks` method such as a :class:`.TrajectoryRecorder`.
+    chunk_size : int
+        The number of values in each chunk for sliceable inputs.
+    """
+    if hasattr(var, 'iter_chunks'):
+        yield from var.iter_chunks()
+    else:
+        for i in range(0, len(var), chunk_size):
+            yield np.asarray(var[i:i + chunk_size])
+
+
+def decimate_minmax(var, n_buckets=2000, chunk_size=1048576):
+    """
+    Decimate a timeseries by splitting it into :code:`n_buckets` buckets of equal lengths and keeping
+    the minimum and the maximum of each bucket in their original order. Timeseries with no more than
+    :code:`2 * n_buckets` values are returned as they are.
+
+    Parameters
+    ----------
+    var : array-like or TrajectoryRecorder
+        The timeseries (see :func:`iter_chunks`).
+    n_buckets : int
+        The number of buckets, e.g. about the width of the plot in pixels.
+    chunk_size : int
+        The number of values read at a time for sliceable inputs.
+
+    Returns
+    -------
+    idx : np.ndarray
+        The indices of the kept values in the timeseries.
+    values : np.ndarray
+        The kept values.
+    """
+    n = len(var)
+    if n <= 2 * n_buckets:
+        values = np.concatenate(list(iter_chunks(var, chunk_size))) if n > 0 else np.zeros(0)
+        return np.arange(n), values
+
+    size = -(-n // n_buckets)  # the length of each bucket, except for the last one
+    idx, values = [], []
+    carry, offset = np.zeros(0), 0  # the values of an incomplete bucket and the index of its first value
+    for chunk in iter_chunks(var, chunk_size):
+        seg = np.concatenate([carry, chunk]) if len(carry) > 0 else chunk
+        n_full = len(seg) // size
+        if n_full > 0:
+            buckets = seg[:n_full * size].reshape(n_full, size)
+            i_min, i_max = buckets.argmin(axis=1), buckets.argmax(axis=1)
+            pos = np.stack([np.minimum(i_min, i_max), np.maximum(i_min, i_max)], axis=1)
+            values.append(np.take_along_axis(buckets, pos, axis=1).ravel())
+            idx.append((pos + np.arange(n_full)[:, None] * size).ravel() + offset)
+        carry = seg[n_full * size:]
+        offset += n_full * size
+    if len(carry) > 0:
+        pos = np.array(sorted({int(carry.argmin()), int(carry.argmax())}))
+        values.append(carry[pos])
+        idx.append(pos + offset)
+
+    return np.concatenate(idx), np.concatenate(values)
+
+
+def plot_timeseries(var, label, fname=None, stride=1, n_buckets=2000, ax=None):
+    """
+    Plot a timeseries recorded every :code:`stride` steps. Long timeseries are decimated by
+    :func:`decimate_minmax`, so spikes are preserved and memory-mapped inputs are never fully
+    loaded into memory.
+
+    Parameters
+    ----------
+    var : array-like or TrajectoryRecorder
+        The timeseries (see :func:`iter_chunks`).
+    label : str
+        The label of the y-axis.
+    fname : str
+        If specified, the figure is saved to this file.
+    stride : int
+        The number of steps between two recorded values.
+    n_buckets : int
+        The number of buckets used for decimation.
+    ax : matplotlib.axes.Axes
+        The axes to plot on. The current axes of pyplot are used by default.
+    """
+    idx, values = decimate_minmax(var, n_buckets)
+    if ax is None:
+        ax = plt.gca()
+    ax.plot(idx * stride, values)
+    ax.set_xlabel('Step')
+    ax.set_ylabel(label)
+    ax.grid()
+    if fname is not None:
+        ax.figure.savefig(fname, dpi=600)
+
+
+def plot_replicas(series, label, fname=None, stride=1, n_buckets=1000, titles=None, dpi=300):
+    """
+    Plot the timeseries of multiple replicas in a grid of panels, whose dimensions are
+    determined by :func:`.utils.get_subplot_dimension`. The figure is created without pyplot,
+    so it can be rendered headlessly and is not kept alive by pyplot after it is saved.
+
+    Parameters
+    ----------
+    series : list
+        The timeseries of all replicas (see :func:`iter_chunks`).
+    label : str
+        The label of the y-axes.
+    fname : str
+        If specified, the figure is saved to this file.
+    stride : int
+        The number of steps between two recorded values.
+    n_buckets : int
+        The number of buckets used for decimating each timeseries.
+    titles : list
+        The titles of the panels.
+    dpi : int
+        The resolution of the saved figure.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        The figure.
+    """
+    n_rows, n_cols = utils.get_subplot_dimension(len(series))
+    fig = Figure(figsize=(3 * n_cols, 2.5 * n_rows))
+    axes = fig.subplots(n_rows, n_cols, squeeze=False, sharex=True).ravel()
+    for i, var in enumerate(series):
+        idx, values = decimate_minmax(var, n_buckets)
+        axes[i].plot(idx * stride, values, linewidth=0.8)
+        axes[i].grid()
+        if titles is not None:
+            axes[i].set_title(titles[i], fontsize=10)
+    for ax in axes[len(series):]:
+        ax.set_visible(False)
+    for i in range(max(0, len(series) - n_cols), len(series)):  # the bottom panel of each column
+        axes[i].xaxis.set_tick_params(labelbottom=True)
+        axes[i].set_xlabel('Step')
+    for ax in axes[::n_cols]:
+        ax.set_ylabel(label)
+    fig.tight_layout()
+    if fname is not None:
+        fig.savefig(fname, dpi=dpi)
+
+    return fig
@@ -0,0 +1,297 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides an on-disk store of the results of many runs, with one directory per campaign::
+
+    results/
+        index.jsonl          # one line per run: its ID, row, parameters, array locations and the ends of all arrays
+        schema.json          # the names and data types of the columns and arrays
+        columns/<name>.npy   # one fixed-width value per run, e.g. the RMSE or the equilibration time
+        arrays/<name>.npy    # the flattened arrays of all runs concatenated, e.g. the final weights
+
+The :code:`.npy` files have fixed-length headers and grow in place, so readers can memory-map a whole column
+or the arrays of a single run without copying. Appends are serialized by an exclusive lock on a lock file
+(:code:`flock`, or :code:`msvcrt.locking` on Windows), and a run only becomes visible once its line is written
+to the index after all of its data, so parallel writers never corrupt the store, and data left by an interrupted
+writer is discarded by the next one.
+"""
+import os
+import json
+import contextlib
+import numpy as np
+from sampling_simulator.utils.exceptions import ParameterError
+from sampling_simulator.utils.recorder import _HEADER_LEN, _write_npy_header
+from sampling_simulator.aggregation import summarize
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (Windows)
+    fcntl = None
+    import msvcrt
+
+_WRITE_CHUNK = 1 << 20  # the number of values written at a time, so streamed trajectories are never fully loaded
+
+
+def _append_npy(fname, dtype, offset, values):
+    """
+    Write a 1D array at :code:`offset` (in values) of a :code:`.npy` file with a fixed-length header, discarding
+    anything after it, and update the header. The file is created if it does not exist.
+    """
+    with open(fname, 'r+b' if os.path.exists(fname) else 'w+b') as fh:
+        fh.truncate(_HEADER_LEN + offset * dtype.itemsize)
+        fh.seek(_HEADER_LEN + offset * dtype.itemsize)
+        for i in range(0, len(values), _WRITE_CHUNK):
+            fh.write(np.ascontiguousarray(values[i:i + _WRITE_CHUNK], dtype=dtype).tobytes())
+        _write_npy_header(fh, dtype, offset + len(values))
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+class ResultsStore:
+    """
+    A columnar store of the results of runs in a directory, which is created if it does not exist.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the store.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        for sub in ['columns', 'arrays']:
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+        self._index_path = os.path.join(directory, 'index.jsonl')
+        self._entries = []
+        self._ids = {}  # run ID -> row
+        self._index_pos = 0  # the number of bytes of the index parsed so far
+        self._schema = None
+
+    def _path(self, kind, name):
+        return os.path.join(self.directory, kind, f'{name}.npy')
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(os.path.join(self.directory, 'lock'), 'w') as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            else:
+                while True:  # msvcrt.locking only retries for 10 seconds
+                    try:
+                        msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def refresh(self):
+        """
+        Read the runs appended to the index since the last call, e.g. by other processes.
+        A partially written last line, left by an interrupted writer, is ignored.
+        """
+        if not os.path.exists(self._index_path):
+            return
+        n_entries = len(self._entries)
+        with open(self._index_path, 'rb') as fh:
+            fh.seek(self._index_pos)
+            for line in fh:
+                if not line.endswith(b'\n'):
+                    break
+                entry = json.loads(line)
+                self._ids[entry['run_id']] = len(self._entries)
+                self._entries.append(entry)
+                self._index_pos += len(line)
+        if self._schema is None or len(self._entries) > n_entries:
+            self._read_schema()
+
+    def _read_schema(self):
+        schema_path = os.path.join(self.directory, 'schema.json')
+        if os.path.exists(schema_path):
+            with open(schema_path) as fh:
+                self._schema = json.load(fh)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._entries)
+
+    def __contains__(self, run_id):
+        self.refresh()
+        return run_id in self._ids
+
+    @property
+    def run_ids(self):
+        """
+        The IDs of all runs in the order in which they were appended.
+        """
+        self.refresh()
+        return [entry['run_id'] for entry in self._entries]
+
+    def append(self, run_id, columns, arrays=None, params=None):
+        """
+        Append the results of a run. The first run fixes the names and data types of the columns,
+        which all subsequent runs must have, while the arrays of each run are arbitrary. The data type of
+        an array is likewise fixed by the first run that has it. Values are only cast safely, e.g. from
+        integers to floats or from 16-bit to 64-bit integers but not vice versa, and columns and arrays are
+        never widened, so the first run must have the widest data types, e.g. the largest :code:`traj_dtype`
+        of the simulators. The cost of an append does not grow with the number of runs in the store.
+
+        Parameters
+        ----------
+        run_id : str
+            The unique ID of the run.
+        columns : dict
+            A dictionary mapping the names of the columns to the scalar values of the run.
+        arrays : dict
+            A dictionary mapping names to the arrays of the run, e.g. the trajectory or the final weights.
+        params : dict
+            The parameters of the run, which must be JSON-serializable.
+        """
+        arrays = {} if arrays is None else arrays
+        with self._lock():
+            self.refresh()
+            self._read_schema()  # other writers might have registered new arrays
+            if run_id in self._ids:
+                raise ParameterError(f"A run with the ID '{run_id}' is already in the store.")
+            schema = self._update_schema(columns, arrays)
+
+            # The data of a run are written at the ends committed in the index, overwriting anything left by
+            # an interrupted writer, and the run is committed by writing its line, with the new ends, to the index
+            ends = self._ends()
+            locations = {}
+            for name, values in arrays.items():
+                values = np.asarray(values)
+                dtype = np.dtype(schema['arrays'][name])
+                if not np.can_cast(values.dtype, dtype):
+                    raise ParameterError(f"The array '{name}' of type {values.dtype} cannot be stored as {dtype}.")
+                offset = ends.get(name, 0)
+                _append_npy(self._path('arrays', name), dtype, offset, values.reshape(-1))
+                locations[name] = [offset, list(values.shape)]
+                ends[name] = offset + values.size
+            row = len(self._entries)
+            for name, dtype in schema['columns'].items():
+                _append_npy(self._path('columns', name), np.dtype(dtype), row, np.array([columns[name]]))
+
+            line = json.dumps({'run_id': run_id, 'row': row, 'arrays': locations, 'params': params, 'ends': ends}) + '\n'  # noqa: E501
+            with open(self._index_path, 'ab') as fh:
+                fh.truncate(self._index_pos)  # discard a partially written line
+                fh.write(line.encode())
+                fh.flush()
+                os.fsync(fh.fileno())
+            self.refresh()
+
+    def _ends(self):
+        """
+        Return the numbers of values of all arrays committed in the index, which are recorded in the line of
+        the last run. The index is only scanned if it was written without them.
+        """
+        if not self._entries:
+            return {}
+        if 'ends' in self._entries[-1]:
+            return dict(self._entries[-1]['ends'])
+        ends = {}
+        for entry in self._entries:
+            for name, (offset, shape) in entry['arrays'].items():
+                ends[name] = max(ends.get(name, 0), offset + int(np.prod(shape)))
+        return ends
+
+    def _update_schema(self, columns, arrays):
+        """
+        Check the columns of a run against the schema, register the data types of new arrays and return the schema.
+        """
+        schema = self._schema or {'columns': {name: np.asarray(value).dtype.str for name, value in columns.items()}, 'arrays': {}}  # noqa: E501
+        if set(columns) != set(schema['columns']):
+            raise ParameterError(f"The columns of a run should be {sorted(schema['columns'])}, not {sorted(columns)}.")
+        for name, value in columns.items():
+            dtype = np.dtype(schema['columns'][name])
+            if not np.can_cast(np.asarray(value).dtype, dtype):
+                raise ParameterError(f"The column '{name}' of type {np.asarray(value).dtype} cannot be stored as {dtype}.")  # noqa: E501
+        new_arrays = {name: np.asarray(values).dtype.str for name, values in arrays.items() if name not in schema['arrays']}  # noqa: E501
+        if self._schema is None or new_arrays:
+            schema['arrays'].update(new_arrays)
+            tmp = os.path.join(self.directory, f'schema.json.{os.getpid()}.tmp')
+            with open(tmp, 'w') as fh:
+                json.dump(schema, fh)
+            os.replace(tmp, os.path.join(self.directory, 'schema.json'))
+            self._schema = schema
+        return schema
+
+    def append_summary(self, summary, run_id, params=None, arrays=None, **columns):
+        """
+        Append the results of a run given its summary (see :func:`.aggregation.summarize`), with the columns
+        :code:`rmse` and :code:`equil_time` (the time for all replicas to be equilibrated, or -1 if any replica
+        has not been equilibrated) and any additional columns given as keyword arguments, and the arrays
+        :code:`g` (the final weights) and :code:`equil_time_all` in addition to the given arrays.
+        """
+        equil_time_all = summary['equil_time_all']
+        columns = dict(rmse=summary['rmse'], equil_time=-1 if None in equil_time_all else max(equil_time_all), **columns)  # noqa: E501
+        arrays = dict({
+            'g': np.array(summary['g']),
+            'equil_time_all': np.array([-1 if t is None else t for t in equil_time_all], dtype=np.int64),
+        }, **({} if arrays is None else arrays))
+        self.append(run_id, columns, arrays, params)
+
+    def append_simulator(self, sim, run_id, params=None, **columns):
+        """
+        Append the results of a finished :class:`.WL_Simulator` or :class:`.EnsembleEXE` run as in
+        :meth:`append_summary`, with the arrays :code:`traj`, :code:`dg`, :code:`hist` and :code:`g_equil`
+        of each replica (prefixed by :code:`rep{j}.` for an :class:`.EnsembleEXE` simulation) in addition.
+        """
+        arrays = {}
+        replicas = [(f'rep{j}.', s) for j, s in enumerate(sim.simulators)] if hasattr(sim, 'simulators') else [('', sim)]  # noqa: E501
+        for prefix, s in replicas:
+            arrays[f'{prefix}traj'] = s.traj
+            arrays[f'{prefix}dg'] = s.dg
+            arrays[f'{prefix}hist'] = s.hist
+            if s.g_equil is not None:
+                arrays[f'{prefix}g_equil'] = np.asarray(s.g_equil, dtype=float)
+        self.append_summary(summarize(sim), run_id, params, arrays, **columns)
+
+    def column(self, name):
+        """
+        Return the values of a column for all runs as a read-only memory map.
+        """
+        self.refresh()
+        if self._schema is None or name not in self._schema['columns']:
+            raise ParameterError(f"The store does not have a column '{name}'.")
+        return np.load(self._path('columns', name), mmap_mode='r')[:len(self._entries)]
+
+    def run(self, run_id):
+        """
+        Return the arrays of a run as a dictionary of read-only memory maps.
+        """
+        entry = self.entry(run_id)
+        data = {}
+        for name, (offset, shape) in entry['arrays'].items():
+            values = np.load(self._path('arrays', name), mmap_mode='r')
+            data[name] = values[offset:offset + int(np.prod(shape))].reshape(shape)
+        return data
+
+    def entry(self, run_id):
+        """
+        Return the index entry of a run, which includes its row in the columns (:code:`row`), its parameters
+        (:code:`params`) and the offsets and shapes of its arrays (:code:`arrays`).
+        """
+        self.refresh()
+        if run_id not in self._ids:
+            raise KeyError(run_id)
+        return self._entries[self._ids[run_id]]
+
+    def row(self, run_id):
+        """
+        Return the values of all columns of a run as a dictionary.
+        """
+        row = self.entry(run_id)['row']
+        return {name: self.column(name)[row].item() for name in self._schema['columns']}
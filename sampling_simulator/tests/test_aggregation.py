@@ -0,0 +1,128 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module aggregation.py.
+"""
+import math
+import pytest
+import numpy as np
+from sampling_simulator.aggregation import Welford, QuantileSketch, Reservoir, RunAggregator
+from sampling_simulator.utils.exceptions import ParameterError
+
+
+def add_all(acc, values):
+    for x in values:
+        acc.add(x)
+    return acc
+
+
+def test_welford():
+    values = np.random.default_rng(0).normal(3, 2, size=(500, 4))
+    acc = add_all(Welford(), values)
+    np.testing.assert_allclose(acc.mean, values.mean(axis=0))
+    np.testing.assert_allclose(acc.var, values.var(axis=0, ddof=1))
+    np.testing.assert_allclose(acc.sem, values.std(axis=0, ddof=1) / np.sqrt(500))
+    assert np.isnan(add_all(Welford(), [1.0]).var)
+
+
+@pytest.mark.parametrize('split', [0, 1, 137, 499])
+def test_welford_merge(split):
+    # Merging partial aggregators is equivalent to aggregating all values at once
+    values = np.random.default_rng(1).exponential(size=500)
+    acc = add_all(Welford(), values)
+    merged = add_all(Welford(), values[:split]).merge(add_all(Welford(), values[split:]))
+    assert merged.n == acc.n
+    assert merged.mean == pytest.approx(acc.mean)
+    assert merged.var == pytest.approx(acc.var)
+
+
+def mixed_values(n, seed):
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(0, 3, n) * rng.choice([-1, 1], n, p=[0.3, 0.7])
+    values[:10] = 0
+    return values
+
+
+@pytest.mark.parametrize('alpha', [0.01, 0.05])
+def test_sketch_relative_error(alpha):
+    values = mixed_values(5000, 2)
+    sketch = add_all(QuantileSketch(alpha), values)
+    exact = np.sort(values)
+    for q in np.linspace(0, 1, 101):
+        true = exact[math.floor(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - true) <= alpha * abs(true) + 1e-12
+    assert sketch.quantile(0) == exact[0] and sketch.quantile(1) == exact[-1]
+    assert math.isnan(QuantileSketch(alpha).quantile(0.5))
+
+
+def test_sketch_merge():
+    values = mixed_values(3000, 3)
+    sketch = add_all(QuantileSketch(0.02), values)
+    merged = QuantileSketch(0.02)
+    for part in np.array_split(values, 4):
+        merged.merge(add_all(QuantileSketch(0.02), part))
+    assert (merged.n, merged.min, merged.max) == (sketch.n, sketch.min, sketch.max)
+    for q in np.linspace(0, 1, 51):
+        assert merged.quantile(q) == sketch.quantile(q)
+    with pytest.raises(ParameterError):
+        merged.merge(QuantileSketch(0.01))
+    with pytest.raises(ParameterError):
+        QuantileSketch(1)
+
+
+def test_reservoir():
+    reservoir = add_all(Reservoir(100, seed=0), range(1000))
+    assert reservoir.n == 1000 and len(reservoir.samples) == 100 == len(set(reservoir.samples))
+    small = add_all(Reservoir(100, seed=0), range(10))
+    assert small.samples == list(range(10))
+    lower, upper = add_all(Reservoir(1000, seed=0), np.random.default_rng(0).normal(size=1000)).bootstrap()
+    assert lower < 0 < upper
+
+
+def test_reservoir_merge():
+    # A merged reservoir is a uniform sample of the combined stream like a reservoir of the whole stream:
+    # with streams of 300 and 100 values, 3/4 of the samples come from the first one on average
+    fractions, fractions_all = [], []
+    for seed in range(200):
+        first = add_all(Reservoir(40, seed=seed), range(300))
+        second = add_all(Reservoir(40, seed=seed + 1000), range(300, 400))
+        merged = first.merge(second)
+        assert merged.n == 400 and len(merged.samples) == 40 == len(set(merged.samples))
+        fractions.append(np.mean(np.array(merged.samples) < 300))
+        whole = add_all(Reservoir(40, seed=seed + 2000), range(400))
+        fractions_all.append(np.mean(np.array(whole.samples) < 300))
+    sem = np.sqrt(0.75 * 0.25 / 40 / 200)
+    assert abs(np.mean(fractions) - 0.75) < 4 * sem
+    assert abs(np.mean(fractions_all) - 0.75) < 4 * sem
+
+    # Reservoirs that are not full keep all samples
+    merged = add_all(Reservoir(40, seed=0), range(10)).merge(add_all(Reservoir(40, seed=1), range(10, 25)))
+    assert merged.samples == list(range(25))
+
+
+def test_run_aggregator_merge():
+    rng = np.random.default_rng(4)
+    summaries = [{
+        'rmse': float(rng.exponential()),
+        'equil_time_all': [int(t) for t in rng.integers(100, 10000, size=3)] if rng.random() < 0.8 else [100, None, 200],  # noqa: E501
+        'weight_error': rng.normal(size=5).tolist(),
+    } for _ in range(300)]
+    agg = add_all(RunAggregator(seed=0), summaries)
+    merged = add_all(RunAggregator(seed=0), summaries[:120]).merge(add_all(RunAggregator(seed=1), summaries[120:]))
+    expected, result = agg.as_dict(), merged.as_dict()
+    assert result['n_runs'] == expected['n_runs'] == 300
+    assert result['n_unequilibrated'] == expected['n_unequilibrated'] > 0
+    for name in RunAggregator.METRICS:
+        assert result[name]['n'] == expected[name]['n']
+        assert result[name]['mean'] == pytest.approx(expected[name]['mean'])
+        assert result[name]['std'] == pytest.approx(expected[name]['std'])
+        assert result[name]['quantiles'] == expected[name]['quantiles']
+    np.testing.assert_allclose(result['weight_error']['mean'], expected['weight_error']['mean'])
+    np.testing.assert_allclose(result['weight_error']['std'], expected['weight_error']['std'])
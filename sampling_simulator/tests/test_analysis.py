@@ -0,0 +1,69 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module analysis.py.
+"""
+import pytest
+import numpy as np
+from sampling_simulator import analysis
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.utils.exceptions import ParameterError
+
+F_TRUE = np.array([0, 1.5, 3, 2, 0.5, 4])
+G = np.array([0, 1, 2.5, 2, 0, 3])  # with ties in f_true - g
+
+
+@pytest.mark.parametrize('g', [None, G])
+def test_transition_matrix(g):
+    P = analysis.transition_matrix(F_TRUE, g)
+    pi = analysis.stationary_distribution(F_TRUE, g)
+    assert (P >= 0).all()
+    np.testing.assert_allclose(P.sum(axis=1), 1)
+    np.testing.assert_allclose(pi @ P, pi)
+    np.testing.assert_allclose(pi[:, None] * P, (pi[:, None] * P).T, atol=1e-15)  # detailed balance
+
+
+@pytest.mark.parametrize('g', [None, G])
+def test_matvec(g):
+    f, order, q, pi, p_stay = analysis._sorted_chain(F_TRUE, g)
+    P = analysis.transition_matrix(F_TRUE, g)[np.ix_(order, order)]
+    x = np.random.default_rng(0).normal(size=len(F_TRUE))
+    np.testing.assert_allclose(analysis._matvec(f, q, p_stay, x), P @ x, atol=1e-12)
+
+
+@pytest.mark.parametrize('g', [None, G])
+def test_dense_and_matrix_free_agree(g):
+    np.testing.assert_allclose(
+        analysis.eigenvalues(F_TRUE, g, 'matrix_free'), analysis.eigenvalues(F_TRUE, g, 'dense'), atol=1e-12)
+    for target in [0, 2, -1]:
+        np.testing.assert_allclose(
+            analysis.mean_first_passage_times(F_TRUE, g, target, 'matrix_free'),
+            analysis.mean_first_passage_times(F_TRUE, g, target, 'dense'), rtol=1e-8)
+    dense, matrix_free = analysis.analyze(F_TRUE, g, 'dense'), analysis.analyze(F_TRUE, g, 'matrix_free')
+    for key in dense:
+        np.testing.assert_allclose(matrix_free[key], dense[key], rtol=1e-8)
+
+
+def test_stationary_distribution_of_fixed_weights():
+    # With a zero incrementor, the weights are fixed and the visit fractions approach the stationary distribution
+    params = {'n_steps': 200000, 'wl_delta': 0, 'wl_delta_cutoff': 0.01, 'wl_ratio': 0.8, 'wl_scale': 0.5, 'seed': 0}
+    sim = WL_Simulator(params, F_TRUE)
+    sim.g = G
+    sim.run()
+    np.testing.assert_array_equal(sim.g, G)
+    frac = np.bincount(sim.traj, minlength=len(F_TRUE)) / len(sim.traj)
+    np.testing.assert_allclose(frac, analysis.stationary_distribution(F_TRUE, G), atol=0.005)
+    results = analysis.analyze_simulator(sim)
+    np.testing.assert_allclose(results['stationary'], analysis.stationary_distribution(F_TRUE, G))
+
+
+def test_invalid_method():
+    with pytest.raises(ParameterError):
+        analysis.eigenvalues(F_TRUE, method='sparse')
@@ -0,0 +1,124 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the step-kernel backends of WL_Simulator (see utils/kernels.py). Without Numba, the
+kernels are tested uncompiled, which exercises the same code that Numba compiles.
+"""
+import types
+import pytest
+import numpy as np
+from sampling_simulator.utils.sum_tree import SumTree
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.utils import kernels
+from sampling_simulator.utils.exceptions import ParameterError
+
+F_TRUE = np.array([0, 1.5, 3, 2, 0.5, 4, 1, 2.5])
+PARAMS = {
+    'n_steps': 20000,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.01,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+}
+SEEDS = range(8)
+
+
+@pytest.fixture
+def uncompiled(monkeypatch):
+    """
+    Make the 'numba' backend available with the kernels running uncompiled.
+    """
+    monkeypatch.setattr(kernels, 'numba', types.SimpleNamespace(njit=lambda **kwargs: (lambda func: func)))
+    monkeypatch.setattr(kernels, '_compiled', {})
+
+
+def run(backend, seed, **params):
+    sim = WL_Simulator(dict(PARAMS, backend=backend, seed=seed, **params), F_TRUE)
+    sim.run()
+    return sim
+
+
+def test_resolve_backend():
+    with pytest.raises(ParameterError):
+        kernels.resolve_backend('cuda')
+    assert kernels.resolve_backend('python') == 'python'
+    assert kernels.resolve_backend('auto') == ('python' if kernels.numba is None else 'numba')
+    if kernels.numba is None:
+        with pytest.raises(ParameterError):
+            WL_Simulator(dict(PARAMS, backend='numba'), F_TRUE)
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'post_equil': 'fast'},
+    {'flatness_criterion': 'min_visits', 'wl_min_visits': 20, 'record_stride': 3},
+    {'proposal': 'sum_tree'},
+])
+def test_kernel_reproduces_reference(uncompiled, params):
+    # The kernel consumes the same random numbers in the same way as the reference, and the leaves of its sum
+    # tree are in the order of the states, so it maps them to the same states as both proposals
+    for seed in SEEDS[:2]:
+        ref, sim = run('python', seed, **params), run('numba', seed, **params)
+        assert sim.equil_time == ref.equil_time
+        np.testing.assert_array_equal(sim.traj, ref.traj)
+        np.testing.assert_allclose(sim.dg, ref.dg)
+        np.testing.assert_array_equal(sim.hist, ref.hist)
+        np.testing.assert_allclose(sim.g, ref.g)
+        assert sim.state == ref.state
+        assert sim.rng.random() == ref.rng.random()
+
+
+def test_kernel_split_runs(uncompiled):
+    # Consecutive runs continue the same chain
+    ref = run('python', 0, n_steps=3000)
+    sim = WL_Simulator(dict(PARAMS, backend='numba', seed=0, n_steps=1000), F_TRUE)
+    for _ in range(3):
+        sim.run()
+    np.testing.assert_array_equal(sim.traj, ref.traj)
+    np.testing.assert_allclose(sim.g, ref.g)
+
+
+def test_unsupported_options_fall_back(uncompiled):
+    sim = WL_Simulator(dict(PARAMS, backend='numba', wl_schedule='1/t'), F_TRUE)
+    assert not sim._kernel_compatible()
+    sim.run()
+    assert len(sim.traj) == PARAMS['n_steps']
+
+
+def test_kernel_sum_tree():
+    # The sum tree is updated in every step and rebuilt with a new shift when its total weight drifts
+    f_true = np.array(F_TRUE)
+    g_raw = np.zeros(len(f_true))
+    sum_tree = SumTree(f_true)
+    tree, shift = np.array(sum_tree.tree), sum_tree.shift
+    u = np.random.default_rng(0).random(2 * 2000)
+    counts = np.zeros(len(f_true), dtype=np.int64)
+    traj, dg = np.empty(2000, dtype=int), np.empty(2000)
+    n_done, state, n_recorded, flat, n_accepted, shift = kernels.wl_segment(
+        f_true, g_raw, counts, 0, 1.0, u, traj, dg, 0, 1, kernels.CRITERION_RATIO, 0.8, 0, False, tree, shift)
+    assert n_done == n_recorded == counts.sum() == 2000 and not flat
+    assert shift > 100  # the weights of all states have decreased by much more than the range of the tree
+    size = len(tree) // 2
+    np.testing.assert_allclose(tree[size:size + len(f_true)], np.exp(shift - (f_true - g_raw)), rtol=1e-12)
+    np.testing.assert_array_equal(tree[size + len(f_true):], 0)
+    for j in range(1, size):
+        assert tree[j] == tree[2 * j] + tree[2 * j + 1]
+
+
+def test_kernel_reproduces_reference_compiled():
+    pytest.importorskip('numba')
+    # Numba compiles the arithmetic without fast-math and math.exp to the same libm call as Python
+    for seed in SEEDS[:4]:
+        for proposal in ['direct', 'sum_tree']:
+            ref, sim = run('python', seed, proposal=proposal), run('numba', seed, proposal=proposal)
+            assert sim.equil_time == ref.equil_time
+            np.testing.assert_array_equal(sim.traj, ref.traj)
+            np.testing.assert_allclose(sim.g, ref.g)
+            np.testing.assert_array_equal(sim.hist, ref.hist)
@@ -0,0 +1,91 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module benchmark.py.
+"""
+import copy
+from sampling_simulator import benchmark
+
+SUITE = {
+    'n_states': [10],
+    'n_steps': [100],
+    'layouts': [(2, 1), (4, 4)],  # the second layout has no overlap for 10 states
+    'eexe_n_states': [10],
+    'proposals': ['direct'],
+    'batch_n_walkers': [3],
+    'n_calls': 5,
+    'repeats': 1,
+}
+
+
+def test_run_benchmarks():
+    report = benchmark.run_benchmarks(SUITE)
+    assert set(report['results']) == {
+        'wl_run[n_states=10,n_steps=100,proposal=direct]',
+        'batch_run[n_states=10,n_walkers=3,n_steps=100]',
+        'check_flatness[n_states=10]',
+        'free2prob[n_states=10]',
+        'eexe_run[n_states=10,n_sim=2,s=1,n_steps=100]',
+        'combine_weights[n_states=10,n_sim=2,s=1]',
+    }
+    for result in report['results'].values():
+        assert result['wall_time'] > 0
+        assert result['peak_memory_mb'] >= 0
+    assert report['results']['wl_run[n_states=10,n_steps=100,proposal=direct]']['steps_per_sec'] > 0
+
+    report = benchmark.run_benchmarks(SUITE, select='free2prob')
+    assert list(report['results']) == ['free2prob[n_states=10]']
+
+
+def test_batch_speedup():
+    # The batched engine is at least an order of magnitude faster than independent runs for many walkers
+    result = benchmark.bench_batch_run(10, 1000, 200)
+    assert result['speedup'] >= 10
+    assert result['steps_per_sec'] == 1000 * 200 / result['wall_time']
+
+
+def test_compare():
+    baseline = {'results': {
+        'a': {'steps_per_sec': 100, 'peak_memory_mb': 1.0},
+        'b': {'calls_per_sec': 100, 'peak_memory_mb': 1.0},
+    }}
+    report = copy.deepcopy(baseline)
+    report['results']['c'] = {'steps_per_sec': 1, 'peak_memory_mb': 1.0}  # not in the baseline
+    assert benchmark.compare(report, baseline) == []
+
+    report['results']['a']['steps_per_sec'] = 85
+    report['results']['b']['peak_memory_mb'] = 1.5
+    assert benchmark.compare(report, baseline) == [('b', 'peak_memory_mb', 1.0, 1.5)]
+    assert benchmark.compare(report, baseline, tolerance=0.1) == [
+        ('a', 'steps_per_sec', 100, 85),
+        ('b', 'peak_memory_mb', 1.0, 1.5),
+    ]
+
+
+def test_main(tmp_path, capsys):
+    fname = str(tmp_path / 'baseline.json')
+    assert benchmark.main(['-q', '-k', 'free2prob[n_states=10]', '-s', fname, '-n']) == 0
+    assert 'regression' not in capsys.readouterr().out
+    baseline = benchmark.load_report(fname)
+    assert list(baseline['results']) == ['free2prob[n_states=10]']
+
+    baseline['results']['free2prob[n_states=10]']['calls_per_sec'] *= 1e6
+    benchmark.save_report(baseline, fname)
+    assert benchmark.main(['-q', '-k', 'free2prob[n_states=10]', '-b', fname]) == 1
+    assert '1 regression(s) detected' in capsys.readouterr().out
+
+
+def test_reference_baseline():
+    # The shipped baseline covers all cases of the quick suite
+    baseline = benchmark.load_report(benchmark.BASELINE)
+    names = [name for name, _ in benchmark.iter_cases(benchmark.SUITES['quick'])]
+    assert set(baseline['results']) == set(names)
+    for name in names:
+        assert baseline['results'][name]['peak_memory_mb'] >= 0
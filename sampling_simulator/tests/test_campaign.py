@@ -0,0 +1,126 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module campaign.py.
+"""
+import os
+import json
+import pytest
+import numpy as np
+from sampling_simulator import campaign
+from sampling_simulator.results import ResultsStore
+from sampling_simulator.utils.exceptions import ParameterError
+
+F_TRUE = [0, 1.5, 3, 2]
+GRID = {
+    'n_steps': 500,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.01,
+    'wl_ratio': [0.7, 0.8],
+    'wl_scale': 0.5,
+}
+SEEDS = [0, 1]
+
+
+def test_expand_grid():
+    points = campaign.expand_grid({'a': [1, 2], 'b': 'x', 'c': [3, 4, 5]})
+    assert len(points) == 6
+    assert points[0] == {'a': 1, 'b': 'x', 'c': 3}
+    assert points[-1] == {'a': 2, 'b': 'x', 'c': 5}
+    assert campaign.expand_grid({'a': 1}) == [{'a': 1}]
+
+
+def test_run_key():
+    params = campaign.expand_grid(GRID)[0]
+    key = campaign.run_key('wl', params, F_TRUE, 0)
+    assert key == campaign.run_key('wl', dict(reversed(list(params.items()))), np.array(F_TRUE), 0)
+    assert key == campaign.run_key('wl', dict(params, verbose=True, n_workers=2), F_TRUE, 0)
+    assert key != campaign.run_key('wl', params, F_TRUE, 1)
+    assert key != campaign.run_key('eexe', params, F_TRUE, 0)
+    assert key != campaign.run_key('wl', dict(params, n_steps=501), F_TRUE, 0)
+    with pytest.raises(ParameterError):
+        campaign.run_key('wl', dict(params, wl_schedule=lambda t, wl_delta, flat: wl_delta), F_TRUE, 0)
+
+
+def test_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    results = campaign.run_campaign(GRID, F_TRUE, SEEDS, 'wl', cache_dir)
+    assert len(results) == 4 and not any(result['cached'] for result in results)
+    assert len(os.listdir(cache_dir)) == 4
+    assert len({result['key'] for result in results}) == 4
+
+    # Re-running the campaign only computes the missing runs
+    computed = []
+    run_point = campaign.run_point
+    monkeypatch.setattr(campaign, 'run_point', lambda *args: computed.append(args) or run_point(*args))
+    rerun = campaign.run_campaign(dict(GRID, wl_ratio=[0.7, 0.8, 0.9]), F_TRUE, SEEDS, 'wl', cache_dir)
+    assert [result['cached'] for result in rerun] == [True, True, True, True, False, False]
+    assert [args[1]['wl_ratio'] for args in computed] == [0.9, 0.9]
+    for result, cached in zip(results, rerun):
+        assert cached['key'] == result['key']
+        assert cached['summary'] == result['summary']
+
+
+def test_results_dir(tmp_path):
+    # The cached runs are appended to a new store from their summaries
+    cache_dir, results_dir = str(tmp_path / 'cache'), str(tmp_path / 'results')
+    results = campaign.run_campaign(GRID, F_TRUE, SEEDS[:1], 'wl', cache_dir)
+    rerun = campaign.run_campaign(dict(GRID, wl_ratio=[0.7, 0.8, 0.9]), F_TRUE, SEEDS[:1], 'wl', cache_dir, results_dir=results_dir)  # noqa: E501
+    store = ResultsStore(results_dir)
+    assert sorted(store.run_ids) == sorted(result['key'] for result in rerun)
+    for result in rerun:
+        row = store.row(result['key'])
+        assert row['rmse'] == pytest.approx(result['summary']['rmse'])
+        assert row['wall_time'] == pytest.approx(result['summary']['wall_time'])
+        data = store.run(result['key'])
+        np.testing.assert_allclose(data['g'], result['summary']['g'])
+        assert ('traj' in data) == (not result['cached'])
+    assert store.entry(results[0]['key'])['params']['seed'] == SEEDS[0]
+
+    # Nothing is appended twice
+    campaign.run_campaign(GRID, F_TRUE, SEEDS[:1], 'wl', cache_dir, results_dir=results_dir)
+    assert len(ResultsStore(results_dir)) == 3
+
+
+def test_unique_paths(tmp_path):
+    grid = dict(GRID, wl_ratio=0.8, record_path=str(tmp_path / 'run'))
+    results = campaign.run_campaign(grid, F_TRUE, SEEDS, 'wl', str(tmp_path / 'cache'))
+    for result in results:
+        params = campaign.run_params('wl', result['params'], F_TRUE, result['seed'])
+        assert params['record_path'] == f"{tmp_path / 'run'}_{result['key'][:12]}"
+        traj = np.load(f"{params['record_path']}_traj.npy")
+        assert len(traj) == GRID['n_steps']
+    assert len([f for f in os.listdir(tmp_path) if f.endswith('_traj.npy')]) == 2
+    params = campaign.run_params('eexe', {'checkpoint_file': 'out/ckpt.npz'}, F_TRUE, 0)
+    assert params['checkpoint_file'].startswith('out/ckpt_') and params['checkpoint_file'].endswith('.npz')
+
+
+def test_invalid_campaign(tmp_path):
+    with pytest.raises(ParameterError):
+        campaign.run_campaign(GRID, F_TRUE, SEEDS, 'metadynamics', str(tmp_path))
+    with pytest.raises(ParameterError):
+        campaign.run_campaign(dict(GRID, n_workers=2), F_TRUE, SEEDS, 'eexe', str(tmp_path), n_workers=2)
+
+
+def test_cli(tmp_path, capsys):
+    np.savetxt(tmp_path / 'f_true.txt', F_TRUE)
+    config = {'simulator': 'wl', 'f_true': str(tmp_path / 'f_true.txt'), 'grid': GRID, 'seeds': SEEDS}
+    with open(tmp_path / 'campaign.json', 'w') as fh:
+        json.dump(config, fh)
+    args = ['-c', str(tmp_path / 'campaign.json'), '-d', str(tmp_path / 'cache'), '-o', str(tmp_path / 'results.json')]
+    assert campaign.main(args) == 0
+    assert '4 runs in the campaign, 4 of which are not cached.' in capsys.readouterr().out
+    with open(tmp_path / 'results.json') as fh:
+        results = json.load(fh)
+    assert len(results) == 4
+    cached = campaign.run_campaign(GRID, F_TRUE, SEEDS, 'wl', str(tmp_path / 'cache'))
+    assert [result['summary'] for result in results] == [result['summary'] for result in cached]
+    assert campaign.main(args) == 0
+    assert '4 runs in the campaign, 0 of which are not cached.' in capsys.readouterr().out
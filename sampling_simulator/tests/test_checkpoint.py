@@ -0,0 +1,130 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module utils/checkpoint.py and the deterministic resumption of simulations.
+"""
+import pytest
+import numpy as np
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.observers import Observer
+from sampling_simulator.utils import checkpoint
+from sampling_simulator.utils.exceptions import CheckpointError
+
+WL_PARAMS = {
+    'n_steps': 500,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.001,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'seed': 3,
+}
+EEXE_PARAMS = dict(WL_PARAMS, n_sim=3, s=2, n_iters=6, n_steps=200, w_combine=True)
+F_TRUE = np.linspace(0, 4, 9)
+
+
+class Interrupt(Exception):
+    pass
+
+
+class Interrupter(Observer):
+    """
+    Interrupts a simulation at the start of the given iteration.
+    """
+    def __init__(self, iteration):
+        super().__init__()
+        self.iteration = iteration
+
+    def on_iteration_start(self, sim, i):
+        if i == self.iteration:
+            raise Interrupt
+
+
+def assert_same_replica(a, b):
+    np.testing.assert_array_equal(a.g, b.g)
+    np.testing.assert_array_equal(a.hist, b.hist)
+    np.testing.assert_array_equal(a.traj, b.traj)
+    np.testing.assert_array_equal(a.dg, b.dg)
+    assert a.state == b.state
+    assert a.wl_delta == b.wl_delta
+    assert a.equil_time == b.equil_time
+    assert a.rng.random() == b.rng.random()
+
+
+def test_resume_wl(tmp_path):
+    ref = WL_Simulator(WL_PARAMS, F_TRUE)
+    for _ in range(3):
+        ref.run()
+    sim = WL_Simulator(WL_PARAMS, F_TRUE)
+    sim.run()
+    sim.save_checkpoint(str(tmp_path / 'wl.npz'))
+    sim = WL_Simulator.load_checkpoint(str(tmp_path / 'wl.npz'))
+    sim.run()
+    sim.run()
+    assert_same_replica(sim, ref)
+    assert sim.n_steps_done == ref.n_steps_done
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_resume_eexe(tmp_path, n_workers):
+    ref = EnsembleEXE(dict(EEXE_PARAMS, n_workers=n_workers), F_TRUE)
+    ref.run()
+    assert ref.iteration > 3
+
+    fname = str(tmp_path / 'eexe.npz')
+    params = dict(EEXE_PARAMS, n_workers=n_workers, checkpoint_file=fname, checkpoint_every=1)
+    with pytest.raises(Interrupt):
+        EnsembleEXE(dict(params, observers=[Interrupter(3)]), F_TRUE).run()
+    eexe = EnsembleEXE.load_checkpoint(fname)
+    assert eexe.iteration == 3
+    eexe.run()
+
+    assert eexe.iteration == ref.iteration
+    assert eexe.equil_time_all == ref.equil_time_all
+    np.testing.assert_array_equal(eexe.g_vec, ref.g_vec)
+    assert eexe.rmse == ref.rmse
+    for a, b in zip(eexe.simulators, ref.simulators):
+        assert_same_replica(a, b)
+
+
+@pytest.mark.parametrize('content', [
+    b'',
+    b'not a checkpoint',
+    'truncated',
+    'npy',
+])
+def test_corrupted_checkpoint(tmp_path, content):
+    fname = str(tmp_path / 'wl.npz')
+    if content == 'truncated':
+        WL_Simulator(WL_PARAMS, F_TRUE).save_checkpoint(fname)
+        with open(fname, 'rb') as fh:
+            data = fh.read()
+        with open(fname, 'wb') as fh:
+            fh.write(data[:len(data) // 2])
+    elif content == 'npy':
+        with open(fname, 'wb') as fh:
+            np.save(fh, np.arange(3))
+    else:
+        with open(fname, 'wb') as fh:
+            fh.write(content)
+    with pytest.raises(CheckpointError):
+        WL_Simulator.load_checkpoint(fname)
+
+
+def test_checkpoint_class_and_version(tmp_path):
+    fname = str(tmp_path / 'wl.npz')
+    WL_Simulator(WL_PARAMS, F_TRUE).save_checkpoint(fname)
+    with pytest.raises(CheckpointError, match='not EnsembleEXE'):
+        EnsembleEXE.load_checkpoint(fname)
+    checkpoint.write_checkpoint(fname, 'WL_Simulator', {}, {})
+    meta, arrays = checkpoint.read_checkpoint(fname, 'WL_Simulator')
+    assert meta == {} and arrays == {}
+    with pytest.raises(FileNotFoundError):
+        checkpoint.read_checkpoint(str(tmp_path / 'missing.npz'), 'WL_Simulator')
@@ -0,0 +1,122 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module utils/energy.py and the energy-coupled sampling of the simulators.
+"""
+import pickle
+import pytest
+import numpy as np
+from sampling_simulator import analysis
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.utils.energy import EnergyTable, gaussian_table
+from sampling_simulator.utils.exceptions import ParameterError
+
+F_TRUE = np.array([0, 1.5, 3, 2, 0.5, 4])
+PARAMS = {
+    'n_steps': 20000,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.01,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'seed': 3,
+}
+
+
+@pytest.fixture
+def table_file(tmp_path):
+    fname = str(tmp_path / 'table.npy')
+    gaussian_table(fname, 1000, 0.5, n_states=len(F_TRUE), tau=5, seed=0, chunk_size=300)
+    return fname
+
+
+def test_gaussian_table(tmp_path):
+    table = gaussian_table(str(tmp_path / 'table.npy'), 20000, [0, 1, 2], tau=0, seed=0, chunk_size=3000)
+    assert isinstance(table, np.memmap) and not table.flags.writeable
+    assert table.shape == (20000, 3)
+    np.testing.assert_array_equal(table[:, 0], 0)
+    np.testing.assert_allclose(table.std(axis=0), [0, 1, 2], rtol=0.03)
+
+    # The frames of a correlated table decorrelate over about tau frames
+    table = gaussian_table(str(tmp_path / 'correlated.npy'), 20000, 1, n_states=2, tau=10, seed=0, chunk_size=3000)
+    x = table[:, 1]
+    assert np.corrcoef(x[:-10], x[10:])[0, 1] == pytest.approx(np.exp(-1), abs=0.05)
+
+
+def test_memmap_loading(table_file):
+    data = np.load(table_file)
+    table = EnergyTable(table_file, chunk_size=64)
+    assert isinstance(table.data, np.memmap)
+    rows = [table.next_row() for _ in range(2500)]  # wraps around the end of the table twice
+    np.testing.assert_array_equal(rows, data[np.arange(2500) % 1000])
+    assert table.pos == 500
+
+    # Rows of a subset of the columns, starting at an offset
+    table = EnergyTable(table_file, chunk_size=64, columns=[2, 5], offset=990)
+    rows = np.concatenate([table.next_rows(100) for _ in range(30)])
+    assert len(rows) < 3000  # blocks end at the ends of chunks
+    np.testing.assert_array_equal(rows, data[(990 + np.arange(len(rows))) % 1000, 2:5])
+
+    # A pickled table re-opens the file and continues from the same frame
+    table.seek(123)
+    table.next_row()
+    copy = pickle.loads(pickle.dumps(table))
+    assert copy._data is None and len(pickle.dumps(table)) < data.nbytes
+    np.testing.assert_array_equal(copy.next_row(), data[124, 2:5])
+    np.testing.assert_array_equal(table.next_row(), data[124, 2:5])
+
+
+def test_invalid_tables(table_file):
+    with pytest.raises(ParameterError):
+        EnergyTable(np.zeros(10))
+    with pytest.raises(ParameterError):
+        WL_Simulator(dict(PARAMS, energy_table=table_file), F_TRUE[:4])
+    WL_Simulator(dict(PARAMS, energy_table=table_file, energy_columns=[1, 5]), F_TRUE[:4])
+
+
+@pytest.mark.parametrize('params', [{}, {'post_equil': 'fast'}, {'energy_chunk_size': 7}])
+def test_zero_table_reproduces_chain(params):
+    # With ΔU = 0, the energy-coupled chain consumes the same random numbers in the same way
+    ref = WL_Simulator(dict(PARAMS, **params), F_TRUE)
+    ref.run()
+    sim = WL_Simulator(dict(PARAMS, energy_table=np.zeros((1000, len(F_TRUE))), **params), F_TRUE)
+    sim.run()
+    assert sim.equil_time == ref.equil_time
+    np.testing.assert_array_equal(sim.traj, ref.traj)
+    np.testing.assert_array_equal(sim.g, ref.g)
+    np.testing.assert_array_equal(sim.hist, ref.hist)
+    assert sim.rng.random() == ref.rng.random()
+
+
+def test_file_and_array_tables_agree(table_file):
+    sims = []
+    for table in [table_file, np.load(table_file)]:
+        sims.append(WL_Simulator(dict(PARAMS, energy_table=table, energy_chunk_size=100), F_TRUE))
+        sims[-1].run()
+    np.testing.assert_array_equal(sims[0].traj, sims[1].traj)
+    np.testing.assert_array_equal(sims[0].g, sims[1].g)
+
+
+def test_energy_coupled_acceptance():
+    dU = np.array([0, 0.5, -1, 2, 0, 1])
+    sim = WL_Simulator(dict(PARAMS, energy_table=dU[None, :]), F_TRUE)
+    sim._dU = dU
+    sim.state = 0
+    assert sim.calc_prob_acc(1) == pytest.approx(np.exp(-2))
+    assert sim.calc_prob_acc(2) == pytest.approx(np.exp(-2))
+    assert sim.calc_prob_acc(4) == pytest.approx(np.exp(-0.5))
+    sim.state = 3
+    assert sim.calc_prob_acc(2) == 1
+
+    # With fixed weights, a constant ΔU shifts the stationary distribution like a shift of f_true
+    table = np.tile(dU, (4096, 1))
+    sim = WL_Simulator(dict(PARAMS, n_steps=200000, wl_delta=0, post_equil='fast', energy_table=table), F_TRUE)
+    sim.run()
+    frac = np.bincount(sim.traj, minlength=len(F_TRUE)) / len(sim.traj)
+    np.testing.assert_allclose(frac, analysis.stationary_distribution(F_TRUE + dU), atol=0.005)
@@ -0,0 +1,150 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module ensemble_exe.py.
+"""
+import pytest
+import numpy as np
+from sampling_simulator.utils import utils
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.observers import Observer, MemoryAggregator
+
+F_TRUE = np.linspace(0, 3, 6)
+PARAMS = {
+    'n_sim': 2,
+    's': 2,
+    'n_iters': 3,
+    'n_steps': 500,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.001,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'seed': 1,
+}
+
+
+def test_equilibrated_in_first_iteration():
+    # A single flatness reset brings the incrementor below the cutoff in every replica
+    eexe = EnsembleEXE(dict(PARAMS, n_steps=5000, wl_delta_cutoff=0.6, wl_ratio=0.5), F_TRUE)
+    eexe.run()
+    assert eexe.iteration == 1
+    assert eexe.equil_all == [True, True]
+    assert eexe.g_vec is not None and np.isfinite(eexe.g_vec).all()
+    assert np.isfinite(eexe.rmse)
+
+
+class FirstCombination(Observer):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def on_combine(self, ensemble, iteration, weights, weights_modified, g_vec):
+        self.records.append((list(ensemble.n_segments), np.array(weights), np.array(g_vec)))
+
+
+def test_async_combination_of_published_weights():
+    # Replicas that have not finished a segment yet do not contribute their initial weights to the profile
+    obs = FirstCombination()
+    eexe = EnsembleEXE(dict(PARAMS, scheduler='async', n_iters=5, observers=[obs]), F_TRUE)
+    eexe.run()
+    n_segments, weights, g_vec = obs.records[0]
+    assert n_segments == [1, 0]
+    np.testing.assert_allclose(g_vec[:eexe.n_sub], weights[0])
+    for n_segments, weights, g_vec in obs.records:
+        assert np.isfinite(g_vec).all()
+    for sim in eexe.simulators:
+        assert np.isfinite(sim.g).all()
+    assert np.isfinite(eexe.rmse)
+
+
+def test_async_equilibration_times():
+    # The equilibration times are counted from the start of the simulation, not of the last segment
+    memory = MemoryAggregator()
+    params = dict(PARAMS, scheduler='async', n_iters=100, n_steps=100, wl_delta_cutoff=0.01)
+    eexe = EnsembleEXE(dict(params, observers=[memory]), F_TRUE)
+    eexe.run()
+    assert eexe.equil_all == [True, True]
+    assert sorted(memory.equilibrations) == [(j, eexe.equil_time_all[j]) for j in range(eexe.n_sim)]
+    assert max(eexe.equil_time_all) >= params['n_steps']
+    for j, sim in enumerate(eexe.simulators):
+        assert sim.n_steps_done - sim.n_steps <= eexe.equil_time_all[j] < sim.n_steps_done
+
+
+def exchange_pair(g, local_states, n_attempts):
+    """
+    Attempt exchanges between two replicas with fixed weights, resetting their states before each attempt,
+    and return the ensemble and the fraction of accepted exchanges.
+    """
+    eexe = EnsembleEXE(PARAMS, F_TRUE)
+    for sim, g_sim in zip(eexe.simulators, g):
+        sim.g = g_sim
+    n_accepted = 0
+    for _ in range(2 * n_attempts):  # only the sweeps of pairs (j, j + 1) with even j have a pair
+        for sim, state in zip(eexe.simulators, local_states):
+            sim.state = state
+        n_accepted += len(eexe.attempt_exchanges())
+    return eexe, n_accepted / n_attempts
+
+
+def test_exchange_acceptance():
+    # With the state ranges 0-3 and 2-5, the replicas at the global states 2 and 3 can swap their states
+    g = [np.array([0, 0.8, 1.5, 2.5]), np.array([0, 0.2, 1.4, 1.8])]
+    f = [F_TRUE[:4] - g[0], F_TRUE[2:] - g[1]]
+    n_attempts = 4000
+    eexe, ratio = exchange_pair(g, [3, 0], n_attempts)
+    delta = f[0][2] + f[1][1] - f[0][3] - f[1][0]
+    p_acc = min(1, np.exp(-delta))
+    assert 0 < p_acc < 1
+    assert abs(ratio - p_acc) < 4 * np.sqrt(p_acc * (1 - p_acc) / n_attempts)
+
+    # Detailed balance: the ratio of the acceptance probabilities of a swap and its reverse is that of the
+    # stationary probabilities of the joint states, which are proportional to exp(-f_0(x_0) - f_1(x_1))
+    _, ratio_reverse = exchange_pair(g, [2, 1], n_attempts)
+    assert ratio_reverse == 1
+    assert ratio / ratio_reverse == pytest.approx(np.exp(-(f[0][2] + f[1][1]) + (f[0][3] + f[1][0])), rel=0.1)
+
+    stats = eexe.exchange_stats()
+    assert stats['attempts'] == [n_attempts]
+    assert stats['swappable'] == [n_attempts]
+    assert stats['accepted'] == [round(ratio * n_attempts)]
+    assert stats['acceptance_ratio'] == stats['swappable_acceptance_ratio'] == [ratio]
+
+
+def test_exchange_stats():
+    # Replicas outside the overlap cannot swap
+    eexe, ratio = exchange_pair([np.zeros(4), np.zeros(4)], [0, 1], 10)
+    assert ratio == 0
+    stats = eexe.exchange_stats()
+    assert stats['attempts'] == [10] and stats['swappable'] == [0] and stats['accepted'] == [0]
+    assert stats['acceptance_ratio'] == [0] and np.isnan(stats['swappable_acceptance_ratio'][0])
+
+    # In a run, the pairs with even and odd j are attempted in alternating sweeps
+    eexe = EnsembleEXE(dict(PARAMS, n_sim=3, s=1, exchange_interval=50), F_TRUE)
+    eexe.run()
+    stats = eexe.exchange_stats()
+    n_sweeps = eexe.n_exchange_sweeps
+    assert n_sweeps > 0
+    assert stats['attempts'] == [(n_sweeps + 1) // 2, n_sweeps // 2]
+    for j in range(2):
+        assert 0 < stats['accepted'][j] <= stats['swappable'][j] <= stats['attempts'][j]
+        assert stats['acceptance_ratio'][j] == stats['accepted'][j] / stats['attempts'][j]
+
+
+def test_rmse_of_equilibrated_run():
+    # The profile (and thus the RMSE) of a run that equilibrates after the first iteration is that of the
+    # last combination
+    obs = FirstCombination()
+    eexe = EnsembleEXE(dict(PARAMS, n_iters=50, n_steps=200, wl_delta_cutoff=0.05, observers=[obs]), F_TRUE)
+    eexe.run()
+    assert eexe.equil_all == [True, True] and eexe.iteration > 1
+    assert len(obs.records) == eexe.iteration - 1
+    np.testing.assert_array_equal(eexe.g_vec, obs.records[-1][2])
+    assert eexe.rmse == utils.calc_rmse(obs.records[-1][2], F_TRUE)
+    assert eexe.rmse == pytest.approx(0.2099223257, rel=1e-8)
@@ -0,0 +1,83 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module utils/histogram.py.
+"""
+import pytest
+import numpy as np
+from sampling_simulator.utils.histogram import FlatnessHistogram, RatioCriterion, MinVisitsCriterion
+
+
+def baseline_flat(hist, wl_ratio):
+    """
+    The element-wise flatness check of the original WL_Simulator.check_flatness.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        N_ratio = hist / hist.mean()
+        return bool(np.all(N_ratio > wl_ratio) and np.all(1 / N_ratio > wl_ratio))
+
+
+def check_consistent(hist, ref):
+    np.testing.assert_array_equal(hist.counts, ref)
+    assert hist.total == ref.sum()
+    assert hist.min == ref.min()
+    assert hist.max == ref.max()
+
+
+@pytest.mark.parametrize('n_bins', [1, 2, 7])
+@pytest.mark.parametrize('wl_ratio', [0.5, 0.8])
+def test_ratio_matches_baseline(n_bins, wl_ratio):
+    rng = np.random.default_rng(n_bins)
+    p = rng.dirichlet(np.ones(n_bins) * 5)  # uneven visits, so the minimum bin changes over time
+    hist = FlatnessHistogram(n_bins)
+    ref = np.zeros(n_bins)
+    criterion = RatioCriterion(wl_ratio)
+    n_flat = 0
+    for i in rng.choice(n_bins, size=5000, p=p):
+        hist.add(i)
+        ref[i] += 1
+        check_consistent(hist, ref)
+        flat = criterion(hist)
+        assert flat == baseline_flat(ref, wl_ratio)
+        if flat:
+            n_flat += 1
+            hist.reset()
+            ref[:] = 0
+    assert n_flat > 0
+
+
+def test_min_visits():
+    rng = np.random.default_rng(0)
+    hist = FlatnessHistogram(5)
+    ref = np.zeros(5)
+    criterion = MinVisitsCriterion(3)
+    for _ in range(2000):
+        i = rng.integers(5)
+        hist.add(i)
+        ref[i] += 1
+        assert criterion(hist) == (ref.min() >= 3)
+        if criterion(hist):
+            hist.reset()
+            ref[:] = 0
+
+
+def test_set_counts():
+    rng = np.random.default_rng(1)
+    hist = FlatnessHistogram(6)
+    for _ in range(20):
+        ref = rng.integers(0, 4, size=6).astype(float)
+        hist.set_counts(ref)
+        check_consistent(hist, ref)
+        for _ in range(30):
+            i = rng.integers(6)
+            hist.add(i)
+            ref[i] += 1
+            check_consistent(hist, ref)
+            assert RatioCriterion(0.7)(hist) == baseline_flat(ref, 0.7)
@@ -0,0 +1,61 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Tests checking that importing the package and running simulations do not import matplotlib.
+The checks run in fresh interpreters since other tests might have imported matplotlib.
+"""
+import sys
+import json
+import subprocess
+
+HEADLESS_RUN = """
+import sys
+import time
+import json
+t0 = time.perf_counter()
+import sampling_simulator  # noqa: F401
+from sampling_simulator.ensemble_exe import EnsembleEXE
+t_import = time.perf_counter() - t0
+params = {'n_steps': 100, 'wl_delta': 10, 'wl_delta_cutoff': 0.001, 'wl_ratio': 0.7, 'wl_scale': 0.5,
+          'n_sim': 2, 's': 1, 'n_iters': 2, 'seed': 0}
+EnsembleEXE(params, [0, 1, 2, 3]).run()
+print(json.dumps({'t_import': t_import, 'modules': sorted(sys.modules)}))
+"""
+
+
+def run_headless():
+    out = subprocess.run([sys.executable, '-c', HEADLESS_RUN], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_import_sampling_simulator():
+    out = subprocess.run(
+        [sys.executable, '-c', 'import sys, sampling_simulator; print(sorted(sys.modules))'],
+        capture_output=True, text=True, check=True).stdout
+    assert 'matplotlib' not in out
+    assert 'numpy' not in out  # the subpackages are only imported when used
+
+
+def test_headless_run():
+    result = run_headless()
+    modules = [m for m in result['modules'] if m.split('.')[0] == 'matplotlib']
+    assert modules == []
+    assert result['t_import'] < 2  # NumPy dominates, which takes a fraction of a second
+
+
+def test_plotting_imports_matplotlib():
+    code = (
+        "import sys, matplotlib; matplotlib.use('Agg'); "
+        "from sampling_simulator.wang_landau_algorithm import WL_Simulator; "
+        "WL_Simulator.plot_timeseries([0, 1, 2], 'dg'); "
+        "print('matplotlib.pyplot' in sys.modules)"
+    )
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == 'True'
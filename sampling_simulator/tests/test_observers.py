@@ -0,0 +1,147 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module observers.py.
+"""
+import json
+import pytest
+import numpy as np
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.observers import Observer, MemoryAggregator, FileStreamer, ConvergenceTracer
+
+F_TRUE = np.linspace(0, 4, 9)
+PARAMS = {
+    'n_sim': 3,
+    's': 2,
+    'n_iters': 4,
+    'n_steps': 300,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.01,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'w_combine': True,
+    'seed': 5,
+}
+
+
+class StepCounter(Observer):
+    def __init__(self):
+        super().__init__()
+        self.n_steps = 0
+
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        self.n_steps += 1
+
+
+def test_step_only_observer():
+    # Observers without iteration-level hooks are not called upon combination
+    obs = StepCounter()
+    eexe = EnsembleEXE(dict(PARAMS, observers=[obs]), F_TRUE)
+    eexe.run()
+    assert obs.n_steps == PARAMS['n_sim'] * PARAMS['n_steps'] * eexe.iteration
+
+
+def test_step_records_state_before_move(tmp_path):
+    memory = MemoryAggregator()
+    streamer = FileStreamer(str(tmp_path / 'records.jsonl'))
+    params = {k: PARAMS[k] for k in ['wl_delta', 'wl_delta_cutoff', 'wl_ratio', 'wl_scale', 'seed']}
+    sim = WL_Simulator(dict(params, n_steps=1, observers=[memory, streamer]), F_TRUE)
+    states = [sim.state]
+    for _ in range(50):
+        sim.run()
+        states.append(sim.state)
+    streamer.close()
+    with open(streamer.fname) as fh:
+        records = [json.loads(line) for line in fh]
+    assert states[:-1] != states[1:]
+    assert [r[2] for r in memory.steps] == states[:-1]
+    assert [r['state'] for r in records if r['event'] == 'step'] == states[:-1]
+
+
+def test_convergence_tracer_merge():
+    # The records inherited by a copy of the tracer are not duplicated
+    tracer = ConvergenceTracer()
+    tracer.traces = {'a': [(1, 0.1, 1.0)], 'ensemble': [(1, 0.1, 1.0)]}
+    copy = ConvergenceTracer()
+    copy.traces = {'a': [(1, 0.1, 1.0), (2, 0.2, 0.5)], 'b': [(2, 0.2, 0.5)], 'ensemble': [(1, 0.1, 1.0)]}
+    tracer.traces['ensemble'].append((2, 0.3, 0.4))
+    tracer.merge(copy)
+    assert tracer.traces == {
+        'a': [(1, 0.1, 1.0), (2, 0.2, 0.5)],
+        'b': [(2, 0.2, 0.5)],
+        'ensemble': [(1, 0.1, 1.0), (2, 0.3, 0.4)],
+    }
+
+
+def run(tmp_path, n_workers):
+    memory = MemoryAggregator()
+    streamer = FileStreamer(str(tmp_path / f'records_{n_workers}.jsonl'), stride=10)
+    eexe = EnsembleEXE(dict(PARAMS, n_workers=n_workers, observers=[memory, streamer]), F_TRUE)
+    eexe.run()
+    streamer.close()
+    with open(streamer.fname) as fh:
+        records = [json.loads(line) for line in fh]
+    return eexe, memory, records
+
+
+@pytest.mark.parametrize('scheduler', ['sync', 'async'])
+def test_parallel_observers(tmp_path, scheduler):
+    # The records made in the worker processes reach the observers in the parent process
+    PARAMS['scheduler'] = scheduler
+    try:
+        serial, memory_serial, records_serial = run(tmp_path, 1)
+        parallel, memory, records = run(tmp_path, 2)
+    finally:
+        del PARAMS['scheduler']
+    assert len(memory.steps) == sum(sim.n_steps_done for sim in parallel.simulators) > 0
+    assert memory.n_observed == len(memory.steps)
+    assert len(memory.flatness_resets) > 0
+    assert sorted(label for label, _ in memory.equilibrations) == [j for j in range(3) if parallel.equil_all[j]]
+    assert len(memory.g_vecs) > 0
+    for sim in parallel.simulators:
+        assert sim.observers[0] is memory
+    step_records = [r for r in records if r['event'] == 'step']
+    assert len(step_records) == len([r for r in records_serial if r['event'] == 'step']) or scheduler == 'async'
+    assert {r['label'] for r in step_records} == {0, 1, 2}
+    if scheduler == 'sync':
+        # The same events are recorded as in the serial mode, grouped by replica
+        assert sorted(memory.steps) == sorted(memory_serial.steps)
+        assert sorted(memory.flatness_resets) == sorted(memory_serial.flatness_resets)
+        assert memory.iterations == memory_serial.iterations
+        key = lambda r: json.dumps(r, sort_keys=True)  # noqa: E731
+        assert sorted(records, key=key) == sorted(records_serial, key=key)
+
+
+def test_convergence_tracer():
+    # The tracer does not observe steps, so the fast path after equilibration is still used
+    tracer = ConvergenceTracer()
+    assert not tracer.observes('on_step')
+    params = {k: PARAMS[k] for k in ['wl_delta', 'wl_delta_cutoff', 'wl_ratio', 'wl_scale', 'seed']}
+    sim = WL_Simulator(dict(params, n_steps=5000, post_equil='fast', profile=True, observers=[tracer]), F_TRUE)
+    sim.run()
+    sim.run()
+    assert sim.equil and sim.stats.calls('run_frozen') > 0
+    trace = tracer.traces[sim.label]
+    steps = [record[0] for record in trace]
+    assert steps == sorted(set(steps))
+    assert len(trace) > 2 and 5000 in steps and steps[-1] == 10000
+    rmse = np.sqrt(np.mean((sim.g - (F_TRUE - F_TRUE[0])) ** 2))
+    assert trace[-1][2] == pytest.approx(rmse)
+    first = tracer.time_to_rmse(trace[-1][2], label=sim.label)
+    assert first is not None and first[2] <= trace[-1][2]
+    assert tracer.time_to_rmse(-1, label=sim.label) is None
+
+    # For EEXE simulations, the combined profile is traced as well
+    tracer = ConvergenceTracer()
+    eexe = EnsembleEXE(dict(PARAMS, observers=[tracer]), F_TRUE)
+    eexe.run()
+    assert 0 < len(tracer.traces['ensemble']) <= eexe.iteration
+    assert set(tracer.traces) == {0, 1, 2, 'ensemble'}
@@ -0,0 +1,86 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module parallel.py.
+"""
+import pytest
+import numpy as np
+from sampling_simulator.parallel import ReplicaPool
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.observers import Observer
+
+F_TRUE = np.linspace(0, 4, 9)
+PARAMS = {
+    'n_sim': 3,
+    's': 2,
+    'n_iters': 4,
+    'n_steps': 300,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.01,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'seed': 7,
+}
+WL_PARAMS = {'n_steps': 100, 'wl_delta': 1, 'wl_delta_cutoff': 0.001, 'wl_ratio': 0.8, 'wl_scale': 0.5}
+
+
+class Failing(Observer):
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        if step == 50:
+            raise ValueError('failure in a replica')
+
+
+@pytest.mark.parametrize('params', [
+    {'w_combine': False},
+    {'w_combine': True},
+    # The run ends without equilibration, so the weights are modified by the last combination
+    {'w_combine': True, 'n_iters': 6, 'n_steps': 100, 'wl_delta_cutoff': 1e-4},
+])
+def test_serial_matches_parallel(params):
+    runs = []
+    for n_workers in [1, 2]:
+        eexe = EnsembleEXE(dict(PARAMS, n_workers=n_workers, **params), F_TRUE)
+        eexe.run()
+        runs.append(eexe)
+    serial, parallel = runs
+    if 'n_iters' in params:
+        assert not any(serial.equil_all)
+    assert parallel.equil_all == serial.equil_all
+    assert parallel.equil_time_all == serial.equil_time_all
+    np.testing.assert_array_equal(parallel.g_vec, serial.g_vec)
+    for a, b in zip(serial.simulators, parallel.simulators):
+        np.testing.assert_array_equal(b.g, a.g)
+        np.testing.assert_array_equal(b.hist, a.hist)
+        np.testing.assert_array_equal(b.traj, a.traj)
+        np.testing.assert_array_equal(b.dg, a.dg)
+        assert b.state == a.state
+
+
+def test_pool_shutdown():
+    sims = [WL_Simulator(dict(WL_PARAMS, seed=j), [0, 1, 2]) for j in range(3)]
+    with ReplicaPool(sims, 2) as pool:
+        pool.run()
+        pool.run()
+        procs = pool.procs
+    assert pool.shm is None
+    assert not any(proc.is_alive() for proc in procs)
+    assert all(len(sim.traj) == 200 for sim in pool.simulators)  # the trajectories are sent back upon closing
+
+
+def test_error_propagation():
+    sims = [WL_Simulator(dict(WL_PARAMS, seed=j, observers=[Failing()] if j == 1 else None), [0, 1, 2]) for j in range(3)]  # noqa: E501
+    pool = ReplicaPool(sims, 2)
+    with pytest.raises(RuntimeError, match='replica 1') as info:
+        pool.run()
+    assert isinstance(info.value.__cause__, ValueError)
+    pool.close()
+    assert pool.shm is None
+    assert not any(proc.is_alive() for proc in pool.procs)
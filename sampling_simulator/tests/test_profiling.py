@@ -0,0 +1,97 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module utils/profiling.py and the profiling of the simulators.
+"""
+import json
+import pickle
+import pytest
+import numpy as np
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.utils import profiling
+
+PARAMS = {
+    'n_steps': 500,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.001,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'seed': 0,
+}
+F_TRUE = [0, 1, 2, 1.5]
+
+
+def test_unprofiled_methods_untouched():
+    sim = WL_Simulator(PARAMS, F_TRUE)
+    assert sim.stats is None
+    for name in WL_Simulator._profiled_methods:
+        assert name not in sim.__dict__
+        assert getattr(sim, name).__func__ is getattr(WL_Simulator, name)
+
+
+def test_profiled_run():
+    sim = WL_Simulator(dict(PARAMS, profile=True), F_TRUE)
+    for name in WL_Simulator._profiled_methods:
+        assert isinstance(sim.__dict__[name], profiling.TimedMethod)
+    sim.run()
+    stats = sim.stats
+    assert stats.calls('run') == 1
+    for phase in ['propose', 'update', 'calc_prob_acc', 'check_flatness']:
+        assert stats.calls(phase) == PARAMS['n_steps']
+        assert stats.time(phase) > 0
+    assert stats.time('run') >= stats.time('update') >= stats.time('calc_prob_acc')
+    n_accepted = stats.counters['accepted']
+    assert 0 < n_accepted <= PARAMS['n_steps']
+    assert stats.acceptance_rate == n_accepted / PARAMS['n_steps']
+    assert stats.n_flatness_resets == stats.calls('reset_hist') > 0
+
+    # Profiling does not change the results
+    ref = WL_Simulator(PARAMS, F_TRUE)
+    ref.run()
+    np.testing.assert_array_equal(sim.traj, ref.traj)
+
+    d = json.loads(sim.dump_stats())
+    assert d['phases']['update']['calls'] == PARAMS['n_steps']
+    assert d['counters']['accepted'] == n_accepted
+
+
+def test_pickle_profiled():
+    sim = WL_Simulator(dict(PARAMS, profile=True), F_TRUE)
+    sim.run()
+    copy = pickle.loads(pickle.dumps(sim))
+    copy.run()
+    assert copy.stats.calls('run') == 2
+    assert copy.update.stats is copy.stats
+    assert sim.stats.calls('run') == 1
+
+
+def test_merge():
+    a, b = profiling.ProfileStats(), profiling.ProfileStats()
+    a.add('run', 1.0)
+    a.count('accepted', 2)
+    b.add('run', 0.5)
+    b.add('update', 0.25)
+    b.count('accepted')
+    a.merge(b)
+    assert a.phases == {'run': [2, 1.5], 'update': [1, 0.25]}
+    assert a.counters == {'accepted': 3}
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_profiled_ensemble(n_workers):
+    params = dict(PARAMS, n_sim=2, s=1, n_iters=2, n_steps=100, profile=True, n_workers=n_workers)
+    eexe = EnsembleEXE(params, F_TRUE + [2.5])
+    eexe.run()
+    assert eexe.stats.calls('run') == 1
+    assert eexe.stats.calls('combine_weights') >= 1
+    replicas = eexe.replica_stats()
+    assert replicas.calls('run') == 2 * eexe.iteration
+    assert replicas.calls('update') == 200 * eexe.iteration
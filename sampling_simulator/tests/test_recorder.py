@@ -0,0 +1,84 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module utils/recorder.py and the recording of trajectories by the simulators.
+"""
+import os
+import pytest
+import numpy as np
+from sampling_simulator.utils.recorder import TrajectoryRecorder
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.ensemble_exe import EnsembleEXE
+from sampling_simulator.observers import Observer
+
+PARAMS = {
+    'n_steps': 1000,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.001,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'seed': 0,
+}
+
+
+class ListRecorder(Observer):
+    """
+    Records the trajectory in lists, as the simulators did before the recorders were introduced.
+    """
+    def __init__(self):
+        super().__init__()
+        self.traj, self.dg = [], []
+
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        self.traj.append(state)
+        self.dg.append(g[-1] - g[0])
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_recorder_matches_list(tmp_path, stream):
+    rng = np.random.default_rng(0)
+    fname = str(tmp_path / 'values.npy') if stream else None
+    recorder = TrajectoryRecorder('float64', chunk_size=7, fname=fname)
+    ref = []
+    for _ in range(20):
+        if rng.random() < 0.5:
+            value = rng.normal()
+            recorder.append(value)
+            ref.append(value)
+        else:
+            values = rng.normal(size=rng.integers(0, 20))
+            recorder.extend(values)
+            ref.extend(values)
+        assert len(recorder) == len(ref)
+    recorder.flush()
+    np.testing.assert_array_equal(recorder.to_array(), ref)
+    if stream:
+        np.testing.assert_array_equal(np.load(fname), ref)
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_simulator_trajectories(tmp_path, stream):
+    ref = ListRecorder()
+    record_path = str(tmp_path / 'run') if stream else None
+    sim = WL_Simulator(dict(PARAMS, record_chunk_size=64, record_path=record_path, observers=[ref]), [0, 1, 2, 3])
+    sim.run()
+    np.testing.assert_array_equal(sim.traj, ref.traj)
+    np.testing.assert_array_equal(sim.dg, ref.dg)
+    if stream:
+        assert isinstance(sim.traj, np.memmap)
+        np.testing.assert_array_equal(np.load(f'{record_path}_traj.npy'), ref.traj)
+
+
+def test_ensemble_record_files(tmp_path):
+    # Only the replicas stream their trajectories, even when the ensemble is checkpointed
+    params = dict(PARAMS, n_steps=100, n_sim=2, s=2, n_iters=2, record_path=str(tmp_path / 'run'),
+                  checkpoint_file=str(tmp_path / 'eexe.npz'), checkpoint_every=1)
+    EnsembleEXE(params, np.linspace(0, 3, 6)).run()
+    assert sorted(os.listdir(tmp_path)) == ['eexe.npz'] + [f'run_rep{j}_{name}.npy' for j in range(2) for name in ['dg', 'traj']]  # noqa: E501
@@ -0,0 +1,147 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module results.py.
+"""
+import os
+import json
+import pytest
+import numpy as np
+import multiprocessing as mp
+from sampling_simulator.results import ResultsStore
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.utils.exceptions import ParameterError
+
+
+def run_arrays(i):
+    rng = np.random.default_rng(i)
+    return {'traj': rng.integers(0, 5, size=100 + i), 'g': rng.normal(size=(2, 3))}
+
+
+def test_append_and_read(tmp_path):
+    store = ResultsStore(str(tmp_path))
+    for i in range(3):
+        store.append(f'run{i}', {'rmse': 0.1 * i, 'equil_time': 10 * i}, run_arrays(i), {'seed': i})
+    store = ResultsStore(str(tmp_path))  # a new reader
+    assert len(store) == 3 and store.run_ids == ['run0', 'run1', 'run2'] and 'run1' in store
+    np.testing.assert_allclose(store.column('rmse'), [0, 0.1, 0.2])
+    assert store.column('equil_time').dtype == np.int64
+    assert store.row('run2') == {'rmse': pytest.approx(0.2), 'equil_time': 20}
+    for i in range(3):
+        data = store.run(f'run{i}')
+        for name, values in run_arrays(i).items():
+            np.testing.assert_array_equal(data[name], values)
+        assert store.entry(f'run{i}')['params'] == {'seed': i}
+    with pytest.raises(KeyError):
+        store.run('run3')
+    with pytest.raises(ParameterError):
+        store.column('wall_time')
+
+
+def test_schema(tmp_path):
+    store = ResultsStore(str(tmp_path))
+    store.append('run0', {'rmse': 0.1, 'equil_time': 10}, {'traj': np.arange(5)})
+    with pytest.raises(ParameterError):
+        store.append('run0', {'rmse': 0.1, 'equil_time': 10})
+    with pytest.raises(ParameterError):
+        store.append('run1', {'rmse': 0.1})
+    with pytest.raises(ParameterError):
+        store.append('run1', {'rmse': 0.1, 'equil_time': 10.5})  # floats are not cast to integers
+    with pytest.raises(ParameterError):
+        store.append('run1', {'rmse': 0.1, 'equil_time': 10}, {'traj': np.linspace(0, 1, 5)})
+    store.append('run1', {'rmse': 1, 'equil_time': np.int32(10)}, {'traj': np.arange(3, dtype=np.int8)})
+    assert len(store) == 2
+    assert store.row('run1') == {'rmse': 1.0, 'equil_time': 10}
+    np.testing.assert_array_equal(store.run('run1')['traj'], [0, 1, 2])
+
+
+def test_dtypes_are_not_widened(tmp_path):
+    # The first run fixes the data types, so a wider trajectory of a later run is rejected
+    store = ResultsStore(str(tmp_path))
+    store.append('run0', {'rmse': 0.1}, {'traj': np.arange(5, dtype=np.int16)})
+    with pytest.raises(ParameterError):
+        store.append('run1', {'rmse': 0.2}, {'traj': np.arange(5, dtype=np.int64)})
+    store.append('run1', {'rmse': 0.2}, {'traj': np.arange(5, dtype=np.int8)})
+    assert store.run('run1')['traj'].dtype == np.int16
+
+
+def test_array_ends(tmp_path):
+    # The ends of the arrays are recorded in the index, so appends do not scan the previous runs
+    store = ResultsStore(str(tmp_path))
+    for i in range(3):
+        store.append(f'run{i}', {'rmse': 0.1 * i}, run_arrays(i) if i != 1 else {'g': np.zeros((2, 3))})
+    with open(os.path.join(str(tmp_path), 'index.jsonl')) as fh:
+        entries = [json.loads(line) for line in fh]
+    assert entries[-1]['ends'] == {'traj': 100 + 102, 'g': 18}
+    for name, end in entries[-1]['ends'].items():
+        assert len(np.load(os.path.join(str(tmp_path), 'arrays', f'{name}.npy'))) == end
+
+    # An index written without the ends is scanned instead
+    with open(os.path.join(str(tmp_path), 'index.jsonl'), 'w') as fh:
+        for entry in entries:
+            del entry['ends']
+            fh.write(json.dumps(entry) + '\n')
+    store = ResultsStore(str(tmp_path))
+    store.append('run3', {'rmse': 0.3}, run_arrays(3))
+    assert store.entry('run3')['arrays']['traj'][0] == 202
+    np.testing.assert_array_equal(store.run('run3')['traj'], run_arrays(3)['traj'])
+    np.testing.assert_array_equal(store.run('run2')['traj'], run_arrays(2)['traj'])
+
+
+def test_interrupted_writer(tmp_path):
+    # Data and a partial index line left by an interrupted writer are discarded
+    store = ResultsStore(str(tmp_path))
+    store.append('run0', {'rmse': 0.1}, {'traj': np.arange(5)})
+    with open(os.path.join(str(tmp_path), 'arrays', 'traj.npy'), 'ab') as fh:
+        fh.write(b'\x01' * 24)
+    with open(os.path.join(str(tmp_path), 'index.jsonl'), 'ab') as fh:
+        fh.write(b'{"run_id": "run1", "ro')
+    assert ResultsStore(str(tmp_path)).run_ids == ['run0']
+    store.append('run1', {'rmse': 0.2}, {'traj': np.arange(10, 13)})
+    store = ResultsStore(str(tmp_path))
+    assert store.run_ids == ['run0', 'run1']
+    np.testing.assert_array_equal(store.run('run1')['traj'], [10, 11, 12])
+    np.testing.assert_array_equal(np.load(os.path.join(str(tmp_path), 'arrays', 'traj.npy')), [0, 1, 2, 3, 4, 10, 11, 12])  # noqa: E501
+
+
+def append_runs(args):
+    directory, worker = args
+    store = ResultsStore(directory)
+    for k in range(5):
+        i = 5 * worker + k
+        store.append(f'run{i}', {'rmse': float(i)}, run_arrays(i), {'worker': worker})
+
+
+def test_concurrent_append(tmp_path):
+    with mp.Pool(4) as pool:
+        pool.map(append_runs, [(str(tmp_path), worker) for worker in range(4)])
+    store = ResultsStore(str(tmp_path))
+    assert sorted(store.run_ids) == sorted(f'run{i}' for i in range(20))
+    for run_id in store.run_ids:
+        i = int(run_id[3:])
+        assert store.row(run_id) == {'rmse': float(i)}
+        assert store.entry(run_id)['params'] == {'worker': i // 5}
+        data = store.run(run_id)
+        for name, values in run_arrays(i).items():
+            np.testing.assert_array_equal(data[name], values)
+    assert len(np.load(os.path.join(str(tmp_path), 'arrays', 'traj.npy'))) == sum(100 + i for i in range(20))
+
+
+def test_append_simulator(tmp_path):
+    params = {'n_steps': 500, 'wl_delta': 1, 'wl_delta_cutoff': 0.01, 'wl_ratio': 0.8, 'wl_scale': 0.5, 'seed': 0}
+    sim = WL_Simulator(params, [0, 1, 2, 1.5])
+    sim.run()
+    store = ResultsStore(str(tmp_path))
+    store.append_simulator(sim, 'wl', params, wall_time=1.5)
+    assert store.row('wl')['wall_time'] == 1.5
+    data = store.run('wl')
+    np.testing.assert_array_equal(data['traj'], sim.traj)
+    np.testing.assert_allclose(data['g'], sim.g)
+    np.testing.assert_array_equal(data['equil_time_all'], [-1 if sim.equil_time is None else sim.equil_time])
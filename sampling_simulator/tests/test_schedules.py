@@ -0,0 +1,91 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module utils/schedules.py.
+"""
+import pytest
+import numpy as np
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+from sampling_simulator.utils.schedules import ClassicSchedule, InverseTimeSchedule, CallableSchedule
+from sampling_simulator.utils.exceptions import ParameterError
+
+F_TRUE = np.array([0, 1.5, 3, 2, 0.5, 4])
+PARAMS = {
+    'n_steps': 20000,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 1e-6,
+    'wl_ratio': 0.8,
+    'wl_scale': 0.5,
+    'seed': 0,
+}
+
+
+def test_classic_schedule():
+    schedule = ClassicSchedule(0.5)
+    assert not schedule.per_step and schedule.uses_flatness
+    assert schedule.on_flat(1) == 0.5
+    assert schedule.on_step(100, 0.5) == 0.5
+
+
+def test_inverse_time_schedule():
+    schedule = InverseTimeSchedule(0.5, 4)
+    assert schedule.per_step and schedule.uses_flatness
+    assert schedule.on_step(8, 1) == 1  # The classic schedule before the switch
+    assert schedule.on_flat(1) == 0.5
+    assert not schedule.switched
+
+    # Scaling down the incrementor would bring it below n_states / t
+    assert schedule.on_step(10, 0.5) == 0.5
+    assert schedule.on_flat(0.5) == 4 / 10
+    assert schedule.switched and not schedule.uses_flatness
+    assert schedule.on_step(20, 4 / 10) == 4 / 20
+    assert schedule.on_step(400, 4 / 20) == 4 / 400
+
+    restored = InverseTimeSchedule(0.5, 4)
+    restored.set_state(schedule.get_state())
+    assert restored.switched and restored.on_step(1000, 1) == 4 / 1000
+
+
+def test_callable_schedule():
+    calls = []
+
+    def func(t, wl_delta, flat):
+        calls.append((t, wl_delta, flat))
+        return wl_delta / 2 if flat else wl_delta
+
+    schedule = CallableSchedule(func)
+    assert schedule.on_step(3, 1) == 1
+    assert schedule.on_flat(1) == 0.5
+    assert calls == [(3, 1, False), (3, 1, True)]
+
+
+@pytest.mark.parametrize('wl_schedule', ['1/t', 'asymptotic_1/t'])
+def test_inverse_time_runs(wl_schedule):
+    sim = WL_Simulator(dict(PARAMS, wl_schedule=wl_schedule), F_TRUE)
+    sim.run()
+    assert sim._schedule.switched
+    assert sim.wl_delta == len(F_TRUE) / PARAMS['n_steps']
+    rmse = np.sqrt(np.mean((sim.g - (F_TRUE - F_TRUE[0])) ** 2))
+    assert rmse < 0.5
+
+    # The switch is kept across runs
+    sim.run()
+    assert sim.wl_delta == len(F_TRUE) / (2 * PARAMS['n_steps'])
+
+
+def test_callable_schedule_run():
+    sim = WL_Simulator(dict(PARAMS, n_steps=2000, wl_schedule=lambda t, wl_delta, flat: 0.1), F_TRUE)
+    sim.run()
+    assert sim.wl_delta == 0.1
+
+
+def test_invalid_schedule():
+    with pytest.raises(ParameterError):
+        WL_Simulator(dict(PARAMS, wl_schedule='exponential'), F_TRUE)
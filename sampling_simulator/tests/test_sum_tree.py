@@ -0,0 +1,83 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module utils/sum_tree.py and the sum-tree proposal of WL_Simulator.
+"""
+import pytest
+import numpy as np
+from sampling_simulator.utils import utils
+from sampling_simulator.utils.sum_tree import SumTree
+from sampling_simulator.wang_landau_algorithm import WL_Simulator
+
+
+def exact_probs(f):
+    q = np.exp(-(f - f.min()))
+    return q / q.sum()
+
+
+@pytest.mark.parametrize('n', [1, 5, 8, 13])
+def test_build_and_update(n):
+    rng = np.random.default_rng(n)
+    f = rng.normal(size=n)
+    tree = SumTree(f)
+    np.testing.assert_allclose(tree.probs, exact_probs(f))
+    for _ in range(50):
+        i = rng.integers(n)
+        f[i] += rng.normal()
+        tree.update(i, f[i], f)
+        np.testing.assert_allclose(tree.probs, exact_probs(f))
+        assert tree.tree[1] == pytest.approx(sum(tree.tree[tree.size:]))
+
+
+def test_rebuild_on_drift():
+    f = np.zeros(4)
+    tree = SumTree(f)
+    for _ in range(10):
+        f[2] -= 10  # the weight of state 2 grows by e^10 each time
+        tree.update(2, f[2], lambda: f)
+    assert tree.shift == f.min()
+    assert SumTree._LOWER < tree.tree[1] < SumTree._UPPER
+    np.testing.assert_allclose(tree.probs, exact_probs(f))
+
+
+def test_sample_inverse_cdf():
+    f = np.array([0.0, 2.0, 0.5, 1.0, 3.0])
+    tree = SumTree(f)
+    cdf = np.cumsum(exact_probs(f))
+    # The midpoint of the interval of each state in [0, 1) maps to that state
+    midpoints = (np.concatenate([[0], cdf[:-1]]) + cdf) / 2
+    assert [tree.sample(u) for u in midpoints] == list(range(len(f)))
+    assert tree.sample(0.0) == 0
+    assert tree.sample(np.nextafter(1, 0)) == len(f) - 1
+
+
+@pytest.mark.parametrize('proposal', ['direct', 'sum_tree'])
+def test_proposal_distribution(proposal):
+    # Both proposals draw from q ∝ exp(-f_current)
+    f_true = np.array([0, 1.5, 3, 2, 0.5, 4, 1, 2.5])
+    params = {'n_steps': 1, 'wl_delta': 0, 'wl_delta_cutoff': 0, 'wl_ratio': 0.8, 'wl_scale': 0.5,
+              'proposal': proposal, 'seed': 0}
+    sim = WL_Simulator(params, f_true)
+    sim.g = np.array([0, 1, 2, 1, 0, 2.5, 0.5, 1])
+    if proposal == 'sum_tree':
+        sim._sum_tree = SumTree(sim.f_current)
+    n = 100000
+    freq = np.bincount([sim.propose() for _ in range(n)], minlength=len(f_true)) / n
+    q = utils.free2prob(sim.f_current)
+    np.testing.assert_allclose(freq, q, atol=4 * np.sqrt(q * (1 - q) / n).max())
+
+
+def test_tree_follows_weights():
+    # The tree is updated along with the weights during a run
+    params = {'n_steps': 2000, 'wl_delta': 1, 'wl_delta_cutoff': 0.001, 'wl_ratio': 0.8, 'wl_scale': 0.5,
+              'proposal': 'sum_tree', 'seed': 0}
+    sim = WL_Simulator(params, np.array([0, 1.5, 3, 2, 0.5]))
+    sim.run()
+    np.testing.assert_allclose(sim._sum_tree.probs, utils.free2prob(sim.f_current))
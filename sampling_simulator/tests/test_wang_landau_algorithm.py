@@ -0,0 +1,121 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+Unit tests for the module wang_landau_algorithm.py.
+"""
+import pytest
+import numpy as np
+from sampling_simulator.wang_landau_algorithm import WL_Simulator, BatchWLSimulator
+from sampling_simulator.observers import Observer
+from sampling_simulator.utils.exceptions import ParameterError
+
+F_TRUE = np.array([0, 1.5, 3, 2, 0.5, 4])
+PARAMS = {
+    'n_steps': 2000,
+    'wl_delta': 1,
+    'wl_delta_cutoff': 0.01,
+    'wl_ratio': 0.7,
+    'wl_scale': 0.5,
+}
+
+
+def rmse(g):
+    return np.sqrt(np.mean((g - (F_TRUE - F_TRUE[0])) ** 2))
+
+
+def test_batch_matches_independent_walkers():
+    # The equilibration times and the errors of the equilibrated weights of a batch of walkers
+    # should follow the same distributions as those of independent simulators
+    n = 64
+    batch = BatchWLSimulator(dict(PARAMS, n_walkers=n, seed=0), F_TRUE)
+    batch.run()
+    sims = [WL_Simulator(dict(PARAMS, seed=100 + k, post_equil='fast'), F_TRUE) for k in range(n)]
+    for sim in sims:
+        sim.run()
+    assert batch.equil.all() and all(sim.equil for sim in sims)
+    for a, b in [
+        (batch.equil_time, [sim.equil_time for sim in sims]),
+        ([rmse(g) for g in batch.g_equil], [rmse(sim.g_equil) for sim in sims]),
+    ]:
+        a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+        sem = np.sqrt((a.var(ddof=1) + b.var(ddof=1)) / n)
+        assert abs(a.mean() - b.mean()) < 4 * sem
+
+
+@pytest.mark.parametrize('param', [
+    {'observers': []},
+    {'record_path': 'batch'},
+    {'checkpoint_file': 'batch.npz'},
+    {'checkpoint_every': 1},
+    {'proposal': 'sum_tree'},
+    {'post_equil': 'fast'},
+    {'backend': 'auto'},
+])
+def test_batch_unsupported_params(param):
+    with pytest.raises(ParameterError):
+        BatchWLSimulator(dict(PARAMS, n_walkers=2, **param), F_TRUE)
+
+
+def test_batch_checkpoint(tmp_path):
+    batch = BatchWLSimulator(dict(PARAMS, n_walkers=2, verbose=True), F_TRUE)
+    assert batch.observers == []
+    with pytest.raises(ParameterError):
+        batch.save_checkpoint(str(tmp_path / 'batch.npz'))
+    with pytest.raises(ParameterError):
+        BatchWLSimulator.load_checkpoint(str(tmp_path / 'batch.npz'))
+
+
+class EagerWeights(Observer):
+    """
+    Updates the weights eagerly, shifting all of them in every step, as the original WL_Simulator did.
+    """
+    def __init__(self, n_states):
+        super().__init__()
+        self.g = np.zeros(n_states)
+        self.dg = []
+        self.g_equil = None
+
+    def on_step(self, sim, step, state, proposed, accepted, g, hist):
+        self.g[sim.state] -= sim.wl_delta
+        self.g -= self.g[0]
+        self.dg.append(self.g[-1] - self.g[0])
+        np.testing.assert_allclose(g, self.g, atol=1e-12)
+
+    def on_equilibration(self, sim, step, g_equil):
+        self.g_equil = self.g.copy()
+
+
+def test_lazy_shift_matches_eager():
+    eager = EagerWeights(len(F_TRUE))
+    sim = WL_Simulator(dict(PARAMS, seed=1, observers=[eager]), F_TRUE)
+    sim.run()
+    assert sim.equil
+    np.testing.assert_allclose(sim.g, eager.g, atol=1e-12)
+    np.testing.assert_allclose(sim.g_equil, eager.g_equil, atol=1e-12)
+    np.testing.assert_allclose(sim.dg, eager.dg, atol=1e-12)
+    # f_current equals f_true - g up to a constant
+    np.testing.assert_allclose(np.diff(sim.f_current), np.diff(F_TRUE - eager.g), atol=1e-12)
+
+
+def test_weights_read_only():
+    sim = WL_Simulator(dict(PARAMS, seed=1), F_TRUE)
+    sim.run()
+    with pytest.raises(ValueError):
+        sim.g[1] += 1
+    with pytest.raises(ValueError):
+        sim.f_current[1] += 1
+    with pytest.raises(ValueError):
+        sim.hist[1] += 1
+    hist = sim.hist + 1
+    sim.hist = hist  # assigning replaces all counts
+    np.testing.assert_array_equal(sim.hist, hist)
+    g = sim.g + 1
+    sim.g = g  # assigning replaces all weights
+    np.testing.assert_allclose(sim.g, g - g[0])
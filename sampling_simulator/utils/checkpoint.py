@@ -0,0 +1,106 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides functions for writing and reading checkpoint files, which are compressed
+:code:`.npz` files with a JSON header (format and version), JSON metadata and NumPy arrays.
+"""
+import os
+import json
+import zlib
+import zipfile
+import numpy as np
+from sampling_simulator.utils.exceptions import CheckpointError
+
+CHECKPOINT_FORMAT = 'sampling_simulator.checkpoint'
+CHECKPOINT_VERSION = 1
+
+
+def _to_json(obj):
+    """
+    Convert the NumPy objects that are not JSON serializable by default. Seed sequences are
+    dropped since the states of the random number generators are stored separately.
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.dtype):
+        return obj.str
+    if isinstance(obj, np.random.SeedSequence):
+        return None
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def write_checkpoint(fname, cls_name, meta, arrays):
+    """
+    Write a checkpoint file. The file is first written to a temporary file and then
+    renamed, so an interrupted write never corrupts an existing checkpoint.
+
+    Parameters
+    ----------
+    fname : str
+        The path of the checkpoint file.
+    cls_name : str
+        The name of the class of the checkpointed object.
+    meta : dict
+        JSON-serializable metadata.
+    arrays : dict
+        NumPy arrays keyed by their names, which should not start with :code:`__`.
+    """
+    header = {'format': CHECKPOINT_FORMAT, 'version': CHECKPOINT_VERSION, 'class': cls_name}
+    tmp = f'{fname}.tmp'
+    with open(tmp, 'wb') as fh:
+        np.savez_compressed(
+            fh,
+            __header__=np.array(json.dumps(header)),
+            __meta__=np.array(json.dumps(meta, default=_to_json)),
+            **arrays,
+        )
+    os.replace(tmp, fname)
+
+
+def read_checkpoint(fname, cls_name):
+    """
+    Read a checkpoint file written by :func:`write_checkpoint`.
+
+    Parameters
+    ----------
+    fname : str
+        The path of the checkpoint file.
+    cls_name : str
+        The name of the class expected to be checkpointed in the file.
+
+    Returns
+    -------
+    meta : dict
+        The metadata.
+    arrays : dict
+        The NumPy arrays keyed by their names.
+    """
+    try:
+        with np.load(fname) as data:
+            if '__header__' not in data.files:
+                raise CheckpointError(f'{fname} is not a checkpoint file.')
+            header = json.loads(str(data['__header__']))
+            if header.get('format') != CHECKPOINT_FORMAT:
+                raise CheckpointError(f'{fname} is not a checkpoint file.')
+            if header['version'] > CHECKPOINT_VERSION:
+                raise CheckpointError(f"The version of {fname} ({header['version']}) is newer than the supported version ({CHECKPOINT_VERSION}).")  # noqa: E501
+            if header['class'] != cls_name:
+                raise CheckpointError(f"{fname} is a checkpoint of {header['class']}, not {cls_name}.")
+            meta = json.loads(str(data['__meta__']))
+            arrays = {key: data[key] for key in data.files if not key.startswith('__')}
+    except FileNotFoundError:
+        raise
+    except (OSError, EOFError, ValueError, KeyError, TypeError, zipfile.BadZipFile, zlib.error) as err:
+        # e.g. a truncated or overwritten file, or a .npy file (which does not support the with statement)
+        raise CheckpointError(f'{fname} is corrupted: {err}') from err
+
+    return meta, arrays
@@ -0,0 +1,157 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides the tables of configurational energies that couple the sampling in the alchemical
+space to a trace of configurations. A table has shape :code:`(n_frames, n_states)`, and its row :code:`t`
+holds the deviations :math:`\\Delta U_t` of the reduced potentials of all states at frame :code:`t` from
+their free energies, e.g. :math:`u_k(x_t) - u_0(x_t) - (f_k - f_0)` computed from dhdl data. The frames
+are consumed one per step, wrapping around at the end of the table, and a table stored as a :code:`.npy`
+file is read through a memory map chunk by chunk, so it never has to fit in memory.
+"""
+import numpy as np
+from sampling_simulator.utils.exceptions import ParameterError
+
+
+class EnergyTable:
+    """
+    A reader of an energy table that yields one row per step.
+
+    Parameters
+    ----------
+    source : str or np.ndarray
+        The path of a :code:`.npy` file of shape :code:`(n_frames, n_states)`, or an array of this shape.
+    chunk_size : int
+        The number of rows read into memory at a time.
+    columns : list
+        The first and last (exclusive) columns to read, e.g. the states of a replica of an EEXE simulation.
+        All columns are read by default.
+    offset : int
+        The index of the first frame.
+    """
+    def __init__(self, source, chunk_size=65536, columns=None, offset=0):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.columns = columns
+        self._data = None
+        n_frames = self.data.shape[0]
+        self.pos = offset % n_frames  # the index of the next frame to read
+        self._chunk = np.zeros((0, 0))
+        self._i = 0
+
+    @property
+    def data(self):
+        """
+        The table, which is memory-mapped upon the first access if it is stored in a file.
+        """
+        if self._data is None:
+            self._data = np.load(self.source, mmap_mode='r') if isinstance(self.source, str) else np.asarray(self.source)  # noqa: E501
+            if self._data.ndim != 2:
+                raise ParameterError(f'The energy table should have 2 dimensions, not {self._data.ndim}.')
+        return self._data
+
+    @property
+    def n_frames(self):
+        return self.data.shape[0]
+
+    def __getstate__(self):
+        # Pickling a memory map would copy the whole table, so a table stored in a file is re-opened instead,
+        # and the current chunk is re-read from the position of the next frame
+        state = dict(self.__dict__, _chunk=np.zeros((0, 0)), _i=0)
+        if isinstance(self.source, str):
+            state['_data'] = None
+        return state
+
+    def _load(self):
+        """
+        Read the chunk of rows starting at the next frame.
+        """
+        start = self.pos
+        stop = min(start + self.chunk_size, self.n_frames)
+        c0, c1 = (0, self.data.shape[1]) if self.columns is None else self.columns
+        self._chunk = np.array(self.data[start:stop, c0:c1], dtype=float)
+        self._i = 0
+
+    def next_row(self):
+        """
+        Return the row of the next frame.
+        """
+        if self._i == len(self._chunk):
+            self._load()
+        row = self._chunk[self._i]
+        self._i += 1
+        self.pos = (self.pos + 1) % self.n_frames
+        return row
+
+    def next_rows(self, n):
+        """
+        Return the rows of up to :code:`n` next frames, which is fewer than :code:`n` rows
+        at the end of a chunk.
+        """
+        if self._i == len(self._chunk):
+            self._load()
+        rows = self._chunk[self._i:self._i + n]
+        self._i += len(rows)
+        self.pos = (self.pos + len(rows)) % self.n_frames
+        return rows
+
+    def seek(self, pos):
+        """
+        Set the index of the next frame, e.g. when restoring a checkpoint.
+        """
+        self.pos = pos % self.n_frames
+        self._chunk = np.zeros((0, 0))
+        self._i = 0
+
+
+def gaussian_table(fname, n_frames, sigma, n_states=None, tau=0, seed=None, chunk_size=65536):
+    """
+    Write a synthetic energy table of Gaussian deviations to a :code:`.npy` file chunk by chunk. The
+    deviations of each state have the standard deviation :code:`sigma` and an autocorrelation time of
+    :code:`tau` frames (as an AR(1) process), and the deviations of state 0 are 0.
+
+    Parameters
+    ----------
+    fname : str
+        The path of the :code:`.npy` file.
+    n_frames : int
+        The number of frames.
+    sigma : float or np.ndarray
+        The standard deviation of the deviations of all states, or an array of those of each state.
+    n_states : int
+        The number of states, which is only required if :code:`sigma` is a float.
+    tau : float
+        The autocorrelation time of the deviations in frames. The frames are uncorrelated if :code:`tau` is 0.
+    seed : None or int
+        The seed of the random number generator.
+    chunk_size : int
+        The number of frames generated at a time.
+
+    Returns
+    -------
+    table : np.memmap
+        The table as a read-only memory map.
+    """
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), (n_states,) if np.ndim(sigma) == 0 else np.shape(sigma)).copy()  # noqa: E501
+    sigma[0] = 0
+    rng = np.random.default_rng(seed)
+    phi = np.exp(-1 / tau) if tau > 0 else 0.0
+    table = np.lib.format.open_memmap(fname, mode='w+', dtype=float, shape=(n_frames, len(sigma)))
+    x = rng.standard_normal(len(sigma))
+    for start in range(0, n_frames, chunk_size):
+        noise = rng.standard_normal((min(chunk_size, n_frames - start), len(sigma))) * np.sqrt(1 - phi ** 2)
+        if phi > 0:
+            for k in range(len(noise)):
+                x = phi * x + noise[k]
+                noise[k] = x
+        table[start:start + len(noise)] = noise * sigma
+    table.flush()
+    del table
+
+    return np.load(fname, mmap_mode='r')
@@ -11,3 +11,8 @@
 class ParameterError(Exception):
     """Raised when the parameters are not valid."""
     pass
+
+
+class CheckpointError(Exception):
+    """Raised when a checkpoint file is not valid."""
+    pass
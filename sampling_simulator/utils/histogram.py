@@ -0,0 +1,131 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides a histogram that keeps track of its total, minimum and maximum counts as
+single bins are incremented, and the flatness criteria of the Wang-Landau algorithm that use them,
+so that the flatness of the histogram can be checked in O(1) time.
+"""
+import numpy as np
+
+
+class FlatnessHistogram:
+    """
+    A histogram of visits to :code:`n_bins` states. Along with the counts, a count-of-counts table
+    (the number of bins having each count) is maintained, which makes it possible to update the
+    minimum count in O(1) time when a single bin is incremented.
+
+    Parameters
+    ----------
+    n_bins : int
+        The number of bins.
+
+    Attributes
+    ----------
+    counts : np.ndarray
+        The counts of all bins. It should only be modified through :meth:`add`, :meth:`reset` and :meth:`set_counts`.
+    total : int
+        The sum of the counts.
+    min : int
+        The minimum count.
+    max : int
+        The maximum count.
+    """
+    def __init__(self, n_bins):
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins)
+        self.reset()
+
+    def reset(self):
+        """
+        Set all counts to 0.
+        """
+        self.counts.fill(0)
+        self._counts = [0] * self.n_bins  # a mirror of counts from which add reads old counts without NumPy scalars
+        self._n_bins_with = {0: self.n_bins}  # count -> number of bins with that count
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def add(self, i):
+        """
+        Increment the count of bin :code:`i` by 1.
+        """
+        c = self._counts[i]
+        self._counts[i] = c + 1
+        self.counts[i] = c + 1
+        n_bins_with = self._n_bins_with
+        n = n_bins_with[c] - 1
+        if n == 0:
+            del n_bins_with[c]
+            if c == self.min:
+                self.min = c + 1  # bin i is now at c + 1, and no other bin has fewer than c + 1 counts
+        else:
+            n_bins_with[c] = n
+        n_bins_with[c + 1] = n_bins_with.get(c + 1, 0) + 1
+        if c == self.max:
+            self.max = c + 1
+        self.total += 1
+
+    def set_counts(self, counts):
+        """
+        Replace all counts, e.g. when restoring a checkpoint.
+        """
+        self.counts = np.array(counts, dtype=float)
+        self._counts = [int(c) for c in self.counts]
+        values, n = np.unique(self._counts, return_counts=True)
+        self._n_bins_with = dict(zip(values.tolist(), n.tolist()))
+        self.total = sum(self._counts)
+        self.min = min(self._counts)
+        self.max = max(self._counts)
+
+    @property
+    def mean(self):
+        """
+        The mean count.
+        """
+        return self.total / self.n_bins
+
+
+class RatioCriterion:
+    """
+    The flatness criterion of the Wang-Landau algorithm, according to which the histogram is flat if the
+    ratio of each count to the mean count is between :code:`wl_ratio` and :code:`1 / wl_ratio`. It gives
+    the same results as the element-wise comparisons of all counts.
+
+    Parameters
+    ----------
+    wl_ratio : float
+        The cutoff of the ratios.
+    """
+    def __init__(self, wl_ratio):
+        self.wl_ratio = wl_ratio
+
+    def __call__(self, hist):
+        if hist.total == 0:
+            return False
+        mean = hist.mean
+        return hist.min / mean > self.wl_ratio and 1 / (hist.max / mean) > self.wl_ratio
+
+
+class MinVisitsCriterion:
+    """
+    A flatness criterion according to which the histogram is flat if every state has been visited
+    at least :code:`min_visits` times.
+
+    Parameters
+    ----------
+    min_visits : int
+        The minimum number of visits to each state.
+    """
+    def __init__(self, min_visits):
+        self.min_visits = min_visits
+
+    def __call__(self, hist):
+        return hist.min >= self.min_visits
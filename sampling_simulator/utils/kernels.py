@@ -0,0 +1,200 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides the compiled step kernels of the simulators, which are selected by the parameter
+:code:`backend`. A kernel fuses a whole segment of Wang-Landau steps into a single function operating on plain
+NumPy arrays and scalars, which is compiled by Numba if it is installed. The kernels are written in the subset
+of Python supported by Numba, so they can also be run uncompiled, e.g. for testing.
+"""
+import math
+import numpy as np
+from sampling_simulator.utils.sum_tree import SumTree
+from sampling_simulator.utils.exceptions import ParameterError
+
+try:
+    import numba
+except ImportError:  # pragma: no cover
+    numba = None
+
+BACKENDS = ['python', 'numba', 'auto']
+
+CRITERION_RATIO, CRITERION_MIN_VISITS = 0, 1
+
+_TREE_LOWER, _TREE_UPPER = SumTree._LOWER, SumTree._UPPER  # the range of the total weight of a sum tree
+
+_compiled = {}
+
+
+def resolve_backend(backend):
+    """
+    Return the backend to use for the given value of the parameter :code:`backend`. :code:`'auto'` selects
+    :code:`'numba'` if Numba is installed and :code:`'python'` otherwise.
+    """
+    if backend not in BACKENDS:
+        raise ParameterError(f"The parameter 'backend' should be one of {BACKENDS}, not '{backend}'.")
+    if backend == 'auto':
+        return 'python' if numba is None else 'numba'
+    if backend == 'numba' and numba is None:
+        raise ParameterError("The 'numba' backend requires Numba, which is not installed.")
+    return backend
+
+
+def get_kernel(name):
+    """
+    Return the compiled version of the kernel of the given name, which is compiled upon the first call.
+    """
+    if name not in _compiled:
+        _compiled[name] = numba.njit(cache=True)(globals()[name])
+    return _compiled[name]
+
+
+def wl_segment(f_true, g_raw, counts, state, wl_delta, u, traj, dg, step, record_stride,
+               criterion, wl_ratio, min_visits, check_flatness, tree, shift):
+    """
+    Perform up to :code:`len(u) // 2` Wang-Landau steps, stopping after the first step at which the histogram
+    is found to be flat. The states are proposed from a sum tree of the proposal weights with the layout of
+    :class:`.SumTree`, which is kept between steps and segments, so each step takes O(log n) time. The weights
+    :code:`g_raw` (before the shift of state 0), the histogram :code:`counts` (as integers), the sum tree
+    :code:`tree`, :code:`traj` and :code:`dg` are modified in place.
+
+    Parameters
+    ----------
+    f_true : np.ndarray
+        The true free energies of all states.
+    g_raw : np.ndarray
+        The raw weights of all states.
+    counts : np.ndarray
+        The histogram counts of all states (as 64-bit integers).
+    state : int
+        The state at the beginning of the segment.
+    wl_delta : float
+        The Wang-Landau incrementor.
+    u : np.ndarray
+        The uniform random numbers of the steps, two per step (the proposal and the acceptance).
+    traj : np.ndarray
+        The output array of the recorded states.
+    dg : np.ndarray
+        The output array of the recorded weight differences between the last and first states.
+    step : int
+        The index of the first step over all runs of the simulator, which determines the steps recorded.
+    record_stride : int
+        The states and weight differences are recorded every :code:`record_stride` steps.
+    criterion : int
+        The flatness criterion (:code:`CRITERION_RATIO` or :code:`CRITERION_MIN_VISITS`).
+    wl_ratio : float
+        The cutoff of the ratio criterion.
+    min_visits : int
+        The minimum number of visits to each state of the min-visits criterion.
+    check_flatness : bool
+        Whether to check the flatness of the histogram after each step.
+    tree : np.ndarray
+        The nodes of the sum tree (see :attr:`.SumTree.tree`) of the weights :code:`exp(-(f_i - shift))`,
+        where :code:`f_i = f_true[i] - g_raw[i]`.
+    shift : float
+        The shift of the free energies of the sum tree.
+
+    Returns
+    -------
+    n_done : int
+        The number of steps performed.
+    state : int
+        The state at the end of the segment.
+    n_recorded : int
+        The number of recorded steps.
+    flat : bool
+        Whether the segment was stopped because the histogram was flat.
+    n_accepted : int
+        The number of accepted moves.
+    shift : float
+        The shift of the sum tree, which changes if the tree is rebuilt.
+    """
+    n = len(f_true)
+    size = len(tree) // 2
+    total = 0
+    hist_max = counts[0]
+    hist_min = counts[0]
+    for i in range(n):
+        total += counts[i]
+        hist_max = max(hist_max, counts[i])
+        hist_min = min(hist_min, counts[i])
+    n_at_min = 0
+    for i in range(n):
+        if counts[i] == hist_min:
+            n_at_min += 1
+
+    n_recorded = 0
+    n_accepted = 0
+    n_steps = len(u) // 2
+    for k in range(n_steps):
+        if (step + k) % record_stride == 0:
+            traj[n_recorded] = state
+
+        # Proposal by descending the sum tree, as in SumTree.sample
+        target = u[2 * k] * tree[1]
+        j = 1
+        while j < size:
+            left = tree[2 * j]
+            if target < left or tree[2 * j + 1] == 0:
+                j = 2 * j
+            else:
+                target -= left
+                j = 2 * j + 1
+        state_new = j - size
+
+        # Acceptance and update
+        delta = (f_true[state_new] - g_raw[state_new]) - (f_true[state] - g_raw[state])
+        p_acc = 1.0 if delta <= 0 else np.exp(-delta)
+        if u[2 * k + 1] < p_acc:
+            state = state_new
+            n_accepted += 1
+        g_raw[state] -= wl_delta
+
+        # Update of the sum tree, as in SumTree.update, rebuilding it with a new shift if the total weight drifts
+        j = state + size
+        tree[j] = math.exp(shift - (f_true[state] - g_raw[state]))
+        j //= 2
+        while j > 0:
+            tree[j] = tree[2 * j] + tree[2 * j + 1]
+            j //= 2
+        if tree[1] <= _TREE_LOWER or tree[1] >= _TREE_UPPER:
+            shift = np.inf
+            for i in range(n):
+                shift = min(shift, f_true[i] - g_raw[i])
+            for i in range(n):
+                tree[size + i] = math.exp(-((f_true[i] - g_raw[i]) - shift))
+            for i in range(size - 1, 0, -1):
+                tree[i] = tree[2 * i] + tree[2 * i + 1]
+
+        c = counts[state]
+        counts[state] = c + 1
+        total += 1
+        if c + 1 > hist_max:
+            hist_max = c + 1
+        if c == hist_min:
+            n_at_min -= 1
+            if n_at_min == 0:
+                hist_min += 1
+                for i in range(n):
+                    if counts[i] == hist_min:
+                        n_at_min += 1
+        if (step + k) % record_stride == 0:
+            dg[n_recorded] = g_raw[n - 1] - g_raw[0]
+            n_recorded += 1
+
+        if check_flatness:
+            if criterion == CRITERION_RATIO:
+                mean = total / n
+                flat = hist_min / mean > wl_ratio and 1 / (hist_max / mean) > wl_ratio
+            else:
+                flat = hist_min >= min_visits
+            if flat:
+                return k + 1, state, n_recorded, True, n_accepted, shift
+
+    return n_steps, state, n_recorded, False, n_accepted, shift
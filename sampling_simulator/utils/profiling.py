@@ -0,0 +1,172 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides the profiling counters and phase timers of the simulators. Profiling is enabled
+by setting :code:`profile` to True in the parameters of a simulator, which wraps the methods of the
+instance that correspond to the phases of a run with timers. The methods of simulators that are not
+profiled are left untouched, so disabled profiling costs nothing.
+"""
+import json
+import time
+
+
+class ProfileStats:
+    """
+    The cumulative wall times and call counts of the phases of a run, and counters of events.
+    Times are inclusive, e.g. the time of :code:`update` includes the time of :code:`calc_prob_acc`.
+    """
+    def __init__(self):
+        self.phases = {}  # phase name -> [number of calls, cumulative wall time in seconds]
+        self.counters = {}
+
+    def add(self, phase, dt):
+        """
+        Record a call of a phase that took :code:`dt` seconds.
+        """
+        entry = self.phases.get(phase)
+        if entry is None:
+            entry = self.phases[phase] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += dt
+
+    def count(self, counter, n=1):
+        """
+        Increment a counter by :code:`n`.
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def calls(self, phase):
+        """
+        The number of calls of a phase.
+        """
+        return self.phases.get(phase, [0, 0.0])[0]
+
+    def time(self, phase):
+        """
+        The cumulative wall time (in seconds) of a phase.
+        """
+        return self.phases.get(phase, [0, 0.0])[1]
+
+    @property
+    def acceptance_rate(self):
+        """
+        The fraction of accepted moves among all calls of :code:`update`, which is None
+        if no moves have been made or acceptances are not counted.
+        """
+        n = self.calls('update')
+        return self.counters['accepted'] / n if n > 0 and 'accepted' in self.counters else None
+
+    @property
+    def n_flatness_resets(self):
+        """
+        The number of times the histogram was found to be flat and reset.
+        """
+        return self.calls('reset_hist')
+
+    def merge(self, other):
+        """
+        Add the phases and counters of another :class:`ProfileStats` object to this one, e.g. to
+        aggregate the statistics of the replicas of an EEXE simulation.
+        """
+        for phase, (n, t) in other.phases.items():
+            entry = self.phases.setdefault(phase, [0, 0.0])
+            entry[0] += n
+            entry[1] += t
+        for counter, n in other.counters.items():
+            self.count(counter, n)
+
+        return self
+
+    def reset(self):
+        """
+        Clear all phases and counters.
+        """
+        self.phases.clear()
+        self.counters.clear()
+
+    def as_dict(self):
+        """
+        Return the statistics as a JSON-serializable dictionary.
+        """
+        return {
+            'phases': {phase: {'calls': n, 'time': t, 'mean_time': t / n} for phase, (n, t) in self.phases.items()},
+            'counters': dict(self.counters),
+            'acceptance_rate': self.acceptance_rate,
+            'n_flatness_resets': self.n_flatness_resets,
+        }
+
+    def dump(self, fname=None):
+        """
+        Return the statistics as a JSON string, which is also written to :code:`fname` if specified.
+        """
+        s = json.dumps(self.as_dict(), indent=2)
+        if fname is not None:
+            with open(fname, 'w') as fh:
+                fh.write(s)
+        return s
+
+    def summary(self):
+        """
+        Return a table of the phases sorted by their cumulative wall times.
+        """
+        lines = [f"{'Phase':<20s} {'Calls':>10s} {'Total (s)':>12s} {'Per call (us)':>14s}"]
+        for phase, (n, t) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f'{phase:<20s} {n:>10d} {t:>12.4f} {t / n * 1e6:>14.2f}')
+        if self.acceptance_rate is not None:
+            lines.append(f'Acceptance rate: {self.acceptance_rate:.4f}')
+        lines.append(f'Number of flatness resets: {self.n_flatness_resets}')
+        return '\n'.join(lines)
+
+
+class TimedMethod:
+    """
+    A wrapper of a bound method recording the wall time of each call as a phase of a :class:`ProfileStats`
+    object. If :code:`counter` is specified, the counter is incremented whenever the method returns True.
+    """
+    def __init__(self, method, stats, phase, counter=None):
+        self.method = method
+        self.stats = stats
+        self.phase = phase
+        self.counter = counter
+
+    def __call__(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = self.method(*args, **kwargs)
+        self.stats.add(self.phase, time.perf_counter() - t0)
+        if self.counter is not None and out:
+            self.stats.count(self.counter)
+        return out
+
+
+def instrument(obj, methods, stats):
+    """
+    Wrap the methods of an object with :class:`TimedMethod` instances stored as instance attributes.
+
+    Parameters
+    ----------
+    obj : object
+        The object to instrument.
+    methods : dict
+        A dictionary mapping the method names to tuples :code:`(phase, counter)`.
+    stats : ProfileStats
+        The statistics to which the timings are recorded.
+    """
+    for name, (phase, counter) in methods.items():
+        if counter is not None:
+            stats.counters.setdefault(counter, 0)
+        setattr(obj, name, TimedMethod(getattr(obj, name), stats, phase, counter))
+
+
+def strip(state, methods):
+    """
+    Return a copy of the :code:`__dict__` of an instrumented object without the method wrappers,
+    which refer back to the object and are re-created by :func:`instrument` upon unpickling.
+    """
+    return {key: value for key, value in state.items() if key not in methods}
@@ -0,0 +1,154 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides a recorder for storing long time series (e.g. state-space trajectories) in
+typed, chunk-preallocated NumPy buffers, optionally streamed to a memory-mapped :code:`.npy` file.
+"""
+import os
+import struct
+import numpy as np
+
+_HEADER_LEN = 128  # fixed length of the .npy header so that it can be rewritten in place
+
+
+def _write_npy_header(fh, dtype, length):
+    """
+    Write a version 1.0 :code:`.npy` header of a fixed length for a 1D array at the beginning of a file.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), length)
+    header = header.ljust(_HEADER_LEN - 11) + '\n'
+    fh.seek(0)
+    fh.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+
+class TrajectoryRecorder:
+    """
+    A recorder of a 1D time series that stores the values in preallocated chunks of a fixed dtype.
+    If :code:`fname` is specified, full chunks are streamed to a :code:`.npy` file instead of being
+    kept in memory, so the memory usage does not grow with the length of the time series.
+
+    Parameters
+    ----------
+    dtype : str or np.dtype
+        The data type of the values.
+    chunk_size : int
+        The number of values in each chunk.
+    fname : str
+        The path of the :code:`.npy` file to stream the data to. The file is created upon the first flush.
+    """
+    def __init__(self, dtype, chunk_size=65536, fname=None):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.fname = fname
+        self._chunks = []  # full chunks kept in memory, which is always empty in the streaming mode
+        self._buffer = np.empty(chunk_size, dtype=self.dtype)
+        self._n_buffer = 0
+        self._n_flushed = 0
+
+    def __len__(self):
+        return self._n_flushed + self._n_buffer
+
+    def append(self, value):
+        """
+        Append a single value.
+        """
+        self._buffer[self._n_buffer] = value
+        self._n_buffer += 1
+        if self._n_buffer == self.chunk_size:
+            self._flush()
+
+    def extend(self, values):
+        """
+        Append an array of values.
+        """
+        values = np.asarray(values, dtype=self.dtype)
+        while len(values) > 0:
+            n = min(len(values), self.chunk_size - self._n_buffer)
+            self._buffer[self._n_buffer:self._n_buffer + n] = values[:n]
+            self._n_buffer += n
+            values = values[n:]
+            if self._n_buffer == self.chunk_size:
+                self._flush()
+
+    def _flush(self):
+        """
+        Move the values in the buffer to the list of chunks or to the file.
+        """
+        if self.fname is None:
+            self._chunks.append(self._buffer[:self._n_buffer])
+            self._buffer = np.empty(self.chunk_size, dtype=self.dtype)
+        else:
+            mode = 'r+b' if self._n_flushed > 0 and os.path.exists(self.fname) else 'w+b'
+            with open(self.fname, mode) as fh:
+                fh.seek(_HEADER_LEN + self._n_flushed * self.dtype.itemsize)
+                fh.write(self._buffer[:self._n_buffer].tobytes())
+                _write_npy_header(fh, self.dtype, self._n_flushed + self._n_buffer)
+        self._n_flushed += self._n_buffer
+        self._n_buffer = 0
+
+    def flush(self):
+        """
+        Write the values in the buffer to the file in the streaming mode.
+        """
+        if self.fname is not None and (self._n_buffer > 0 or self._n_flushed == 0):
+            self._flush()
+
+    def get_state(self):
+        """
+        Return the recorded values in memory, or the number of values in the file in the streaming mode.
+        """
+        if self.fname is None:
+            return self.to_array()
+        self.flush()
+        return len(self)
+
+    def set_state(self, state):
+        """
+        Restore the state returned by :meth:`get_state`. In the streaming mode, the file is expected
+        to hold at least the given number of values, and any values after them are overwritten.
+        """
+        self._chunks, self._n_buffer, self._n_flushed = [], 0, 0
+        if self.fname is None:
+            self.extend(state)
+        else:
+            self._n_flushed = int(state)
+
+    def iter_chunks(self):
+        """
+        Iterate over the recorded values chunk by chunk without consolidating them, so that at most
+        one chunk is loaded into memory at a time in the streaming mode.
+        """
+        if self.fname is None:
+            yield from self._chunks
+            if self._n_buffer > 0:
+                yield self._buffer[:self._n_buffer]
+        elif len(self) > 0:
+            self.flush()
+            data = np.load(self.fname, mmap_mode='r')
+            for i in range(0, len(data), self.chunk_size):
+                yield np.asarray(data[i:i + self.chunk_size])
+
+    def to_array(self):
+        """
+        Return all the recorded values as a 1D array. In the streaming mode, a read-only
+        memory map of the file is returned so that the data is not loaded into memory.
+        """
+        if self.fname is None:
+            if len(self._chunks) != 1 or self._n_buffer > 0:
+                # Consolidate the chunks so that subsequent calls do not need to copy them again
+                self._chunks = [np.concatenate(self._chunks + [self._buffer[:self._n_buffer]])]
+                self._n_flushed += self._n_buffer
+                self._n_buffer = 0
+            return self._chunks[0]
+        elif len(self) == 0:
+            return np.zeros(0, dtype=self.dtype)
+        else:
+            self.flush()
+            return np.load(self.fname, mmap_mode='r')
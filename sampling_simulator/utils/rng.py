@@ -0,0 +1,89 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides a random number stream that draws uniform random numbers from
+a NumPy generator in large blocks to avoid the overhead of one generator call per step.
+"""
+import numpy as np
+
+
+class RandomStream:
+    """
+    A stream of uniform random numbers in [0, 1) backed by a :code:`numpy.random.Generator`.
+
+    Parameters
+    ----------
+    seed : None, int or np.random.SeedSequence
+        The seed of the generator. Independent child streams can be created with :meth:`spawn`.
+    block_size : int
+        The number of random numbers drawn from the generator at a time.
+    """
+    def __init__(self, seed=None, block_size=4096):
+        self.seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.generator = np.random.default_rng(self.seed_seq)
+        self.block_size = block_size
+        self._block = []  # the current block as a list, so that a draw is a list lookup (see SumTree.tree)
+        self._pos = 0
+
+    def random(self):
+        """
+        Return the next uniform random number in the stream.
+        """
+        pos = self._pos
+        if pos == len(self._block):
+            self._block = self.generator.random(self.block_size).tolist()
+            pos = 0
+        self._pos = pos + 1
+        return self._block[pos]
+
+    def random_array(self, n):
+        """
+        Return the next :code:`n` uniform random numbers in the stream as an array, which are
+        the same numbers as those returned by :code:`n` calls of :meth:`random`.
+        """
+        head = np.array(self._block[self._pos:self._pos + n], dtype=float)
+        self._pos += len(head)
+        n_left = n - len(head)
+        if n_left == 0:
+            return head
+        n_blocks = -(-n_left // self.block_size)
+        new = self.generator.random(n_blocks * self.block_size)
+        self._block = new[(n_blocks - 1) * self.block_size:].tolist()
+        self._pos = n_left - (n_blocks - 1) * self.block_size
+        return np.concatenate([head, new[:n_left]])
+
+    def push_back(self, values):
+        """
+        Return random numbers drawn by :meth:`random_array` but not used to the front of the stream,
+        so that they are returned again by subsequent calls.
+        """
+        if len(values) > 0:
+            self._block = np.asarray(values, dtype=float).tolist() + self._block[self._pos:]
+            self._pos = 0
+
+    def get_state(self):
+        """
+        Return the state of the generator and the random numbers left in the current block.
+        """
+        return self.generator.bit_generator.state, np.array(self._block[self._pos:])
+
+    def set_state(self, bit_generator_state, block):
+        """
+        Restore the state returned by :meth:`get_state`.
+        """
+        self.generator.bit_generator.state = bit_generator_state
+        self._block = np.asarray(block, dtype=float).tolist()
+        self._pos = 0
+
+    def spawn(self, n):
+        """
+        Return a list of :code:`n` statistically independent child streams.
+        """
+        return [RandomStream(seed, self.block_size) for seed in self.seed_seq.spawn(n)]
@@ -0,0 +1,109 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides the schedules of the Wang-Landau incrementor, which are selected by the parameter
+:code:`wl_schedule` of the simulators. A schedule updates the incrementor when the histogram is found
+to be flat (:meth:`on_flat`) and, if :code:`per_step` is True, after every step (:meth:`on_step`).
+Time :code:`t` is counted in steps over all runs of a simulator, starting from 1.
+"""
+
+
+class ClassicSchedule:
+    """
+    The classic Wang-Landau schedule, which scales the incrementor by :code:`wl_scale`
+    whenever the histogram is flat.
+
+    Parameters
+    ----------
+    wl_scale : float
+        The scaling factor of the incrementor.
+    """
+    per_step = False
+    uses_flatness = True
+
+    def __init__(self, wl_scale):
+        self.wl_scale = wl_scale
+
+    def on_flat(self, wl_delta):
+        return wl_delta * self.wl_scale
+
+    def on_step(self, t, wl_delta):
+        return wl_delta
+
+    def get_state(self):
+        return None
+
+    def set_state(self, state):
+        pass
+
+
+class InverseTimeSchedule(ClassicSchedule):
+    """
+    The 1/t Wang-Landau schedule (Belardinelli and Pereyra, J. Chem. Phys. 127, 184105 (2007)), which
+    follows the classic schedule until scaling down the incrementor upon a flat histogram would bring it
+    below :code:`n_states / t`, and from then on sets it to :code:`n_states / t` after every step, i.e.
+    1 over the Monte Carlo time. This avoids the saturation of the error of the classic schedule.
+    Flatness is no longer checked after the switch.
+
+    Parameters
+    ----------
+    wl_scale : float
+        The scaling factor of the incrementor before the switch.
+    n_states : int
+        The number of states.
+    """
+    per_step = True
+
+    def __init__(self, wl_scale, n_states):
+        super().__init__(wl_scale)
+        self.n_states = n_states
+        self.switched = False
+        self._t = 1
+
+    @property
+    def uses_flatness(self):
+        return not self.switched
+
+    def on_flat(self, wl_delta):
+        wl_delta *= self.wl_scale
+        if wl_delta < self.n_states / self._t:
+            self.switched = True
+            return self.n_states / self._t
+        return wl_delta
+
+    def on_step(self, t, wl_delta):
+        self._t = t
+        return self.n_states / t if self.switched else wl_delta
+
+    def get_state(self):
+        return self.switched
+
+    def set_state(self, state):
+        self.switched = bool(state)
+
+
+class CallableSchedule(ClassicSchedule):
+    """
+    A custom schedule given by a function :code:`func(t, wl_delta, flat)` returning the new incrementor,
+    which is called after every step with :code:`flat=False` and whenever the histogram is flat with
+    :code:`flat=True`.
+    """
+    per_step = True
+
+    def __init__(self, func):
+        self.func = func
+        self._t = 0
+
+    def on_flat(self, wl_delta):
+        return self.func(self._t, wl_delta, True)
+
+    def on_step(self, t, wl_delta):
+        self._t = t
+        return self.func(t, wl_delta, False)
@@ -0,0 +1,99 @@
+####################################################################
+#                                                                  #
+#    sampling_simulator,                                           #
+#    a python package for running GROMACS simulation ensembles     #
+#                                                                  #
+#    Written by Wei-Tse Hsu <wehs7661@colorado.edu>                #
+#    Copyright (c) 2023 University of Colorado Boulder             #
+#                                                                  #
+####################################################################
+"""
+This module provides a sum tree for drawing states from the probabilities given by
+a free energy profile in O(log n) time per draw and per single-entry update.
+"""
+import math
+import numpy as np
+
+
+class SumTree:
+    """
+    A binary sum tree over the unnormalized weights :math:`\\exp(-(f_i - f_{\\text{shift}}))` of all states,
+    where :math:`f_{\\text{shift}}` is the minimum of the free energy profile at the time the tree was
+    (re)built. The shift is updated by rebuilding the tree whenever the weights drift too far from unity,
+    which prevents overflow and underflow as the free energies grow.
+
+    Parameters
+    ----------
+    f : np.ndarray
+        The free energy profile of all states.
+    """
+    # Rebuild the tree if the total weight leaves the range [_LOWER, _UPPER]
+    _LOWER = 1e-20
+    _UPPER = 1e20
+
+    def __init__(self, f):
+        self.n = len(f)
+        self.size = 1 << max(0, (self.n - 1).bit_length())  # number of leaves, padded to a power of 2
+        self.build(f)
+
+    def build(self, f):
+        """
+        (Re)build the whole tree from the free energy profile in O(n) time.
+        """
+        f = np.asarray(f, dtype=float)
+        self.shift = float(f.min())
+        tree = np.zeros(2 * self.size)
+        tree[self.size:self.size + self.n] = np.exp(-(f - self.shift))
+        start = self.size
+        while start > 1:
+            tree[start // 2:start] = tree[start:2 * start:2] + tree[start + 1:2 * start:2]
+            start //= 2
+        self.tree = tree.tolist()  # Python floats are much faster than NumPy scalars for single-entry access
+
+    def update(self, i, f_i, f):
+        """
+        Update the weight of state :code:`i` in O(log n) time after its free energy has been changed.
+
+        Parameters
+        ----------
+        i : int
+            The index of the state whose free energy has changed.
+        f_i : float
+            The new free energy of state :code:`i`.
+        f : np.ndarray or callable
+            The free energy profile of all states, or a function returning it, which is only
+            used if the tree needs a new shift.
+        """
+        tree = self.tree
+        j = i + self.size
+        tree[j] = math.exp(self.shift - f_i)
+        j //= 2
+        while j:
+            tree[j] = tree[2 * j] + tree[2 * j + 1]
+            j //= 2
+        if not self._LOWER < tree[1] < self._UPPER:
+            self.build(f() if callable(f) else f)
+
+    def sample(self, rand):
+        """
+        Draw a state given a random number uniformly distributed in [0, 1).
+        """
+        tree = self.tree
+        target = rand * tree[1]
+        j = 1
+        while j < self.size:
+            left = tree[2 * j]
+            if target < left or tree[2 * j + 1] == 0:
+                j = 2 * j
+            else:
+                target -= left
+                j = 2 * j + 1
+        return j - self.size
+
+    @property
+    def probs(self):
+        """
+        The normalized probabilities of all states.
+        """
+        p = np.array(self.tree[self.size:self.size + self.n])
+        return p / p.sum()
@@ -19,7 +19,7 @@ def free2prob(f):
     Convert a free energy profile to probabilities of all states.
     """
     f_ = copy.deepcopy(f)
-    f_ -= f_.max()  # just to prevent overflow
+    f_ -= f_.min()  # just to prevent overflow
     p = np.exp(-f_)
     p /= p.sum()
 
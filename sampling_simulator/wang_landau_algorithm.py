@@ -9,33 +9,55 @@
 ####################################################################
 """
 This module provide methods to mock the sampling in the alchemical space by the Wang-Landau algorithm.
-The sampling in the configurational space is ignored, i.e., ΔU is assumed to be always 0.
-kT is set to 1.
+The sampling in the configurational space is ignored, i.e., ΔU is assumed to be always 0, unless
+the parameter :code:`energy_table` is specified, in which case the deviations ΔU of the reduced
+potentials of all states from their free energies are read from a table of configurational
+energies, one frame per step (see :mod:`sampling_simulator.utils.energy`). kT is set to 1.
 """
 import copy
-import random
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
 from sampling_simulator.utils import utils
+from sampling_simulator.utils import checkpoint
+from sampling_simulator.utils import profiling
+from sampling_simulator.utils import kernels
+from sampling_simulator.utils.sum_tree import SumTree
+from sampling_simulator.utils.histogram import FlatnessHistogram, RatioCriterion, MinVisitsCriterion
+from sampling_simulator.utils.schedules import ClassicSchedule, InverseTimeSchedule, CallableSchedule
+from sampling_simulator.utils.recorder import TrajectoryRecorder
+from sampling_simulator.utils.rng import RandomStream
+from sampling_simulator.utils.energy import EnergyTable
 from sampling_simulator.utils.exceptions import ParameterError
+from sampling_simulator.observers import ConsoleLogger, readonly
 
 
 class WL_Simulator:
+    # The methods timed when profiling is enabled, mapped to their phase names and the counters
+    # incremented when they return True
+    _profiled_methods = {
+        'run': ('run', None),
+        'propose': ('propose', None),
+        'update': ('update', 'accepted'),
+        'calc_prob_acc': ('calc_prob_acc', None),
+        'check_flatness': ('check_flatness', None),
+        '_reset_hist': ('reset_hist', None),
+        '_run_frozen': ('run_frozen', None),
+        '_run_kernel': ('run_kernel', None),
+    }
+
     def __init__(self, params_dict, f_true):
         for attr in params_dict:
             setattr(self, attr, params_dict[attr])
         self.n_states = len(f_true)
         self.f_true = copy.deepcopy(f_true)
-        self.f_current = copy.deepcopy(f_true)  # unbiased upon initialization
-        self.hist = np.zeros(self.n_states)
-        self.g = np.zeros(self.n_states)
+        self._hist = FlatnessHistogram(self.n_states)
+        self._g_raw = np.zeros(self.n_states)  # the weights before shifting the weight of state 0 to 0 (see g)
         self.state = 0  # starting from state 0
-        self.traj = []  # state-space trajectory
+        self.n_steps_done = 0  # number of steps performed over all calls of run
         self.equil = False
         self.equil_time = None
         self.g_equil = None
-        self.dg = []  # the weight difference between the first and last states
+        self._sum_tree = None
+        self.stats = None
         self.required_args = [
             'n_steps',
             'wl_delta',
@@ -43,9 +65,72 @@ class WL_Simulator:
             'wl_ratio',
             'wl_scale',
         ]
-        self.optional_args = {'verbose': False}
+        self.optional_args = {
+            'verbose': False,  # whether to attach a ConsoleLogger
+            'observers': None,  # a list of observers (see sampling_simulator.observers)
+            'label': None,  # a label identifying the simulator in the output of observers
+            'seed': None,  # an integer or a numpy.random.SeedSequence to seed the random number generator
+            'rng_block_size': 4096,  # the number of uniform random numbers drawn from the generator at a time
+            'proposal': 'direct',  # 'direct' or 'sum_tree'
+            'flatness_criterion': 'ratio',  # 'ratio', 'min_visits' or a callable taking a FlatnessHistogram and returning a bool  # noqa: E501
+            'wl_min_visits': None,  # the minimum number of visits to each state for the 'min_visits' criterion
+            'wl_schedule': 'classic',  # 'classic', '1/t', 'asymptotic_1/t' or a callable (see sampling_simulator.utils.schedules)  # noqa: E501
+            'record_stride': 1,  # record the state and dg every record_stride steps
+            'record_chunk_size': 65536,
+            'record_path': None,  # if specified, stream the trajectories to {record_path}_traj.npy and {record_path}_dg.npy  # noqa: E501
+            'traj_dtype': None,  # the smallest signed integer type that can hold all state indices by default
+            'dg_dtype': 'float64',
+            'checkpoint_file': None,  # the path of the checkpoint file written by EnsembleEXE.run
+            'checkpoint_every': None,  # the number of iterations between checkpoints in EnsembleEXE.run
+            'profile': False,  # whether to record the wall times of the phases of the runs in self.stats
+            'post_equil': 'update',  # 'update', 'frozen' or 'fast' (see run)
+            'energy_table': None,  # the path of a .npy file or an array of shape (n_frames, n_states) of ΔU (see sampling_simulator.utils.energy)  # noqa: E501
+            'energy_chunk_size': 65536,  # the number of frames of the energy table read into memory at a time
+            'energy_columns': None,  # the first and last (exclusive) columns of the energy table to use
+            'energy_offset': 0,  # the index of the first frame of the energy table
+            'backend': 'python',  # 'python', 'numba' or 'auto' (see run)
+        }
         self.check_params_dict()
 
+        self.rng = RandomStream(self.seed, self.rng_block_size)
+        self.observers = [] if self.observers is None else list(self.observers)
+        if self.verbose:
+            self.observers.append(ConsoleLogger())
+        if self.traj_dtype is None:
+            self.traj_dtype = np.result_type(np.int16, np.min_scalar_type(-self.n_states))
+        traj_fname, dg_fname = self._record_fnames()
+        self._traj = TrajectoryRecorder(self.traj_dtype, self.record_chunk_size, traj_fname)  # state-space trajectory
+        self._dg = TrajectoryRecorder(self.dg_dtype, self.record_chunk_size, dg_fname)  # the weight difference between the first and last states  # noqa: E501
+        self._energies = None
+        self._dU = None  # the deviations of the reduced potentials of all states in the current step
+        if self.energy_table is not None:
+            self._energies = EnergyTable(self.energy_table, self.energy_chunk_size, self.energy_columns, self.energy_offset)  # noqa: E501
+            n_columns = self._energies.data.shape[1] if self.energy_columns is None else self.energy_columns[1] - self.energy_columns[0]  # noqa: E501
+            if n_columns != self.n_states:
+                raise ParameterError(f'The energy table has {n_columns} columns, but there are {self.n_states} states.')  # noqa: E501
+        if self.profile and self.stats is None:
+            self.stats = profiling.ProfileStats()
+            profiling.instrument(self, self._profiled_methods, self.stats)
+
+    def _record_fnames(self):
+        """
+        Return the paths of the files to which the trajectory and the weight differences are streamed,
+        which are None if :code:`record_path` is not specified.
+        """
+        if self.record_path is None:
+            return None, None
+        return f'{self.record_path}_traj.npy', f'{self.record_path}_dg.npy'
+
+    def __getstate__(self):
+        if self.stats is None:
+            return self.__dict__
+        return profiling.strip(self.__dict__, self._profiled_methods)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.stats is not None:
+            profiling.instrument(self, self._profiled_methods, self.stats)
+
     def check_params_dict(self):
         """
         Check if the required parameters are in the params_dict.
@@ -58,25 +143,85 @@ class WL_Simulator:
             if not hasattr(self, arg):
                 setattr(self, arg, self.optional_args[arg])
 
+        if self.proposal not in ['direct', 'sum_tree']:
+            raise ParameterError(f"The parameter 'proposal' should be either 'direct' or 'sum_tree', not '{self.proposal}'.")  # noqa: E501
+
+        self._backend = kernels.resolve_backend(self.backend)
+
+        if self.post_equil not in ['update', 'frozen', 'fast']:
+            raise ParameterError(f"The parameter 'post_equil' should be 'update', 'frozen' or 'fast', not '{self.post_equil}'.")  # noqa: E501
+
+        if self.flatness_criterion == 'ratio':
+            self._is_flat = RatioCriterion(self.wl_ratio)
+        elif self.flatness_criterion == 'min_visits':
+            if self.wl_min_visits is None:
+                raise ParameterError("The parameter 'wl_min_visits' must be specified if 'flatness_criterion' is 'min_visits'.")  # noqa: E501
+            self._is_flat = MinVisitsCriterion(self.wl_min_visits)
+        elif callable(self.flatness_criterion):
+            self._is_flat = self.flatness_criterion
+        else:
+            raise ParameterError(f"The parameter 'flatness_criterion' should be 'ratio', 'min_visits' or a callable, not '{self.flatness_criterion}'.")  # noqa: E501
+
+        if self.wl_schedule == 'classic':
+            self._schedule = ClassicSchedule(self.wl_scale)
+        elif self.wl_schedule in ['1/t', 'asymptotic_1/t']:
+            self._schedule = InverseTimeSchedule(self.wl_scale, len(self.f_true))
+            if self.wl_schedule == 'asymptotic_1/t':
+                # Flat-histogram-free: scale down the incrementor once all states have been visited
+                self._is_flat = MinVisitsCriterion(1)
+        elif callable(self.wl_schedule):
+            self._schedule = CallableSchedule(self.wl_schedule)
+        else:
+            raise ParameterError(f"The parameter 'wl_schedule' should be 'classic', '1/t', 'asymptotic_1/t' or a callable, not '{self.wl_schedule}'.")  # noqa: E501
+
+    def attach(self, observer):
+        """
+        Attach an observer (see :mod:`sampling_simulator.observers`) to the simulator.
+        """
+        self.observers.append(observer)
+
+    @property
+    def hist(self):
+        """
+        The histogram counts of all states. The returned array is a read-only view, like :attr:`g`, since counts
+        modified in place would bypass the total, minimum and maximum counts kept by the histogram. Assigning an
+        array replaces all counts.
+        """
+        return readonly(self._hist.counts)
+
+    @hist.setter
+    def hist(self, hist):
+        self._hist.set_counts(hist)
+
     def check_flatness(self):
         """
-        Check if the histogram is flat enough.
+        Check if the histogram is flat enough according to :code:`flatness_criterion`. If so,
+        update the Wang-Landau incrementor according to :code:`wl_schedule`, reset the histogram
+        and return True. With the built-in criteria, the check takes O(1) time since the histogram
+        keeps track of its total, minimum and maximum counts.
         """
-        N_ratio = self.hist / self.hist.mean()
-        flat_bool = np.all(N_ratio > self.wl_ratio) and np.all(1/N_ratio > self.wl_ratio)
+        if not self._schedule.uses_flatness:
+            return False
+        flat_bool = self._is_flat(self._hist)
         if flat_bool:
-            if self.verbose:
-                print('  Scaling down the Wang-Landau incrmentor and resetting the histogram ...')
-            self.wl_delta *= self.wl_scale
-            self.hist = np.zeros(self.n_states)
-            if self.verbose:
-                print(f'  New Wang-Landau incrmentor: {self.wl_delta:.6f}')
+            self.wl_delta = self._schedule.on_flat(self.wl_delta)
+            self._reset_hist()
+        return flat_bool
+
+    def _reset_hist(self):
+        """
+        Reset the histogram after the Wang-Landau incrementor is scaled down.
+        """
+        self._hist.reset()
 
     def calc_prob_acc(self, state_new):
         """
         Calculate the acceptance probability of a proposed move.
         """
-        delta = self.f_current[state_new] - self.f_current[self.state]
+        f_true, g_raw = self.f_true, self._g_raw
+        delta = (f_true[state_new] - g_raw[state_new]) - (f_true[self.state] - g_raw[self.state])
+        if self._dU is not None:
+            delta += self._dU[state_new] - self._dU[self.state]
         if delta <= 0:
             p_acc = 1
         else:
@@ -87,70 +232,571 @@ class WL_Simulator:
         """
         For a given proposed state, calculates the accpetance probability,
         draw a random number to decide whether the propose move should be accpeted,
-        and lastly, updates the histogram and weights.
+        and lastly, updates the histogram and weights. Returns whether the move was accepted.
         """
         p_acc = self.calc_prob_acc(state_new)
-        rand = random.random()
-        if rand < p_acc:
-            if self.verbose:
-                print('Move accepted!')
+        rand = self.rng.random()
+        accepted = rand < p_acc
+        if accepted:
             self.state = state_new
-            self.g[state_new] -= self.wl_delta
-            self.f_current[state_new] += self.wl_delta
-            self.hist[state_new] += 1
-        else:
-            if self.verbose:
-                print('Move rejected!')
-            self.g[self.state] -= self.wl_delta
-            self.f_current[self.state] += self.wl_delta
-            self.hist[self.state] += 1
+        self._g_raw[self.state] -= self.wl_delta
+        self._hist.add(self.state)
 
-        self.g -= self.g[0]
+        if self._sum_tree is not None:
+            self._sum_tree.update(self.state, self.f_true[self.state] - self._g_raw[self.state], self._get_f_current)
+
+        return accepted
+
+    @property
+    def g(self):
+        """
+        The alchemical weights of all states, shifted such that the weight of state 0 is 0. Only the entry of
+        the visited state is updated in each step, and the shift is applied when the weights are read, so
+        reading this property takes O(n_states) time. The returned array is a read-only copy, so in-place
+        modifications (e.g. :code:`sim.g[k] += x`) raise an error instead of being silently lost. Assigning an
+        array replaces all weights.
+        """
+        return readonly(self._g_raw - self._g_raw[..., :1])
+
+    @g.setter
+    def g(self, g):
+        self._g_raw = np.array(g, dtype=float)
+
+    @property
+    def f_current(self):
+        """
+        The current biased free energies of all states, i.e. :code:`f_true - g` up to a constant.
+        The returned array is a read-only copy like :attr:`g`. Assigning an array replaces all weights
+        such that :code:`f_current` takes the assigned values.
+        """
+        return readonly(self.f_true - self._g_raw)
+
+    @f_current.setter
+    def f_current(self, f_current):
+        self._g_raw = self.f_true - np.asarray(f_current, dtype=float)
+
+    def _get_f_current(self):
+        return self.f_true - self._g_raw
+
+    def _calc_dg(self):
+        """
+        Return the weight difference between the last and first states.
+        """
+        return self._g_raw[..., -1] - self._g_raw[..., 0]
+
+    def propose(self):
+        """
+        Draw a new state from the probabilities given by the current biased free energies,
+        plus the deviations of the reduced potentials in the current step if an energy table is used.
+        """
+        if self._sum_tree is not None:
+            return self._sum_tree.sample(self.rng.random())
+        cdf = np.cumsum(utils.free2prob(self.f_current if self._dU is None else self.f_current + self._dU))
+        return min(int(np.searchsorted(cdf, self.rng.random() * cdf[-1], side='right')), self.n_states - 1)
+
+    @property
+    def traj(self):
+        """
+        The recorded state-space trajectory, which is a read-only memory map in the streaming mode.
+        """
+        return self._traj.to_array()
+
+    @property
+    def dg(self):
+        """
+        The recorded timeseries of the weight difference between the first and last states.
+        """
+        return self._dg.to_array()
 
     def run(self):
+        """
+        Perform :code:`n_steps` steps. What happens after equilibration depends on :code:`post_equil`:
+
+        - :code:`'update'`: The weights keep being updated with the final Wang-Landau incrementor.
+        - :code:`'frozen'`: The incrementor is set to 0 upon equilibration, so the weights are frozen.
+        - :code:`'fast'`: Same as :code:`'frozen'`, but since the chain with frozen weights is a fixed Markov chain,
+          the remaining steps are generated in blocks by :meth:`_run_frozen`, which is orders of magnitude faster.
+          Steps are still performed one by one if observers implementing :code:`on_step` are attached.
+
+        With an energy table, the proposal probabilities change in every step, so the :code:`'sum_tree'`
+        proposal falls back to the :code:`'direct'` one.
+
+        With the :code:`'numba'` backend (or the :code:`'auto'` backend if Numba is installed), the steps are
+        performed by a compiled kernel in segments (see :meth:`_run_kernel`), which requires the classic schedule,
+        a built-in flatness criterion, no energy table and no observers implementing :code:`on_step`. Otherwise,
+        or with the :code:`'python'` backend, which serves as the reference, the steps are performed below.
+        """
+        energies = self._energies
+        if self._backend == 'numba' and self._kernel_compatible():
+            self._run_kernel(kernels.get_kernel('wl_segment'))
+            return
+        if self.proposal == 'sum_tree' and energies is None:
+            # f_current might have been modified externally (e.g. by EnsembleEXE) since the last run
+            self._sum_tree = SumTree(self.f_current)
+        step_observers = [obs for obs in self.observers if obs.observes('on_step')]
+        per_step_schedule = self._schedule.per_step
+        fast = self.post_equil == 'fast' and not step_observers
         for i in range(self.n_steps):
-            if self.verbose:
-                print(f'Step {i + 1}: ', end='')
-            self.traj.append(self.state)
-            p_current = utils.free2prob(self.f_current)
-            state_new = random.choices(range(self.n_states), weights=p_current, k=1)[0]
-            if self.verbose:
-                print(f'Attempting to move from state {self.state} to state {state_new} ... ', end='')
-            self.update(state_new)
-            self.dg.append(self.g[-1] - self.g[0])
-            if not self.equil:
-                self.check_flatness()
+            if fast and self.equil:
+                self._run_frozen(self.n_steps - i, self.n_steps_done + i)
+                break
+            record = (self.n_steps_done + i) % self.record_stride == 0
+            if record:
+                self._traj.append(self.state)
+            if energies is not None:
+                self._dU = energies.next_row()
+            state = self.state
+            state_new = self.propose()
+            accepted = self.update(state_new)
+            if record:
+                self._dg.append(self._calc_dg())
+            if step_observers:
+                self._notify_step(step_observers, self.n_steps_done + i, state, state_new, accepted)
+            if per_step_schedule and not self.equil:
+                self.wl_delta = self._schedule.on_step(self.n_steps_done + i + 1, self.wl_delta)
+            if not self.equil and self.check_flatness():
+                for obs in self.observers:
+                    obs.on_flatness_reset(self, self.n_steps_done + i, self.wl_delta)
+            if self.wl_delta < self.wl_delta_cutoff and self.equil is False:
+                self._equilibrate(i)
+        self.n_steps_done += self.n_steps
+        self._traj.flush()
+        self._dg.flush()
+        for obs in self.observers:
+            obs.on_run_end(self, self.n_steps_done)
+
+    def _equilibrate(self, i):
+        """
+        Mark the simulator as equilibrated at step :code:`i` of the current run.
+        """
+        self.equil = True
+        self.equil_time = i
+        self.g_equil = np.array(self.g)
+        if self.post_equil != 'update':
+            self.wl_delta = 0
+        for obs in self.observers:
+            obs.on_equilibration(self, self.n_steps_done + i, readonly(self.g_equil))
+
+    def _kernel_compatible(self):
+        """
+        Whether the steps of the simulator can be performed by the compiled kernel.
+        """
+        return (
+            type(self._schedule) is ClassicSchedule
+            and type(self._is_flat) in [RatioCriterion, MinVisitsCriterion]
+            and self._energies is None
+            and not any(obs.observes('on_step') for obs in self.observers)
+        )
+
+    def _run_kernel(self, kernel, block_size=4096):
+        """
+        Perform :code:`n_steps` steps with a step kernel (see :func:`.kernels.wl_segment`) in segments of up to
+        :code:`block_size` steps. A segment stops early when the histogram is flat, in which case the incrementor
+        is updated, the histogram is reset and the observers are notified here, as in :meth:`run`. The random
+        numbers of each segment are drawn at once, and those left unused are returned to the stream, so the
+        kernel consumes the same random numbers as the reference backend. The proposals are always drawn from a
+        sum tree, which is built at the start of the run and kept between segments, so the kernel reproduces
+        the :code:`'sum_tree'` proposal of the reference backend and is statistically equivalent to the
+        :code:`'direct'` one.
+        """
+        ratio = type(self._is_flat) is RatioCriterion
+        criterion = kernels.CRITERION_RATIO if ratio else kernels.CRITERION_MIN_VISITS
+        wl_ratio = self._is_flat.wl_ratio if ratio else 0.0
+        min_visits = 0 if ratio else self._is_flat.min_visits
+        fast = self.post_equil == 'fast'
+        traj = np.empty(block_size, dtype=self.traj_dtype)
+        dg = np.empty(block_size, dtype=self.dg_dtype)
+        sum_tree = SumTree(self.f_current)
+        tree, shift = np.array(sum_tree.tree), sum_tree.shift
+        i = 0
+        while i < self.n_steps:
+            if fast and self.equil:
+                self._run_frozen(self.n_steps - i, self.n_steps_done + i)
+                break
+            # A single step is performed if the incrementor is already below the cutoff, as in run
+            m = 1 if not self.equil and self.wl_delta < self.wl_delta_cutoff else min(self.n_steps - i, block_size)
+            u = self.rng.random_array(2 * m)
+            counts = self._hist.counts.astype(np.int64)
+            n_done, self.state, n_recorded, flat, n_accepted, shift = kernel(
+                self.f_true, self._g_raw, counts, self.state, float(self.wl_delta), u, traj, dg,
+                self.n_steps_done + i, self.record_stride, criterion, wl_ratio, min_visits,
+                not self.equil and self._schedule.uses_flatness, tree, shift)
+            self.rng.push_back(u[2 * n_done:])
+            self._hist.set_counts(counts)
+            self._traj.extend(traj[:n_recorded])
+            self._dg.extend(dg[:n_recorded])
+            if self.stats is not None:
+                self.stats.count('kernel_steps', n_done)
+                self.stats.count('kernel_accepted', n_accepted)
+            i += n_done
+            if flat and self.check_flatness():
+                for obs in self.observers:
+                    obs.on_flatness_reset(self, self.n_steps_done + i - 1, self.wl_delta)
             if self.wl_delta < self.wl_delta_cutoff and self.equil is False:
-                self.equil = True
-                self.equil_time = i
-                self.g_equil = copy.deepcopy(self.g)
-                if self.verbose is True:
-                    print('  The alchemical weights have been equilibrated!')
+                self._equilibrate(i - 1)
+        self.n_steps_done += self.n_steps
+        self._traj.flush()
+        self._dg.flush()
+        for obs in self.observers:
+            obs.on_run_end(self, self.n_steps_done)
+
+    def _run_frozen(self, n_steps, step, block_size=65536):
+        """
+        Perform :code:`n_steps` steps starting from step :code:`step` without updating the weights. The random
+        numbers of each block of steps are drawn at once, the proposals are drawn by a vectorized inverse-CDF
+        lookup, and the acceptance test of each step reduces to a comparison of the current biased free energy
+        with a precomputed threshold, which is the only part done step by step. The same random numbers are
+        used as in :meth:`propose` and :meth:`update`, so the generated trajectory is that of step-by-step
+        sampling with frozen weights up to the rounding of the acceptance test. With an energy table, the
+        biased free energies of each step are those of :meth:`propose` plus the frame of the step.
+        """
+        f_current = self._get_f_current()
+        cdf = np.cumsum(utils.free2prob(f_current))
+        n = self.n_states
+        while n_steps > 0:
+            if self._energies is None:
+                m = min(n_steps, block_size)
+            else:
+                # The biased free energies of all states in each step, with m * n_states entries in total
+                f_biased = f_current + self._energies.next_rows(min(n_steps, max(1, block_size * 16 // n)))
+                m = len(f_biased)
+            u = self.rng.random_array(2 * m)
+            if self._energies is None:
+                proposed = np.minimum(np.searchsorted(cdf, u[0::2] * cdf[-1], side='right'), n - 1)
+                f_proposed = f_current[proposed]
+            else:
+                p = np.exp(-(f_biased - f_biased.min(axis=1, keepdims=True)))
+                cdfs = np.cumsum(p / p.sum(axis=1, keepdims=True), axis=1)
+                proposed = np.minimum((cdfs <= (u[0::2] * cdfs[:, -1])[:, None]).sum(axis=1), n - 1)
+                f_proposed = f_biased[np.arange(m), proposed]
+            # rand < exp(-(f_new - f_old)) <=> f_old > f_new + log(rand), which always holds if f_new <= f_old
+            with np.errstate(divide='ignore'):
+                thresholds = (f_proposed + np.log(u[1::2])).tolist()
+
+            accepted = []
+            if self._energies is None:
+                f_proposed = f_proposed.tolist()
+                f_state = f_current[self.state]
+                for k, threshold in enumerate(thresholds):
+                    if f_state > threshold:
+                        f_state = f_proposed[k]
+                        accepted.append(k)
+            else:
+                f_flat = f_biased.ravel().tolist()
+                proposed_list = proposed.tolist()
+                state = self.state
+                for k, threshold in enumerate(thresholds):
+                    if f_flat[k * n + state] > threshold:
+                        state = proposed_list[k]
+                        accepted.append(k)
+
+            # The state after step k is the last proposal accepted up to step k
+            last = np.full(m, -1)
+            last[accepted] = accepted
+            last = np.maximum.accumulate(last)
+            states = np.where(last >= 0, proposed[np.maximum(last, 0)], self.state)
+
+            starts = np.concatenate([[self.state], states[:-1]])  # the states at the beginning of the steps
+            recorded = starts[(-step) % self.record_stride::self.record_stride]
+            self._traj.extend(recorded)
+            self._dg.extend(np.full(len(recorded), self._calc_dg()))
+            self._hist.set_counts(self._hist.counts + np.bincount(states, minlength=n))
+            self.state = int(states[-1])
+            n_steps -= m
+            step += m
+
+    def _notify_step(self, observers, step, state, proposed, accepted):
+        """
+        Call the :code:`on_step` hook of the observers whose stride divides :code:`step`.
+        """
+        for obs in observers:
+            if step % obs.stride == 0:
+                obs.on_step(self, step, state, proposed, accepted, self.g, self.hist)
+
+    def dump_stats(self, fname=None):
+        """
+        Return the profiling statistics of the simulator as a JSON string, which is also
+        written to :code:`fname` if specified. Profiling must be enabled by the parameter :code:`profile`.
+        """
+        if self.stats is None:
+            raise ParameterError("Profiling is not enabled. Set the parameter 'profile' to True.")
+        return self.stats.dump(fname)
+
+    def _get_checkpoint_state(self, prefix=''):
+        """
+        Return the metadata and arrays that fully describe the current state of the simulator,
+        with the array names prefixed by :code:`prefix`.
+        """
+        bit_generator_state, rng_block = self.rng.get_state()
+        traj, dg = self._traj.get_state(), self._dg.get_state()
+        params = {arg: getattr(self, arg) for arg in self.required_args + list(self.optional_args) if arg != 'observers'}  # noqa: E501
+        for arg in ['flatness_criterion', 'wl_schedule']:
+            if callable(params[arg]):
+                params[arg] = None  # callables are not stored and must be passed to load_checkpoint
+        if params['energy_table'] is not None and not isinstance(params['energy_table'], str):
+            params['energy_table'] = None  # arrays are not stored and must be passed to load_checkpoint
+        meta = {
+            'params': params,
+            'state': self.state,
+            'wl_delta': self.wl_delta,
+            'equil': self.equil,
+            'equil_time': self.equil_time,
+            'n_steps_done': self.n_steps_done,
+            'schedule': self._schedule.get_state(),
+            'energy_pos': None if self._energies is None else self._energies.pos,
+            'rng': bit_generator_state,
+            'traj': None if isinstance(traj, np.ndarray) else traj,
+            'dg': None if isinstance(dg, np.ndarray) else dg,
+        }
+        arrays = {
+            'f_true': self.f_true,
+            'g_raw': self._g_raw,
+            'hist': self.hist,
+            'rng_block': rng_block,
+        }
+        if self.g_equil is not None:
+            arrays['g_equil'] = self.g_equil
+        if meta['traj'] is None:
+            arrays['traj'], arrays['dg'] = traj, dg
+        arrays = {f'{prefix}{key}': value for key, value in arrays.items()}
+
+        return meta, arrays
+
+    def _set_checkpoint_state(self, meta, arrays, prefix=''):
+        """
+        Restore the state returned by :meth:`_get_checkpoint_state`.
+        """
+        for attr in ['state', 'wl_delta', 'equil', 'equil_time', 'n_steps_done']:
+            setattr(self, attr, meta[attr])
+        if f'{prefix}g_raw' in arrays:
+            self.g = arrays[f'{prefix}g_raw']
+        else:
+            self.f_current = arrays[f'{prefix}f_current']  # written before g_raw was stored
+        self.hist = np.array(arrays[f'{prefix}hist'])
+        self.g_equil = np.array(arrays[f'{prefix}g_equil']) if f'{prefix}g_equil' in arrays else None
+        self._schedule.set_state(meta.get('schedule'))
+        if self._energies is not None and meta.get('energy_pos') is not None:
+            self._energies.seek(meta['energy_pos'])
+        self.rng.set_state(meta['rng'], arrays[f'{prefix}rng_block'])
+        self._traj.set_state(arrays[f'{prefix}traj'] if meta['traj'] is None else meta['traj'])
+        self._dg.set_state(arrays[f'{prefix}dg'] if meta['dg'] is None else meta['dg'])
+
+    def save_checkpoint(self, fname):
+        """
+        Save the current state of the simulator, including its random number generator
+        and recorded trajectories, to a compressed checkpoint file.
+
+        Parameters
+        ----------
+        fname : str
+            The path of the checkpoint file.
+        """
+        meta, arrays = self._get_checkpoint_state()
+        checkpoint.write_checkpoint(fname, type(self).__name__, meta, arrays)
+
+    @classmethod
+    def load_checkpoint(cls, fname, **params):
+        """
+        Create a simulator from a checkpoint file written by :meth:`save_checkpoint`.
+
+        Parameters
+        ----------
+        fname : str
+            The path of the checkpoint file.
+        **params
+            Parameters overriding those stored in the checkpoint, e.g. :code:`observers`, a callable
+            :code:`flatness_criterion` or :code:`wl_schedule`, or an :code:`energy_table` given as an array,
+            which are not stored.
+
+        Returns
+        -------
+        sim : WL_Simulator
+            The restored simulator, whose subsequent runs continue deterministically.
+        """
+        meta, arrays = checkpoint.read_checkpoint(fname, cls.__name__)
+        sim = cls(dict(meta['params'], **params), arrays['f_true'])
+        sim._set_checkpoint_state(meta, arrays)
+        return sim
 
     def plot_hist(self, fname=None):
         """
         Plot the histogram counts of all states.
         """
-        bin_centers = np.arange(self.n_states)
-        bin_width = bin_centers[1] - bin_centers[0]
-        plt.bar(bin_centers, self.hist, width=bin_width, align='center', alpha=0.5, edgecolor='black')
-        plt.xlabel('State index')
-        plt.ylabel('Count')
-        plt.grid()
-        ax = plt.gca()
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
-        if fname is not None:
-            plt.savefig(fname, dpi=600)
+        from sampling_simulator import plotting  # matplotlib is only imported when plotting
+        plotting.plot_hist(self.hist, fname)
 
     @staticmethod
-    def plot_timeseries(var, label, fname=None):
-        t = np.arange(len(var))
-        if len(var) > 10000:
-            plt.plot(t[::100], var[::100])
+    def plot_timeseries(var, label, fname=None, stride=1, n_buckets=2000):
+        """
+        Plot a timeseries recorded every :code:`stride` steps. Long timeseries are decimated to the minimum
+        and maximum of each of :code:`n_buckets` buckets, which preserves spikes, and are read chunk by chunk,
+        so memory-mapped inputs are never fully loaded into memory.
+        """
+        from sampling_simulator import plotting
+        plotting.plot_timeseries(var, label, fname, stride, n_buckets)
+
+
+class BatchWLSimulator(WL_Simulator):
+    """
+    A vectorized version of :class:`WL_Simulator` that advances :code:`n_walkers` independent
+    Wang-Landau walkers sharing the same :code:`f_true` as a single set of NumPy arrays. The state,
+    weights, biased free energies and histograms are stored as arrays of shape :code:`(n_walkers,)`
+    or :code:`(n_walkers, n_states)`, and walkers whose Wang-Landau incrementor has dropped below
+    :code:`wl_delta_cutoff` are frozen and excluded from further updates.
+
+    The batched state is not supported by observers, streamed trajectories (:code:`record_path`) or
+    checkpoints, which are rejected, and :code:`verbose` only prints the number of equilibrated walkers
+    at the end of each run. The proposals are always direct, equilibrated walkers are always frozen and
+    the steps are always performed by NumPy, so the parameters :code:`proposal`, :code:`post_equil` and
+    :code:`backend` are rejected unless they have their default values. For many walkers and tens of
+    states, the batched run is more than an order of magnitude faster than independent :class:`WL_Simulator`
+    runs. The gain shrinks as the number of states grows, since each batched step takes O(n_states) time
+    per walker (see the :code:`batch_run` cases of :mod:`sampling_simulator.benchmark`).
+    """
+    _profiled_methods = {
+        'run': ('run', None),
+        'propose': ('propose', None),
+        'update': ('update', None),
+        'calc_prob_acc': ('calc_prob_acc', None),
+        'check_flatness': ('check_flatness', None),
+    }
+
+    def __init__(self, params_dict, f_true):
+        super().__init__(params_dict, f_true)
+        self.required_args.append('n_walkers')
+        self.check_params_dict()
+        if self.flatness_criterion not in ['ratio', 'min_visits']:
+            raise ParameterError("BatchWLSimulator only supports the flatness criteria 'ratio' and 'min_visits'.")
+        if self.wl_schedule != 'classic':
+            raise ParameterError("BatchWLSimulator only supports the 'classic' schedule.")
+        if self.energy_table is not None:
+            raise ParameterError('BatchWLSimulator does not support energy tables.')
+        for arg in ['observers', 'record_path', 'checkpoint_file', 'checkpoint_every']:
+            if params_dict.get(arg) is not None:
+                raise ParameterError(f"BatchWLSimulator does not support the parameter '{arg}'.")
+        for arg, value in [('proposal', 'direct'), ('post_equil', 'update'), ('backend', 'python')]:
+            if getattr(self, arg) != value:
+                raise ParameterError(f"BatchWLSimulator only supports the value '{value}' of the parameter '{arg}', not '{getattr(self, arg)}'.")  # noqa: E501
+        self.observers = []  # no ConsoleLogger, which is never notified by the batched run
+
+        self.f_true = np.array(f_true, dtype=float)
+        self.hist = np.zeros((self.n_walkers, self.n_states))
+        self._g_raw = np.zeros((self.n_walkers, self.n_states))
+        self.state = np.zeros(self.n_walkers, dtype=int)
+        self.wl_delta = np.full(self.n_walkers, self.wl_delta, dtype=float)
+        self.equil = np.zeros(self.n_walkers, dtype=bool)
+        self.equil_time = np.full(self.n_walkers, -1)  # -1 for walkers that have not been equilibrated
+        self.g_equil = np.full((self.n_walkers, self.n_states), np.nan)
+        self._traj = np.zeros((self.n_walkers, 0), dtype=self.traj_dtype)
+        self._dg = np.zeros((self.n_walkers, 0), dtype=self.dg_dtype)
+
+    def save_checkpoint(self, fname):
+        raise ParameterError('BatchWLSimulator does not support checkpoints.')
+
+    @classmethod
+    def load_checkpoint(cls, fname, **params):
+        raise ParameterError('BatchWLSimulator does not support checkpoints.')
+
+    @property
+    def traj(self):
+        """
+        The recorded state-space trajectories of all walkers, with shape :code:`(n_walkers, n_frames)`.
+        """
+        return self._traj
+
+    @property
+    def dg(self):
+        """
+        The recorded weight differences between the first and last states of all walkers.
+        """
+        return self._dg
+
+    @property
+    def hist(self):
+        """
+        The histograms of all walkers, with shape :code:`(n_walkers, n_states)`.
+        """
+        return self._hist
+
+    @hist.setter
+    def hist(self, hist):
+        self._hist = hist
+
+    def check_flatness(self, idx):
+        """
+        Check if the histograms of the walkers specified by :code:`idx` are flat enough
+        and scale down the Wang-Landau incrementors of the walkers whose histograms are flat.
+        """
+        hist = self.hist[idx]
+        if self.flatness_criterion == 'min_visits':
+            flat_bool = hist.min(axis=1) >= self.wl_min_visits
         else:
-            plt.plot(t, var)
-        plt.xlabel('Step')
-        plt.ylabel(label)
-        plt.grid()
-        if fname is not None:
-            plt.savefig(fname, dpi=600)
+            # Equivalent to the element-wise criteria used in WL_Simulator.check_flatness
+            hist_mean = hist.mean(axis=1)
+            flat_bool = (hist.min(axis=1) / hist_mean > self.wl_ratio) & (hist_mean / hist.max(axis=1) > self.wl_ratio)  # noqa: E501
+        flat_idx = idx[flat_bool]
+        self.wl_delta[flat_idx] *= self.wl_scale
+        self.hist[flat_idx] = 0
+
+    def calc_prob_acc(self, idx, state_new):
+        """
+        Calculate the acceptance probabilities of the moves proposed for the walkers specified by :code:`idx`.
+        """
+        state = self.state[idx]
+        delta = (self.f_true[state_new] - self._g_raw[idx, state_new]) - (self.f_true[state] - self._g_raw[idx, state])
+        p_acc = np.exp(-np.maximum(delta, 0))
+        return p_acc
+
+    def propose(self, idx):
+        """
+        Draw a new state for each of the walkers specified by :code:`idx` from the probabilities
+        given by their current biased free energies, using inverse transform sampling.
+        """
+        f = self.f_true - self._g_raw[idx]
+        cdf = np.cumsum(np.exp(-(f - f.min(axis=1, keepdims=True))), axis=1)
+        rand = self.rng.generator.random(len(idx)) * cdf[:, -1]
+        state_new = np.minimum((cdf <= rand[:, None]).sum(axis=1), self.n_states - 1)
+        return state_new
+
+    def update(self, idx, state_new):
+        """
+        For the proposed states of the walkers specified by :code:`idx`, calculates the acceptance
+        probabilities, draws random numbers to decide whether the proposed moves should be accepted,
+        and lastly, updates the histograms and weights.
+        """
+        p_acc = self.calc_prob_acc(idx, state_new)
+        accepted = self.rng.generator.random(len(idx)) < p_acc
+        state = np.where(accepted, state_new, self.state[idx])
+        delta = self.wl_delta[idx]
+        self.state[idx] = state
+        self._g_raw[idx, state] -= delta
+        self.hist[idx, state] += 1
+
+    def run(self):
+        n_frames = -(-self.n_steps // self.record_stride)
+        traj = np.zeros((n_frames, self.n_walkers), dtype=self.traj_dtype)
+        dg = np.zeros((n_frames, self.n_walkers), dtype=self.dg_dtype)
+        n_done = 0
+        for i in range(self.n_steps):
+            idx = np.flatnonzero(~self.equil)
+            if len(idx) == 0:
+                break
+            record = i % self.record_stride == 0
+            if record:
+                traj[i // self.record_stride] = self.state
+            self.update(idx, self.propose(idx))
+            if record:
+                dg[i // self.record_stride] = self._calc_dg()
+            self.check_flatness(idx)
+            equil_idx = idx[self.wl_delta[idx] < self.wl_delta_cutoff]
+            self.equil[equil_idx] = True
+            self.equil_time[equil_idx] = i
+            if len(equil_idx) > 0:
+                self.g_equil[equil_idx] = self.g[equil_idx]
+            n_done = i + 1
+
+        n_frames = -(-n_done // self.record_stride)
+        self._traj = np.concatenate([self._traj, traj[:n_frames].T], axis=1)
+        self._dg = np.concatenate([self._dg, dg[:n_frames].T], axis=1)
+        if self.verbose:
+            print(f'{self.equil.sum()} out of {self.n_walkers} walkers have been equilibrated.')